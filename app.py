@@ -1,11 +1,33 @@
+import time
+_import_started = time.monotonic()
 from h2o_wave import main, app, Q, ui
+import asyncio
+import random
 import uuid
 import os
 import tempfile
-from h2ogpte import H2OGPTE
+import shutil
 import logging
-from fpdf import FPDF
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from jobs import AnalysisScheduler, QueueFullError
+from gpte_client import GPTeClientPool, upload_file
+from doc_cache import DocumentCache, file_digest, submission_key
+from extract import documents_prompt, extract_documents
+from preprocess import prepare_uploads
+from lab_values import build_lab_table, lab_facts, lab_sections
+from map_reduce import (MERGE_QUERY_ARGS, DocumentPart, collection_parts, delta_prompt, format_notes, map_documents,
+                        merge_prompt,
+                        should_map_reduce)
+from report_pdf import get_renderer, render_pdf_report
+from report_sections import changed_sections, merge_sections
+from resilience import CircuitBreaker, GPTeBusy, GPTeGuard, GPTeUnavailable, is_transient, parse_limits
+from resources import CollectionReaper, ResourceRegistry, delete_resources
+from spool import SpoolQuotaError, UploadSpool
+from store import open_store
+import metrics
+from metrics import file_tags, observe_submission, span
 
 # Silence everything except your own logger
 for noisy_logger in ['h2ogpte', 'urllib3', 'h2o', 'werkzeug', 'asyncio']:
@@ -22,53 +44,141 @@ logger.setLevel(logging.DEBUG)
 GPTE_ENDPOINT = "https://h2ogpte.internal.dedicated.h2o.ai"
 KEY = "--"  
 
-def analyze_uploaded_documents(file_paths):
-    """Analyze multiple uploaded documents and return a structured report"""
-    try:
-        # Validate file paths
-        valid_file_paths = []
-        for file_path in file_paths:
-            if not os.path.exists(file_path):
-                logger.error(f"File not found at path: {file_path}")
-                continue
-                
-            file_size = os.path.getsize(file_path)
-            if file_size == 0:
-                logger.error(f"File is empty: {file_path}")
-                continue
-                
-            valid_file_paths.append(file_path)
-        
-        if not valid_file_paths:
-            return "Error: No valid files were found. Please try uploading again."
-        
-        # Use unverified connection
-        client = H2OGPTE(address=GPTE_ENDPOINT, api_key=KEY, verify=False)
-        collection_id = client.create_collection(
-            name=f'med_analysis_{uuid.uuid4()}',
-            description='Medical document analysis'
-        )
-        
-        upload_ids = []
-        
-        # Process each valid file
-        for file_path in valid_file_paths:
-            with open(file_path, 'rb') as f:
-                file_name = os.path.basename(file_path)
-                upload_id = client.upload(file_name, f)
-                upload_ids.append(upload_id)
-                logger.info(f"Uploaded file: {file_name}")
-        
-        if not upload_ids:
-            return "Error: Failed to upload documents to the analysis engine."
-        
-        # Ingest all uploads
-        client.ingest_uploads(collection_id, upload_ids)
-        chat_session_id = client.create_chat_session(collection_id)
-        
-        with client.connect(chat_session_id) as session:
-            reply = session.query(
-                """Please analyze the uploaded medical document(s) and return a structured explanation using the format below.
+# Analysis job scheduling - blocking GPTe work runs on a bounded pool off the event loop
+MAX_CONCURRENT_ANALYSES = int(os.environ.get('MED_ASSIST_MAX_CONCURRENT_ANALYSES', '4'))
+MAX_QUEUED_ANALYSES = int(os.environ.get('MED_ASSIST_MAX_QUEUED_ANALYSES', '50'))
+JOB_POLL_INTERVAL = 0.5  # seconds between progress refreshes in the UI
+
+# Per-submission cap on parallel file transfers (Wave -> spool and spool -> GPTe)
+UPLOAD_PARALLELISM = int(os.environ.get('MED_ASSIST_UPLOAD_PARALLELISM', '4'))
+
+# Stream the report into the UI as tokens arrive
+STREAM_ANALYSIS = os.environ.get('MED_ASSIST_STREAM_ANALYSIS', '1') == '1'
+
+# Regenerate re-asks the existing chat session with some sampling variation
+REGENERATE_TEMPERATURE = float(os.environ.get('MED_ASSIST_REGENERATE_TEMPERATURE', '0.7'))
+
+# TXT and text-layer PDFs are read locally and sent with the prompt, skipping upload and ingest
+LOCAL_EXTRACTION = os.environ.get('MED_ASSIST_LOCAL_EXTRACTION', '1') == '1'
+LOCAL_EXTRACTION_MAX_CHARS = int(os.environ.get('MED_ASSIST_LOCAL_EXTRACTION_MAX_CHARS', '100000'))
+LOCAL_EXTRACTION_MIN_PAGE_CHARS = int(os.environ.get('MED_ASSIST_LOCAL_EXTRACTION_MIN_PAGE_CHARS', '200'))
+
+# Images are shrunk to an OCR-sufficient grayscale copy and duplicate pages dropped before upload
+PREPROCESS_UPLOADS = os.environ.get('MED_ASSIST_PREPROCESS_UPLOADS', '1') == '1'
+IMAGE_MAX_EDGE = int(os.environ.get('MED_ASSIST_IMAGE_MAX_EDGE', '2400'))  # px, about 200 dpi for a letter page
+IMAGE_JPEG_QUALITY = int(os.environ.get('MED_ASSIST_IMAGE_JPEG_QUALITY', '80'))
+DUPLICATE_MAX_DISTANCE = int(os.environ.get('MED_ASSIST_DUPLICATE_MAX_DISTANCE', '16'))  # bits of a 256-bit dHash
+
+# Large submissions are read per document in parallel, then merged into one report
+MAP_REDUCE_MIN_DOCUMENTS = int(os.environ.get('MED_ASSIST_MAP_REDUCE_MIN_DOCUMENTS', '4'))
+MAP_REDUCE_MIN_PAGES = int(os.environ.get('MED_ASSIST_MAP_REDUCE_MIN_PAGES', '30'))
+MAP_REDUCE_PARALLELISM = int(os.environ.get('MED_ASSIST_MAP_REDUCE_PARALLELISM', '4'))
+
+scheduler = AnalysisScheduler(max_workers=MAX_CONCURRENT_ANALYSES, max_queue=MAX_QUEUED_ANALYSES)
+
+# GPTe calls in flight and per second, per stage (stage=max_in_flight:rate), plus retries and the circuit breaker.
+# The defaults are what this worker issues at full load, so they only bite when set lower to share a backend.
+_MAP_CALLS = MAX_CONCURRENT_ANALYSES * MAP_REDUCE_PARALLELISM
+_UPLOAD_CALLS = MAX_CONCURRENT_ANALYSES * UPLOAD_PARALLELISM
+gpte_guard = GPTeGuard(
+    parse_limits(os.environ.get(
+        'MED_ASSIST_GPTE_LIMITS',
+        f'collection={_MAP_CALLS}:{2 * _MAP_CALLS},upload={_UPLOAD_CALLS}:{2 * _UPLOAD_CALLS},'
+        f'ingest={MAX_CONCURRENT_ANALYSES}:{MAX_CONCURRENT_ANALYSES},query={_MAP_CALLS}:{2 * _MAP_CALLS}')),
+    CircuitBreaker(
+        failure_threshold=int(os.environ.get('MED_ASSIST_GPTE_BREAKER_THRESHOLD', '5')),
+        reset_timeout=float(os.environ.get('MED_ASSIST_GPTE_BREAKER_RESET', '30')),
+    ),
+    attempts=int(os.environ.get('MED_ASSIST_GPTE_RETRY_ATTEMPTS', '3')),
+)
+# How long a job keeps waiting for GPTe to come back before giving up
+OUTAGE_MAX_WAIT = float(os.environ.get('MED_ASSIST_GPTE_OUTAGE_MAX_WAIT', '300'))
+
+# One authenticated client per concurrent job, reused across analyses
+GPTE_POOL_SIZE = int(os.environ.get('MED_ASSIST_GPTE_POOL_SIZE', str(MAX_CONCURRENT_ANALYSES)))
+gpte_pool = GPTeClientPool(GPTE_ENDPOINT, KEY, size=GPTE_POOL_SIZE, verify=False, guard=gpte_guard)
+
+# Ingested collections keyed by the SHA-256 of the uploaded file set
+document_cache = DocumentCache(
+    max_entries=int(os.environ.get('MED_ASSIST_CACHE_MAX_ENTRIES', '200')),
+    max_bytes=int(os.environ.get('MED_ASSIST_CACHE_MAX_BYTES', str(2 * 1024 ** 3))),
+    ttl=float(os.environ.get('MED_ASSIST_CACHE_TTL', str(24 * 3600))),
+)
+
+# Uploaded files are spooled per client under this directory
+upload_spool = UploadSpool(
+    os.environ.get('MED_ASSIST_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'med_assist_spool')),
+    max_client_bytes=int(os.environ.get('MED_ASSIST_SPOOL_MAX_CLIENT_BYTES', str(200 * 1024 ** 2))),
+    max_client_files=int(os.environ.get('MED_ASSIST_SPOOL_MAX_CLIENT_FILES', '50')),
+    max_total_bytes=int(os.environ.get('MED_ASSIST_SPOOL_MAX_TOTAL_BYTES', str(5 * 1024 ** 3))),
+)
+
+# Who created which GPTe collections/chat sessions, and the reaper that cleans up after them
+resource_registry = ResourceRegistry()
+reaper = CollectionReaper(
+    gpte_pool,
+    resource_registry,
+    document_cache,
+    interval=float(os.environ.get('MED_ASSIST_REAPER_INTERVAL', '600')),
+    max_age=float(os.environ.get('MED_ASSIST_REAPER_MAX_AGE', str(7 * 24 * 3600))),
+    session_timeout=float(os.environ.get('MED_ASSIST_SESSION_TIMEOUT', '3600')),
+    batch_size=int(os.environ.get('MED_ASSIST_REAPER_BATCH_SIZE', '20')),
+    on_release=lambda owner: expire_session(owner),  # Defined with the other cleanup helpers below
+)
+# Clients the reaper released while idle; their next request learns the session expired
+_expired_owners = set()
+_expired_lock = threading.Lock()
+SESSION_EXPIRED = 'This session expired and its documents were removed. Please upload the documents again.'
+# Deletes for analyses a client replaced, off the request path; they can wait for a GPTe client behind jobs
+cleanup_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cleanup')
+
+# Analyses, edited drafts and GPTe resource ids, shared by every worker pointed at the same store
+analysis_store = open_store(os.environ.get('MED_ASSIST_STORE',
+                                           os.path.join(os.path.expanduser('~'), '.med_assist', 'store.db')))
+# Past reports listed for a patient ID
+PAST_REPORTS_LIMIT = int(os.environ.get('MED_ASSIST_PAST_REPORTS_LIMIT', '10'))
+# Answer a resubmission of exactly the same files with the report already on record
+REUSE_PAST_REPORTS = os.environ.get('MED_ASSIST_REUSE_PAST_REPORTS', '1') == '1'
+
+# PDF preview beside the editable report, re-rendered once edits pause for PREVIEW_DEBOUNCE seconds
+LIVE_PREVIEW = os.environ.get('MED_ASSIST_LIVE_PREVIEW', '1') == '1'
+PREVIEW_DEBOUNCE = float(os.environ.get('MED_ASSIST_PREVIEW_DEBOUNCE', '0.8'))
+
+# Prometheus-style /metrics endpoint; 0 disables it
+METRICS_PORT = int(os.environ.get('MED_ASSIST_METRICS_PORT', '9100'))
+metrics.registry.gauge('med_assist_jobs_in_flight', 'Analysis jobs currently running',
+                       lambda: scheduler.stats()['running'])
+metrics.registry.gauge('med_assist_queue_depth', 'Analysis jobs waiting for a worker',
+                       lambda: scheduler.stats()['queued'])
+metrics.registry.gauge('med_assist_jobs_total', 'Finished analysis jobs by outcome',
+                       lambda: {(('status', 'done'),): scheduler.stats()['completed'],
+                                (('status', 'failed'),): scheduler.stats()['failed']}, kind='counter')
+metrics.registry.gauge('med_assist_spool_bytes', 'Bytes of uploads held in the spool',
+                       lambda: upload_spool.usage()['bytes'])
+metrics.registry.gauge('med_assist_spool_files', 'Uploaded files held in the spool',
+                       lambda: upload_spool.usage()['files'])
+metrics.registry.gauge('med_assist_document_cache_entries', 'Ingested collections in the document cache',
+                       lambda: document_cache.stats()['entries'])
+metrics.registry.gauge('med_assist_document_cache_lookups_total', 'Document cache lookups by result',
+                       lambda: {(('result', 'hit'),): document_cache.stats()['hits'],
+                                (('result', 'miss'),): document_cache.stats()['misses']}, kind='counter')
+metrics.registry.gauge('med_assist_pdf_section_cache_lookups_total', 'Report sections looked up in the PDF flowable cache',
+                       lambda: {(('result', 'hit'),): get_renderer().hits,
+                                (('result', 'miss'),): get_renderer().misses}, kind='counter')
+metrics.registry.gauge('med_assist_gpte_clients_created_total', 'GPTe clients authenticated by the pool',
+                       lambda: gpte_pool.created, kind='counter')
+metrics.registry.gauge('med_assist_gpte_circuit_open', 'Whether GPTe calls are failing fast (1 open, 0.5 half-open)',
+                       lambda: {'closed': 0, 'half_open': 0.5, 'open': 1}[gpte_guard.breaker.state])
+metrics.registry.gauge('med_assist_gpte_calls_in_flight', 'GPTe calls currently running, by stage',
+                       lambda: {(('stage', stage),): count for stage, count in gpte_guard.in_flight().items()})
+
+# Cold start: clients authenticated in the background at startup, and how long each phase took
+WARM_UP_CLIENTS = int(os.environ.get('MED_ASSIST_WARM_UP_CLIENTS', '1'))
+startup_times = {}
+metrics.registry.gauge('med_assist_startup_seconds', 'Time spent starting the app, by phase',
+                       lambda: {(('phase', phase),): seconds for phase, seconds in startup_times.items()})
+
+ANALYSIS_PROMPT = """Please analyze the uploaded medical document(s) and return a structured explanation using the format below.
 
             The input may contain **one or more documents**. If there are multiple, please **collate the findings** and present a unified report by intelligently merging related sections.
 
@@ -111,144 +221,1030 @@ def analyze_uploaded_documents(file_paths):
             - Use simple, everyday language throughout.
             - When using medical terms, explain them clearly and contextually.
             - makesure to enclose the headings in ## Heading ## format - strictly follow the format.
-            """)
+            """
+
+def ingest_documents(client, file_paths, progress):
+    """Upload files into a fresh collection and ingest them; returns (collection_id, upload_ids)"""
+    with span('create_collection'):
+        collection_id = client.create_collection(
+            name=f'med_analysis_{uuid.uuid4()}',
+            description='Medical document analysis'
+        )
+
+    try:
+        upload_ids = upload_and_ingest(client, collection_id, file_paths, progress)
+    except Exception:
+        # Don't leave a half-built collection behind
+        try:
+            client.delete_collections([collection_id])
+        except Exception as e:
+            logger.error(f"Failed to delete collection {collection_id}: {str(e)}")
+        raise
+    return collection_id, upload_ids
+
+
+def upload_and_ingest(client, collection_id, file_paths, progress):
+    """Upload files in parallel and ingest them into a collection; returns the upload ids"""
+    tags = file_tags(file_paths)
+    uploaded = []
+
+    def upload(file_path):
+        file_name = os.path.basename(file_path)
+        with span('gpte_upload_file', **file_tags([file_path])):
+            upload_id = upload_file(client, file_path, file_name)
+        uploaded.append(file_name)
+        progress(f'Uploaded {len(uploaded)} of {len(file_paths)} files', 0.1 + 0.2 * len(uploaded) / len(file_paths))
+        logger.info(f"Uploaded file: {file_name}")
+        return upload_id
+
+    # Upload the files in parallel, each streamed from disk
+    progress('Uploading documents', 0.1)
+    with span('gpte_upload', **tags), \
+            ThreadPoolExecutor(max_workers=min(UPLOAD_PARALLELISM, len(file_paths)), thread_name_prefix='upload') as pool:
+        upload_ids = list(pool.map(upload, file_paths))
+
+    if not upload_ids:
+        raise RuntimeError("Failed to upload documents to the analysis engine.")
+
+    # Ingest all uploads
+    progress('Reading documents', 0.3)
+    with span('ingest', **tags):
+        client.ingest_uploads(collection_id, upload_ids)
+    return upload_ids
+
+
+def hash_files(file_paths):
+    with span('hash', **file_tags(file_paths)):
+        return [file_digest(p) for p in file_paths]
+
+
+def prepare_files(file_paths, work_dir, digests, progress):
+    """Shrunk, deduplicated copies of the files to upload, written under ``work_dir``"""
+    if not PREPROCESS_UPLOADS:
+        return file_paths
+    progress('Preparing documents', 0.08)
+    with span('preprocess', **file_tags(file_paths)) as tags:
+        upload_paths = prepare_uploads(
+            file_paths, work_dir, digests,
+            max_edge=IMAGE_MAX_EDGE,
+            jpeg_quality=IMAGE_JPEG_QUALITY,
+            max_distance=DUPLICATE_MAX_DISTANCE,
+            parallelism=UPLOAD_PARALLELISM,
+        )
+        tags.update(files_out=len(upload_paths), bytes_out=sum(os.path.getsize(p) for p in upload_paths))
+    return upload_paths
+
+
+def get_or_ingest_collection(client, file_paths, progress, digests=None):
+    """Return a collection holding these files, reusing a cached one when the same bytes were seen before"""
+    digests = digests or hash_files(file_paths)
+    key = submission_key(digests)
+
+    entry = document_cache.get(key)
+    if entry is not None:
+        try:
+            client.get_collection(entry.collection_id)
+            logger.info(f"Reusing cached collection {entry.collection_id}")
+            progress('Reusing previously read documents', 0.5)
+            return entry.collection_id
+        except Exception as e:
+            logger.info(f"Cached collection {entry.collection_id} is gone: {str(e)}")
+            document_cache.invalidate(key)
+
+    work_dir = tempfile.mkdtemp(prefix='med_prepare_')
+    try:
+        upload_paths = prepare_files(file_paths, work_dir, digests, progress)
+        collection_id, upload_ids = ingest_documents(client, upload_paths, progress)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    entry = document_cache.put(key, collection_id, upload_ids, digests, sum(os.path.getsize(p) for p in file_paths))
+
+    # Drop collections the cache no longer tracks, and ours if another job cached the same files first
+    evicted = document_cache.pop_evicted()
+    if entry.collection_id != collection_id:
+        logger.info(f"Using collection {entry.collection_id} cached meanwhile instead of {collection_id}")
+        evicted.append(collection_id)
+        collection_id = entry.collection_id
+    if evicted:
+        try:
+            client.delete_collections(evicted)
+        except Exception as e:
+            logger.error(f"Failed to delete evicted collections {evicted}: {str(e)}")
+    return collection_id
+
+
+def add_to_collection(client, collection_id, file_paths, progress, digests):
+    """Ingest more files into an existing collection, or a new one when there is none.
+
+    Returns (collection_id, upload_ids, parts) with a DocumentPart for each document the files added.
+    """
+    if collection_id is None:
+        collection_id = get_or_ingest_collection(client, file_paths, progress, digests)
+        return collection_id, [], collection_parts(client, collection_id)
+
+    known = {part.document_id for part in collection_parts(client, collection_id)}
+    work_dir = tempfile.mkdtemp(prefix='med_prepare_')
+    try:
+        upload_paths = prepare_files(file_paths, work_dir, digests, progress)
+        upload_ids = upload_and_ingest(client, collection_id, upload_paths, progress)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    parts = [part for part in collection_parts(client, collection_id) if part.document_id not in known]
+    return collection_id, upload_ids, parts
+
+
+def extract_local_text(file_paths):
+    """Text of the files if all of them can be read here without OCR, else None (use the ingest path)"""
+    if not LOCAL_EXTRACTION:
+        return None
+    with span('local_extract', **file_tags(file_paths)) as tags:
+        documents = extract_documents(file_paths, max_chars=LOCAL_EXTRACTION_MAX_CHARS,
+                                      min_chars_per_page=LOCAL_EXTRACTION_MIN_PAGE_CHARS)
+        tags['local'] = documents is not None
+    return documents
+
+
+def check_lab_values(documents, progress):
+    """Flag lab values in locally extracted text against reference ranges, showing them right away"""
+    with span('lab_values') as tags:
+        table = build_lab_table(documents)
+        tags['rows'] = len(table)
+    if len(table):
+        progress('Checking lab values', 0.05, partial=lab_sections(table))
+    return table
+
+
+def fallback_report(table, error):
+    """Report built from the local lab checks alone, for when the analysis engine fails"""
+    return (f"## Overview ##\nThe AI summary could not be generated ({error}). The lab values below were checked "
+            f"automatically against reference ranges. Please review them and try Regenerate Analysis.\n"
+            f"{lab_sections(table)}")
+
+
+def query_report(session, progress, resources=None, message=ANALYSIS_PROMPT, **query_args):
+    """Ask a chat session for the report, streaming partial output through ``progress``"""
+    if not STREAM_ANALYSIS:
+        return session.query(message, **query_args).content
+    from h2ogpte.types import PartialChatMessage  # Already loaded by the client that opened the session
+
+    start = time.monotonic()
+    chunks = []
 
-        return reply.content
+    def on_message(message):
+        if not isinstance(message, PartialChatMessage) or not message.content:
+            return  # Keep-alives and empty deltas aren't a first token
+        if not chunks:
+            ttft = time.monotonic() - start
+            logger.info(f"Time to first token: {ttft:.2f}s")
+            metrics.TIME_TO_FIRST_TOKEN.observe(ttft)
+            if resources is not None:
+                resources['time_to_first_token'] = ttft
+        chunks.append(message.content)
+        progress('Writing report', None, partial=''.join(chunks))
+
+    reply = session.query(message, callback=on_message, **query_args)
+    return reply.content
+
+
+def wait_out_outage(error, deadline, progress):
+    """If ``error`` means GPTe is down or overloaded, tell the user and wait until it may be back.
+
+    Returns False for any other error, or once waiting would run past ``deadline``. Calls
+    this process refused itself (``GPTeBusy``) aren't an outage: GPTe is up, and rerunning
+    the analysis would only repeat the work already done.
+    """
+    if isinstance(error, GPTeBusy):
+        return False
+    if isinstance(error, GPTeUnavailable):
+        delay = error.retry_after
+    elif is_transient(error):
+        delay = gpte_guard.breaker.retry_after()
+    else:
+        return False
+    delay = max(1.0, delay)
+    if time.monotonic() + delay > deadline:
+        return False
+    logger.info(f"GPTe unavailable ({str(error)}), retrying in {delay:.0f}s")
+    progress(f'Analysis engine unavailable - retrying in {delay:.0f}s')
+    time.sleep(delay)
+    return True
+
+def analyze_uploaded_documents(file_paths, progress=None, resources=None, reuse=REUSE_PAST_REPORTS):
+    """Analyze multiple uploaded documents and return a structured report
+
+    If ``resources`` is a dict, the GPTe collection and chat session ids used are stored
+    in it so the same session can be queried again later, along with the file hashes.
+    With ``reuse``, files that were analyzed before get the stored report back. A report
+    built from the local lab checks alone sets ``resources['degraded']``; it isn't a
+    finished analysis and must not be stored or reused.
+    """
+    progress = progress or (lambda message, fraction=None, partial=None: None)
+    lab_table = None
+    if resources is not None:
+        resources.pop('degraded', None)
+    try:
+        # Validate file paths
+        valid_file_paths = []
+        for file_path in file_paths:
+            if not os.path.exists(file_path):
+                logger.error(f"File not found at path: {file_path}")
+                continue
+                
+            file_size = os.path.getsize(file_path)
+            if file_size == 0:
+                logger.error(f"File is empty: {file_path}")
+                continue
+                
+            valid_file_paths.append(file_path)
+        
+        if not valid_file_paths:
+            return "Error: No valid files were found. Please try uploading again."
+        
+        tags = observe_submission(valid_file_paths)
+        digests = hash_files(valid_file_paths)
+        key = submission_key(digests)
+        if resources is not None:
+            resources['submission_key'] = key
+            resources['digests'] = digests
+        if reuse:
+            past = persist(analysis_store.find_by_submission, key)
+            if past:
+                # The generated text only - a draft holds whoever submitted the files before's edits
+                logger.info(f"Serving stored analysis {past['id']} for a repeat submission")
+                return past['analysis']
+
+        documents = extract_local_text(valid_file_paths)
+        facts = ''
+        if documents:
+            lab_table = check_lab_values(documents, progress)
+            facts = lab_facts(lab_table)
+        deadline = time.monotonic() + OUTAGE_MAX_WAIT
+        chat_session_id = session_collection_id = None
+        while True:
+            try:
+                progress('Connecting to the analysis engine', 0.05)
+                with gpte_pool.client() as client:
+                    if documents:
+                        # Text is already in hand - send it with the prompt to a session without a collection
+                        collection_id = None
+                        message = documents_prompt(ANALYSIS_PROMPT, documents)
+                        parts = [DocumentPart(d.file_name, d.pages, text=d.text) for d in documents]
+                    else:
+                        collection_id = get_or_ingest_collection(client, valid_file_paths, progress, digests)
+                        message = ANALYSIS_PROMPT
+                        parts = None
+                    if chat_session_id is None or session_collection_id != collection_id:
+                        # One session per analysis - a retry after an outage carries on with it
+                        if chat_session_id is not None:
+                            delete_chat_session(client, chat_session_id)
+                        with span('chat_session'):
+                            chat_session_id = client.create_chat_session(collection_id)
+                        session_collection_id = collection_id
+                    if resources is not None:
+                        resources['collection_id'] = collection_id
+                        resources['chat_session_id'] = chat_session_id
+                        resources['local_text'] = bool(documents)
+                        resources['extractions'] = None
+                        resources['added_notes'] = None
+                        resources['added_paths'] = None
+                        resources['lab_facts'] = facts
+
+                    query_args = {}
+                    if MAP_REDUCE_MIN_DOCUMENTS or MAP_REDUCE_MIN_PAGES:
+                        parts = parts or collection_parts(client, collection_id)
+                        if should_map_reduce(parts, MAP_REDUCE_MIN_DOCUMENTS, MAP_REDUCE_MIN_PAGES):
+                            with span('map', documents=len(parts), pages=sum(p.pages for p in parts), **tags):
+                                extractions = map_documents(client, parts, progress, collection_id, MAP_REDUCE_PARALLELISM)
+                            message = merge_prompt(ANALYSIS_PROMPT, extractions)
+                            query_args = MERGE_QUERY_ARGS
+                            if resources is not None:
+                                resources['extractions'] = extractions
+
+                    if facts:
+                        message = f'{message}\n\n{facts}'
+                    progress('Generating analysis', 0.8 if query_args else 0.6)
+                    with span('query', local=bool(documents), merge=bool(query_args), **tags), \
+                            client.connect(chat_session_id) as session:
+                        return query_report(session, progress, resources, message, **query_args)
+            except Exception as e:
+                if not wait_out_outage(e, deadline, progress):
+                    raise
 
     except Exception as e:
         logger.error(f"Error in GPTe analysis: {str(e)}")
+        if lab_table is not None and len(lab_table):
+            if resources is not None:
+                resources['degraded'] = True
+            return fallback_report(lab_table, str(e))
         return f"Error analyzing documents: {str(e)}"
 
-from datetime import datetime
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_LEFT
-from reportlab.lib import colors
-from reportlab.platypus import HRFlowable
-
-def create_pdf_report(input_text):
-    # Generate timestamped filename
-    filename = f"medical_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    
-    # Create a PDF document with the timestamped filename
-    doc = SimpleDocTemplate(filename, pagesize=letter)
-    
-    # Prepare the story (content) for the PDF
-    story = []
-    
-    # Define styles
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    heading_style = ParagraphStyle(
-        'Heading1',
-        parent=styles['Heading1'],
-        fontSize=18,
-        leading=16,
-        spaceAfter=12,
-        textColor=colors.black,
-        alignment=1 # center align
-    )
-    # Heading 2 style
-    heading2_style = ParagraphStyle(
-        'Heading2',
-        parent=styles['Heading2'],
-        fontSize=12,
-        leading=14,
-        spaceAfter=8,
-        textColor=colors.darkblue,
-        alignment=1 
+def regenerate_analysis(file_paths, resources, progress=None):
+    """Ask the existing chat session for a fresh take on the report, falling back to a full analysis"""
+    progress = progress or (lambda message, fraction=None, partial=None: None)
+    chat_session_id = resources.get('chat_session_id')
+    if chat_session_id:
+        try:
+            message = ANALYSIS_PROMPT
+            query_args = {}
+            if resources.get('extractions'):
+                # Only the merge step is repeated; the per-document notes are reused
+                message = merge_prompt(ANALYSIS_PROMPT, resources['extractions'])
+                query_args = MERGE_QUERY_ARGS
+            elif resources.get('local_text'):
+                # The session has no collection, so the documents travel with the prompt again
+                added_paths = set(resources.get('added_paths') or ())
+                documents = extract_local_text([p for p in file_paths if p not in added_paths])
+                if not documents:
+                    raise RuntimeError("Documents can no longer be read locally")
+                message = documents_prompt(ANALYSIS_PROMPT, documents)
+            if resources.get('added_notes'):
+                # Documents added later travel as the notes taken from them at the time
+                message = '\n\n'.join([message, 'More documents were added later; their notes follow.']
+                                       + format_notes(resources['added_notes']))
+            if resources.get('lab_facts'):
+                message = f"{message}\n\n{resources['lab_facts']}"
+            llm_args = {'temperature': REGENERATE_TEMPERATURE, 'seed': random.randint(0, 2 ** 31 - 1)}
+            deadline = time.monotonic() + OUTAGE_MAX_WAIT
+            while True:
+                progress('Generating analysis', 0.3)
+                try:
+                    with gpte_pool.client() as client, span('regenerate_query', **file_tags(file_paths)):
+                        with client.connect(chat_session_id) as session:
+                            # Leave the earlier answer out so the model doesn't just repeat it
+                            return query_report(session, progress, resources, message, llm_args=llm_args,
+                                                include_chat_history=False, **query_args)
+                except Exception as e:
+                    if not wait_out_outage(e, deadline, progress):
+                        if isinstance(e, GPTeUnavailable) or is_transient(e):
+                            # GPTe is still down - a full re-analysis would only wait again
+                            return f"Error analyzing documents: {str(e)}"
+                        raise
+        except Exception as e:
+            logger.info(f"Chat session {chat_session_id} unusable, re-running analysis: {str(e)}")
+    return analyze_uploaded_documents(file_paths, progress, resources, reuse=False)
+
+
+def add_documents(file_paths, digests, report, resources, progress=None):
+    """Fold newly added files into an existing report, rewriting only the sections they change
+
+    Only the new files are read (locally, or ingested into the analysis's collection) and
+    condensed into notes; one LLM-only query then returns the sections of ``report`` to
+    replace. ``resources`` is updated to cover the new files so a regenerate includes them.
+    """
+    progress = progress or (lambda message, fraction=None, partial=None: None)
+    try:
+        tags = observe_submission(file_paths)
+        local, ingest = [], []
+        for file_path in file_paths:
+            documents = extract_local_text([file_path])
+            if documents:
+                local.extend(documents)
+            else:
+                ingest.append(file_path)
+        parts = [DocumentPart(d.file_name, d.pages, text=d.text) for d in local]
+        facts = ''
+        if local:
+            with span('lab_values') as lab_tags:
+                table = build_lab_table(local)
+                lab_tags['rows'] = len(table)
+            facts = lab_facts(table)
+        all_digests = list(resources.get('digests') or ()) + list(digests)
+        collection_id = resources.get('collection_id')
+
+        def preview(message, fraction=None, partial=None):
+            # Stream the report with the rewritten sections already in place
+            progress(message, fraction, partial=merge_sections(report, partial) if partial else None)
+
+        deadline = time.monotonic() + OUTAGE_MAX_WAIT
+        while True:
+            try:
+                progress('Connecting to the analysis engine', 0.05)
+                with gpte_pool.client() as client:
+                    if ingest:
+                        collection_id, ingested = ingest_added_documents(
+                            client, collection_id, ingest, [d for p, d in zip(file_paths, digests) if p in ingest],
+                            resources, progress)
+                        parts += ingested
+                        ingest = []  # Done - waiting out an outage below must not ingest them again
+                    with span('map', documents=len(parts), pages=sum(p.pages for p in parts), **tags):
+                        extractions = map_documents(client, parts, progress, collection_id, MAP_REDUCE_PARALLELISM)
+
+                    message = delta_prompt(report, extractions)
+                    if facts:
+                        message = f'{message}\n\n{facts}'
+                    progress('Updating report', 0.8)
+                    chat_session_id = resources.get('chat_session_id')
+                    with span('delta_query', **tags):
+                        if chat_session_id:
+                            with client.connect(chat_session_id) as session:
+                                update = query_report(session, preview, None, message, include_chat_history=False,
+                                                      **MERGE_QUERY_ARGS)
+                        else:
+                            # A report served from the store has no session of its own
+                            update = answer_from_notes(client, message)
+                break
+            except Exception as e:
+                if not wait_out_outage(e, deadline, progress):
+                    raise
+
+        if resources.get('extractions'):
+            # Regenerate merges the per-document notes, so the new ones just join them
+            resources['extractions'] = resources['extractions'] + extractions
+        else:
+            resources['added_notes'] = (resources.get('added_notes') or []) + extractions
+            resources['added_paths'] = (resources.get('added_paths') or []) + list(file_paths)
+        if facts:
+            resources['lab_facts'] = '\n'.join(filter(None, [resources.get('lab_facts'), facts]))
+        resources['digests'] = all_digests
+        resources['submission_key'] = submission_key(all_digests)
+
+        merged = merge_sections(report, update)
+        logger.info(f"Added {len(file_paths)} documents, rewrote sections: {changed_sections(report, merged)}")
+        return merged
+    except Exception as e:
+        logger.error(f"Error adding documents: {str(e)}")
+        return f"Error: Could not add the documents: {str(e)}"
+
+
+def ingest_added_documents(client, collection_id, file_paths, digests, resources, progress):
+    """Ingest added files for an analysis; returns (collection_id, parts) for the collection holding them.
+
+    A collection from the document cache may be open in other sessions, so it is never
+    changed: the added files get a collection of their own (cached under their hashes)
+    and the analysis keeps its original one. Only a private collection takes them in place.
+    """
+    if collection_id in document_cache.collection_ids():
+        added_id, _, parts = add_to_collection(client, None, file_paths, progress, digests)
+        return added_id, parts
+    collection_id, _, parts = add_to_collection(client, collection_id, file_paths, progress, digests)
+    resources['collection_id'] = collection_id
+    return collection_id, parts
+
+
+def answer_from_notes(client, message):
+    """One-off LLM-only query in a throwaway chat session"""
+    chat_session_id = client.create_chat_session(None)
+    try:
+        with client.connect(chat_session_id) as session:
+            return session.query(message, include_chat_history=False, **MERGE_QUERY_ARGS).content
+    finally:
+        delete_chat_session(client, chat_session_id)
+
+
+def delete_chat_session(client, chat_session_id):
+    try:
+        client.delete_chat_sessions([chat_session_id])
+    except Exception as e:
+        logger.error(f"Failed to delete chat session {chat_session_id}: {str(e)}")
+
+
+def track_gpte_resources(owner, resources):
+    """Record the GPTe collection/chat session an analysis left behind for later cleanup"""
+    if resources:
+        resource_registry.track(owner, resources.get('collection_id'), resources.get('chat_session_id'))
+
+
+def release_gpte_resources(owner, wait=True):
+    """Delete the chat sessions (and uncached collections) an owner created
+
+    The owner stops holding them right away, so whatever it creates next is never
+    deleted with them; with ``wait=False`` the deletes run on ``cleanup_pool``.
+    """
+    owned = resource_registry.release(owner)
+    if not owned:
+        return
+    if wait:
+        delete_owned_resources(owner, owned)
+    else:
+        cleanup_pool.submit(delete_owned_resources, owner, owned)
+
+
+def expire_session(owner):
+    """Reaper callback for a client idle past the session timeout; its GPTe resources are already deleted
+
+    Its files go too, and both the store's record and the client's next request learn that
+    nothing is left to regenerate from or add to.
+    """
+    upload_spool.clear(owner)
+    with _expired_lock:
+        _expired_owners.add(owner)
+    record = persist(analysis_store.current, owner)
+    if record:
+        persist(analysis_store.update_analysis, record['id'], resources=expired_resources(record['resources']))
+
+
+def pop_expired(owner):
+    with _expired_lock:
+        if owner not in _expired_owners:
+            return False
+        _expired_owners.discard(owner)
+        return True
+
+
+def expired_resources(resources):
+    """An expired analysis's resources: the file hashes and lab facts, without the deleted GPTe ids"""
+    kept = {key: resources[key] for key in ('submission_key', 'digests', 'lab_facts') if key in resources}
+    return {**kept, 'expired': True}
+
+
+def delete_owned_resources(owner, owned):
+    try:
+        with gpte_pool.client() as client:
+            delete_resources(client, owned, document_cache.collection_ids())
+    except Exception as e:
+        logger.error(f"Failed to clean up GPTe resources for {owner}: {str(e)}")
+
+
+def persist(func, *args, **kwargs):
+    """Run an analysis store call, logging failures instead of raising so the UI keeps working without it"""
+    try:
+        return func(*args, **kwargs)
+    except Exception as e:
+        logger.error(f"Analysis store {func.__name__} failed: {str(e)}")
+        return None
+
+
+def save_analysis(owner, analysis, file_names, file_paths, resources, patient_id=None):
+    """Record a finished analysis as the owner's current one; returns its id"""
+    return persist(analysis_store.save_analysis, owner, analysis, file_names, file_paths, resources,
+                   resources.get('submission_key'), patient_id)
+
+
+def suggest_patient(key):
+    """Patient of the latest stored analysis of exactly these files, for the uploader to confirm"""
+    past = analysis_store.find_by_submission(key) if key else None
+    return past['patient_id'] if past else None
+
+
+def copy_past_report(owner, analysis_id):
+    """Make a fresh copy of one of the owner's stored analyses their current one.
+
+    Only the generated text is copied, never a draft. The copy shares no GPTe resources
+    with the original; a regenerate runs a full analysis of whichever files are still
+    on this worker. Returns None for an analysis the owner didn't create.
+    """
+    record = analysis_store.get(analysis_id)
+    if record is None or record['owner'] != owner:
+        return None
+    resources = {key: record['resources'][key] for key in ('submission_key', 'digests', 'lab_facts')
+                 if key in record['resources']}
+    copy_id = analysis_store.save_analysis(owner, record['analysis'], record['file_names'], record['file_paths'],
+                                           resources, record['submission_key'], record['patient_id'])
+    return analysis_store.get(copy_id)
+
+
+def create_pdf_report(input_text, filename=None):
+    """Render the report and write it to ``filename`` (default: a unique temp path); returns the path"""
+    if filename is None:
+        # Own directory per report so concurrent exports never collide, with a readable download name
+        filename = os.path.join(
+            tempfile.mkdtemp(prefix='med_report_'),
+            f"medical_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        )
+    with span('pdf_render', chars=len(input_text)):
+        write_file(filename, render_pdf_report(input_text))
+    logger.info(f"PDF report generated: {filename}")
+    return filename
+
+
+def create_preview(input_text):
+    """Render the live preview to its own temp directory; returns the path"""
+    return create_pdf_report(input_text, os.path.join(tempfile.mkdtemp(prefix='med_preview_'), 'report_preview.pdf'))
+
+
+async def spool_uploads(q: Q, uploaded_files):
+    """Save uploaded files into the client's spool area concurrently; returns [(local_path, file_name), ...]
+
+    Every download finishes before an error is raised, and then the files that did
+    arrive are discarded, so nothing lands in the spool after the caller handles it.
+    """
+    slots = asyncio.Semaphore(UPLOAD_PARALLELISM)
+    results = await asyncio.gather(*[spool_upload(q, file_info, slots) for file_info in uploaded_files],
+                                   return_exceptions=True)
+    spooled = [result for result in results if not isinstance(result, BaseException)]
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        upload_spool.discard(q.client_id, [local_path for local_path, _ in spooled])
+        raise errors[0]
+    return spooled
+
+
+async def spool_upload(q: Q, file_info, slots):
+    """Save one uploaded file into the client's spool area; returns (local_path, file_name)"""
+    async with slots:
+        local_path = None
+        try:
+            if isinstance(file_info, str):  # It's a file path
+                file_name = os.path.basename(file_info)
+                local_path = upload_spool.new_path(q.client_id, file_name)
+                # Use Wave's download method correctly
+                local_path = await q.site.download(file_info, local_path)
+            else:  # It's a file object whose content Wave already holds in memory
+                file_name = file_info.name
+                local_path = upload_spool.new_path(q.client_id, file_name)
+                await q.run(write_file, local_path, file_info.content)
+            upload_spool.admit(q.client_id, local_path)
+        except BaseException:
+            if local_path:
+                upload_spool.discard(q.client_id, [local_path])  # A partial download
+            raise
+        return local_path, file_name
+
+
+def write_file(file_path, content):
+    with open(file_path, 'wb') as f:
+        f.write(content)
+
+
+def show_notification(q: Q, message_type: str, text: str):
+    q.page['notification'] = ui.form_card(
+        box='1 7 12 1',
+        items=[
+            ui.message_bar(type=message_type, text=text)
+        ]
     )
 
-    # Custom styles
-    heading3_style = ParagraphStyle(
-        'Heading1',
-        parent=styles['Heading3'],
-        fontSize=12,
-        leading=16,
-        spaceAfter=4,
-        textColor=colors.darkblue,
-        alignment=0 # center align
+
+def submit_job(q: Q, func, *args, **kwargs):
+    """Queue an analysis job for this client; returns False if it could not be queued"""
+    if q.client.job and not q.client.job.done:
+        show_notification(q, 'warning', 'An analysis is already in progress for this session.')
+        return False
+    try:
+        q.client.job = scheduler.submit(func, *args, **kwargs)
+    except QueueFullError as e:
+        logger.error(f"Rejected analysis: {str(e)}")
+        show_notification(q, 'error', 'The analysis service is busy. Please try again in a few minutes.')
+        return False
+    return True
+
+
+async def track_job(q: Q, job, label: str, show_partial=None):
+    """Mirror a job's queue position and progress on the page until it finishes
+
+    Saves are batched to one per poll interval, so streamed output handed to
+    ``show_partial(q, text)`` doesn't flood the websocket.
+    """
+    last_state = None
+    last_partial = None
+    while not job.done:
+        if job.status == 'queued':
+            state = (f'{label} - waiting in queue (position {job.position})', None)
+            if gpte_guard.breaker.state == 'open':
+                state = (f'{state[0]} - analysis engine unavailable, will retry automatically', None)
+        else:
+            state = (f'{label} - {job.message}...', job.progress)
+        dirty = False
+        if state != last_state:
+            q.page['notification'] = ui.form_card(
+                box='1 7 12 1',
+                items=[
+                    ui.progress(label=state[0], value=state[1])
+                ]
+            )
+            last_state = state
+            dirty = True
+        partial = job.partial
+        if show_partial and partial and partial != last_partial:
+            show_partial(q, partial)
+            last_partial = partial
+            dirty = True
+        if dirty:
+            await q.page.save()
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    if job.error:
+        return f"Error: {str(job.error)}"
+    return job.result
+
+
+def show_streaming_report(q: Q, text: str):
+    """Push partial report text into the analysis card, creating a read-only one on first use"""
+    if q.client.report_streaming:
+        update_report_text(q, text)
+        return
+    q.page['analysis'] = ui.form_card(
+        box='1 8 12 6',
+        items=[
+            ui.text_xl('Medical Analysis Results'),
+            ui.text_l('Writing report...'),
+            ui.textbox(
+                name='analysis_text',
+                label='AI-Generated Report (streaming):',
+                value=text,
+                multiline=True,
+                height='400px',
+                readonly=True,
+            ),
+        ]
     )
+    q.client.report_streaming = True
+
+
+def update_report_text(q: Q, text: str):
+    q.page['analysis'].items[2].textbox.value = text
 
 
-    # Caption style (smaller and gray text)
-    caption_style = ParagraphStyle(
-        'Caption',
-        parent=styles['BodyText'],
-        fontSize=8,
-        leading=10,
-        spaceAfter=10,
-        textColor=colors.grey,
-        alignment=1  # center align
+def show_analysis(q: Q, file_names, text: str):
+    q.page['analysis'] = ui.form_card(
+        box='1 8 12 6',
+        items=[
+            ui.text_xl('Medical Analysis Results'),
+            ui.text_l(f'Documents analyzed: {", ".join(file_names)}'),
+            ui.textbox(
+                name='analysis_text',
+                label='AI-Generated Report (editable):',
+                value=text,
+                multiline=True,
+                height='400px',
+                spellcheck=True,
+                trigger=True,  # Send edits as they happen so drafts are saved incrementally
+            ),
+            ui.buttons([
+                ui.button(name='regenerate_button', label='Regenerate Analysis'),
+                ui.button(name='add_documents_button', label='Add Documents'),
+                ui.button(name='download_button', label='Download Report as PDF', primary=True),
+                ui.button(name='new_upload_button', label='Upload New Documents')
+            ])
+        ]
     )
-        
-    bold_style = ParagraphStyle(
-        'BoldText',
-        parent=styles['BodyText'],
-        fontSize=10,
-        leading=12,
-        spaceAfter=2,
-        textColor=colors.black,
-        fontName='Helvetica-Bold'
+    schedule_preview(q, text)
+
+
+def schedule_preview(q: Q, text: str):
+    """Have the preview catch up with ``text``; one task per client renders the latest text once edits pause"""
+    if not LIVE_PREVIEW or not text:
+        return
+    q.client.preview_text = text
+    task = q.client.preview_task
+    if task is None or task.done():
+        q.client.preview_task = asyncio.ensure_future(update_preview(q))
+
+
+async def update_preview(q: Q):
+    try:
+        while q.client.preview_text != q.client.preview_rendered:
+            text = q.client.preview_text
+            await asyncio.sleep(PREVIEW_DEBOUNCE)
+            if q.client.preview_text != text:
+                continue  # Still being edited
+
+            # Rendering is CPU-bound, so keep it off the event loop; unchanged sections come from the cache
+            pdf_path = await q.run(create_preview, text)
+            try:
+                with span('wave_upload_preview'):
+                    preview_path, = await q.site.upload([pdf_path])
+            finally:
+                shutil.rmtree(os.path.dirname(pdf_path), ignore_errors=True)
+            await unload_preview(q)
+            q.client.preview_path = preview_path
+            q.client.preview_rendered = text
+            q.page['preview'] = ui.frame_card(box='1 22 12 10', title='Report Preview', path=preview_path)
+            await q.page.save()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Preview error: {str(e)}")
+
+
+async def unload_preview(q: Q):
+    """Delete the previous preview PDF from the Wave server"""
+    if q.client.preview_path:
+        try:
+            await q.site.unload(q.client.preview_path)
+        except Exception as e:
+            logger.error(f"Failed to unload preview {q.client.preview_path}: {str(e)}")
+        q.client.preview_path = None
+
+
+async def clear_preview(q: Q):
+    if q.client.preview_task and not q.client.preview_task.done():
+        q.client.preview_task.cancel()
+    await unload_preview(q)
+    q.client.preview_text = None
+    q.client.preview_rendered = None
+    try:
+        q.page.drop('preview')
+    except:
+        pass
+
+
+async def restore_session(q: Q):
+    """Pick up this client's analysis from the store after a restart or on another worker"""
+    record = await q.run(persist, analysis_store.current, q.client_id)
+    if not record:
+        return
+    load_record(q, record)
+    logger.info(f"Restored analysis {record['id']} for client {q.client_id}")
+
+
+def load_record(q: Q, record):
+    """Make a stored analysis this client's current one and show it"""
+    q.client.analysis_id = record['id']
+    q.client.patient_id = record['patient_id']
+    q.client.file_names = record['file_names']
+    # Spooled files only survive on the worker (and process) that received them
+    q.client.file_paths = [p for p in record['file_paths'] if os.path.exists(p)]
+    q.client.analysis = record['analysis']
+    q.client.draft = record['draft'] or record['analysis']
+    q.client.gpte_resources = record['resources']
+    track_gpte_resources(q.client_id, q.client.gpte_resources)
+    show_analysis(q, q.client.file_names, q.client.draft)
+
+
+def show_patient_suggestion(q: Q, patient_id):
+    """Offer to file the analysis under the patient these exact files were analyzed for before"""
+    q.page['past_reports'] = ui.form_card(
+        box='1 14 12 1',
+        items=[
+            ui.inline([
+                ui.text(f'These files were analyzed before for patient {patient_id}.'),
+                ui.button(name='confirm_patient', label=f'File under patient {patient_id}', value=patient_id),
+            ], align='center'),
+        ]
     )
-    
-    normal_style = ParagraphStyle(
-        'NormalText',
-        parent=styles['BodyText'],
-        fontSize=10,
-        leading=12,
-        spaceAfter=2,
-        textColor=colors.black
+
+
+async def show_past_reports(q: Q, patient_id):
+    """List a patient's stored analyses; picking one opens a copy of it"""
+    records = await q.run(persist, analysis_store.find_by_patient, q.client_id, patient_id, PAST_REPORTS_LIMIT) or []
+    if not records:
+        show_notification(q, 'info', f'No past reports for patient {patient_id}.')
+        return
+    q.page['past_reports'] = ui.form_card(
+        box='1 14 12 1',
+        items=[
+            ui.dropdown(
+                name='open_past_report',
+                placeholder=f'Open one of {len(records)} past report(s) for patient {patient_id}',
+                choices=[ui.choice(name=record['id'],
+                                   label=f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(record['updated_at']))}"
+                                         f" - {', '.join(record['file_names'])}")
+                         for record in records],
+                trigger=True,
+            )
+        ]
     )
-    
-    story.append(Paragraph("H2o Medical Center\n", heading_style))
-    story.append(Paragraph("Lab Report Summary\n", heading2_style))
-    story.append(Paragraph("This report is AI-generated and reviewed by a medical professional. Some details may be inaccurate or require clinical validation."
-, caption_style))
-    story.append(HRFlowable(width="100%", thickness=1, color=colors.grey, spaceBefore=6, spaceAfter=6))
-    # Process the input text line by line
-    input_text = input_text.replace("According to the provided documents, here is a structured explanation of the medical findings:","")
-    lines = input_text.split('\n')
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue  # skip empty lines
-            
-        if line.startswith('##') and line.endswith('##'):
-            # This is a heading
-            heading_text = line.strip('##').strip()
-            story.append(Paragraph(heading_text, heading3_style))
-        elif '**' in line:
-            # This line contains bold text
-            parts = line.split('**')
-            processed_line = []
-            
-            for i, part in enumerate(parts):
-                if i % 2 == 1:  # odd index means it was between **
-                    processed_line.append(f'<b>{part}</b>')
-                else:
-                    processed_line.append(part)
-                    
-            combined = ''.join(processed_line)
-            story.append(Paragraph(combined, normal_style))
+
+
+async def finish_analysis(q: Q, file_paths, file_names, resources, patient_id=None):
+    """Wait for a queued analysis and render its results"""
+    try:
+        job = q.client.job
+        try:
+            analysis = await track_job(q, job, 'Processing your documents', show_streaming_report)
+        finally:
+            # Whatever session the job got to create is the client's to clean up, even if it failed
+            track_gpte_resources(q.client_id, resources)
+        q.client.report_streaming = False
+        if q.client.job is not job:
+            return  # The user started over while this job was running
+
+        # Check if the analysis contains an error message
+        if analysis.startswith("Error:"):
+            show_notification(q, 'error', analysis)
+            await q.page.save()
+            return
+
+        # Store in client session, and in the shared store so any worker can pick the session up
+        q.client.file_paths = file_paths
+        q.client.file_names = file_names
+        q.client.analysis = analysis
+        q.client.draft = analysis
+        q.client.gpte_resources = resources
+        if resources.get('degraded'):
+            # Lab checks only - kept for this session so Regenerate can complete it, but never stored
+            q.client.analysis_id = None
+            show_notification(q, 'warning', 'The AI summary could not be generated; showing the lab checks only')
         else:
-            # Normal text
-            story.append(Paragraph(line, normal_style))
-        
-        # Add small spacer after each element
-        story.append(Spacer(1, 6))
-    
-    # Build the PDF
-    doc.build(story)
-    print(f"PDF report generated: {filename}")
-    return filename
+            # Looked up before saving, or the new record would be the match
+            suggested = None if patient_id else await q.run(persist, suggest_patient, resources.get('submission_key'))
+            q.client.analysis_id = await q.run(save_analysis, q.client_id, analysis, file_names, file_paths,
+                                               resources, patient_id)
+            show_notification(q, 'success', f'Successfully processed {len(file_names)} file(s)')
+            if suggested and q.client.analysis_id:
+                show_patient_suggestion(q, suggested)
+
+        # Show analysis results
+        show_analysis(q, file_names, analysis)
+    except Exception as e:
+        logger.error(f"Analysis error: {str(e)}", exc_info=True)
+        show_notification(q, 'error', f'Error processing files: {str(e)}')
+    await q.page.save()
+
+
+async def finish_regeneration(q: Q):
+    """Wait for a queued regeneration and refresh the report textbox"""
+    try:
+        job = q.client.job
+        analysis = await track_job(q, job, 'Regenerating analysis', update_report_text)
+        # A fallback to a full analysis may have created a new collection and session
+        track_gpte_resources(q.client_id, q.client.gpte_resources)
+        if q.client.job is not job:
+            return  # The user started over while this job was running
+
+        # Check if the analysis contains an error message
+        if analysis.startswith("Error:"):
+            show_notification(q, 'error', analysis)
+            await q.page.save()
+            return
+
+        q.client.analysis = analysis
+        q.client.draft = analysis
+        resources = q.client.gpte_resources
+        # A lab-checks-only report leaves the stored analysis, if any, as it was
+        if q.client.analysis_id and not resources.get('degraded'):
+            await q.run(persist, analysis_store.update_analysis, q.client.analysis_id, analysis, resources)
+        elif not resources.get('degraded'):
+            # The first analysis was degraded and never stored; this one completes it
+            q.client.analysis_id = await q.run(save_analysis, q.client_id, analysis, q.client.file_names,
+                                               q.client.file_paths, resources, q.client.patient_id)
+
+        # Update the analysis textbox
+        update_report_text(q, analysis)
+        schedule_preview(q, analysis)
+
+        if resources.get('degraded'):
+            show_notification(q, 'warning', 'The AI summary could not be generated; showing the lab checks only')
+        else:
+            show_notification(q, 'success', 'Analysis regenerated successfully.')
+    except Exception as e:
+        logger.error(f"Regeneration error: {str(e)}")
+        show_notification(q, 'error', f'Failed to regenerate analysis: {str(e)}')
+    await q.page.save()
+
+
+async def finish_adding_documents(q: Q, file_paths, file_names):
+    """Wait for added documents to be folded into the report and show the updated one"""
+    try:
+        job = q.client.job
+        analysis = await track_job(q, job, 'Adding documents', update_report_text)
+        # The added files may have needed a collection of their own
+        track_gpte_resources(q.client_id, q.client.gpte_resources)
+        if q.client.job is not job:
+            return  # The user started over while this job was running
+
+        if analysis.startswith("Error:"):
+            # Put back the report the live preview was drawn over
+            update_report_text(q, q.client.draft)
+            show_notification(q, 'error', analysis)
+            await q.page.save()
+            return
+
+        q.client.file_paths = (q.client.file_paths or []) + file_paths
+        q.client.file_names = (q.client.file_names or []) + file_names
+        q.client.analysis = analysis
+        q.client.draft = analysis
+        if q.client.analysis_id:
+            resources = q.client.gpte_resources
+            await q.run(persist, analysis_store.update_analysis, q.client.analysis_id, analysis, resources)
+            await q.run(persist, analysis_store.add_files, q.client.analysis_id, file_names, file_paths,
+                        resources.get('submission_key'))
+
+        show_analysis(q, q.client.file_names, analysis)
+        show_notification(q, 'success', f'Added {len(file_names)} file(s) to the analysis')
+    except Exception as e:
+        logger.error(f"Error adding documents: {str(e)}", exc_info=True)
+        show_notification(q, 'error', f'Failed to add documents: {str(e)}')
+    await q.page.save()
+
+
+def warm_up():
+    """Build what the first request would otherwise wait for: PDF styles and an authenticated GPTe client"""
+    start = time.monotonic()
+    try:
+        with span('warm_up'):
+            get_renderer()
+            if WARM_UP_CLIENTS:
+                gpte_pool.warm(WARM_UP_CLIENTS)  # Also loads the GPTe SDK
+    except Exception as e:
+        logger.error(f"Warm-up failed: {str(e)}")
+    startup_times['warm_up'] = time.monotonic() - start
+
+
+async def on_startup():
+    # Warm up in the background so the first page renders without waiting for GPTe
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+    upload_spool.sweep()
+    if METRICS_PORT:
+        try:
+            metrics.start_metrics_server(METRICS_PORT)
+        except OSError as e:
+            logger.error(f"Could not start metrics server on port {METRICS_PORT}: {str(e)}")
+    reaper.start()
+
 
+async def on_shutdown():
+    reaper.stop()
+    cleanup_pool.shutdown(wait=False)
 
-@app('/')
+
+@app('/', on_startup=on_startup, on_shutdown=on_shutdown)
 async def serve(q: Q):
+    resource_registry.touch(q.client_id)
+    if q.client.initialized and pop_expired(q.client_id):
+        q.client.gpte_resources = expired_resources(q.client.gpte_resources or {})
+        q.client.file_paths = []
     if not q.client.initialized:
         q.page['meta'] = ui.meta_card(box='', title='Med Assist with GPTe', theme='h2o-dark')
         q.page['header'] = ui.header_card(
@@ -262,18 +1258,34 @@ async def serve(q: Q):
             box='1 2 12 5',
             items=[
                 ui.text_xl('Upload Medical Documents'),
+                ui.inline([
+                    ui.textbox(name='patient_id', label='Patient ID (optional)'),
+                    ui.button(name='past_reports_button', label='Show Past Reports'),
+                ], align='end'),
                 ui.file_upload(
                     name='document_upload',
                     label='Select Files for Analysis',
                     multiple=True,  # Enable multiple file selection
-                    file_extensions=['pdf', 'jpg', 'jpeg', 'png', 'txt']
+                    file_extensions=['pdf', 'jpg', 'jpeg', 'png', 'txt'],
+                    max_size=upload_spool.max_client_bytes / 1024 ** 2  # MB, checked in the browser
+
                 ),
                 ui.text_xs('Supported formats: PDF, JPG, PNG, TXT. You can select multiple files.')
             ]
         )
         q.client.initialized = True
+        await restore_session(q)
+
+    # The report textbox sends every edit - keep the stored draft and the preview current
+    if q.args.analysis_text is not None and q.args.analysis_text != q.client.draft:
+        q.client.draft = q.args.analysis_text
+        if q.client.analysis_id:
+            await q.run(persist, analysis_store.save_draft, q.client.analysis_id, q.args.analysis_text)
+        schedule_preview(q, q.client.draft)
 
-    if q.args.document_upload:
+    if q.args.document_upload and q.client.job and not q.client.job.done:
+        show_notification(q, 'warning', 'An analysis is already in progress for this session.')
+    elif q.args.document_upload:
         # Clean up previous cards - safely drop one by one
         try:
             q.page.drop('notification')
@@ -287,6 +1299,15 @@ async def serve(q: Q):
             q.page.drop('download')
         except:
             pass
+        try:
+            q.page.drop('add_documents')
+        except:
+            pass
+        try:
+            q.page.drop('past_reports')
+        except:
+            pass
+        await clear_preview(q)
         
         # Show processing notification
         q.page['notification'] = ui.form_card(
@@ -296,43 +1317,34 @@ async def serve(q: Q):
             ]
         )
         await q.page.save()
+
+        # The new upload replaces the previous analysis - clean up what it left behind
+        upload_spool.clear(q.client_id)
+        q.client.file_paths = None
+        q.client.analysis_id = None
+        q.client.patient_id = (q.args.patient_id or '').strip() or None
+        await q.run(persist, analysis_store.clear_current, q.client_id)
+        if q.client.gpte_resources:
+            release_gpte_resources(q.client_id, wait=False)
+            q.client.gpte_resources = None
         
         try:
             uploaded_files = q.args.document_upload
             file_paths = []
             file_names = []
             
-            # Process files properly using Wave's download method for paths
-            if isinstance(uploaded_files, list):
-                for file_info in uploaded_files:
-                    if isinstance(file_info, str):  # It's a file path
-                        file_name = os.path.basename(file_info)
-                        # Use Wave's download method correctly
-                        local_path = await q.site.download(file_info, tempfile.gettempdir())
-                        if local_path:
-                            file_paths.append(local_path)
-                            file_names.append(file_name)
-                    else:  # It's a file object
-                        file_name = file_info.name
-                        temp_file_path = os.path.join(tempfile.gettempdir(), f"{uuid.uuid4()}_{file_name}")
-                        with open(temp_file_path, 'wb') as f:
-                            f.write(file_info.content)
-                        file_paths.append(temp_file_path)
-                        file_names.append(file_name)
-            else:  # Single file
-                if isinstance(uploaded_files, str):
-                    file_name = os.path.basename(uploaded_files)
-                    local_path = await q.site.download(uploaded_files, tempfile.gettempdir())
-                    if local_path:
-                        file_paths.append(local_path)
-                        file_names.append(file_name)
-                else:
-                    file_name = uploaded_files.name
-                    temp_file_path = os.path.join(tempfile.gettempdir(), f"{uuid.uuid4()}_{file_name}")
-                    with open(temp_file_path, 'wb') as f:
-                        f.write(uploaded_files.content)
-                    file_paths.append(temp_file_path)
+            if not isinstance(uploaded_files, list):  # Single file
+                uploaded_files = [uploaded_files]
+
+            # Fetch all files from Wave concurrently; downloads stream straight to disk
+            with span('wave_download') as tags:
+                results = await spool_uploads(q, uploaded_files)
+                tags.update(file_tags([local_path for local_path, _ in results]))
+            for local_path, file_name in results:
+                if local_path:
+                    file_paths.append(local_path)
                     file_names.append(file_name)
+            logger.info(f"Spool usage: {upload_spool.usage()}")
                 
             if not file_paths:
                 q.page['notification'] = ui.form_card(
@@ -346,56 +1358,17 @@ async def serve(q: Q):
 
             logger.info(f"Processing {len(file_paths)} files: {file_names}")
 
-            # Analyze all documents together
-            analysis = analyze_uploaded_documents(file_paths)
-            
-            # Check if the analysis contains an error message
-            if analysis.startswith("Error:"):
-                q.page['notification'] = ui.form_card(
-                    box='1 7 12 1',
-                    items=[
-                        ui.message_bar(type='error', text=analysis)
-                    ]
-                )
+            # Analyze all documents together - queued on the scheduler so the event loop stays free
+            resources = {}
+            if not submit_job(q, analyze_uploaded_documents, file_paths, resources=resources):
                 await q.page.save()
                 return
+            q.client.job_task = asyncio.ensure_future(
+                finish_analysis(q, file_paths, file_names, resources, q.client.patient_id))
 
-            # Store in client session
-            q.client.file_paths = file_paths
-            q.client.file_names = file_names
-            q.client.analysis = analysis
-
-            # Show success notification
-            uploaded_list = '\n'.join([f"- {name}" for name in file_names])
-            q.page['notification'] = ui.form_card(
-                box='1 7 12 1',
-                items=[
-                    ui.message_bar(type='success', text=f'Successfully processed {len(file_names)} file(s)')
-                ]
-            )
-
-            # Show analysis results
-            q.page['analysis'] = ui.form_card(
-                box='1 8 12 6',
-                items=[
-                    ui.text_xl('Medical Analysis Results'),
-                    ui.text_l(f'Documents analyzed: {", ".join(file_names)}'),
-                    ui.textbox(
-                        name='analysis_text',
-                        label='AI-Generated Report (editable):',
-                        value=q.client.analysis,
-                        multiline=True,
-                        height='400px',
-                        spellcheck=True,
-                    ),
-                    ui.buttons([
-                        ui.button(name='regenerate_button', label='Regenerate Analysis'),
-                        ui.button(name='download_button', label='Download Report as PDF', primary=True),
-                        ui.button(name='new_upload_button', label='Upload New Documents')
-                    ])
-                ]
-            )
-
+        except SpoolQuotaError as e:
+            upload_spool.clear(q.client_id)
+            show_notification(q, 'error', str(e))
         except Exception as e:
             logger.error(f"File processing error: {str(e)}", exc_info=True)
             error_message = f"Error processing files: {str(e)}"
@@ -414,7 +1387,7 @@ async def serve(q: Q):
     if q.args.download_button:
         try:
             # Get the current analysis text (may have been edited by user)
-            analysis_content = q.args.analysis_text or q.client.analysis
+            analysis_content = q.args.analysis_text or q.client.draft or q.client.analysis
             file_names = q.client.file_names
             
             if not analysis_content or analysis_content.startswith("Error:"):
@@ -427,12 +1400,13 @@ async def serve(q: Q):
                 await q.page.save()
                 return
             
-            # Create PDF report
-            pdf_filename = create_pdf_report(analysis_content)
+            # Create PDF report - rendering is CPU-bound, so keep it off the event loop
+            pdf_filename = await q.run(create_pdf_report, analysis_content)
             
             if pdf_filename:
                 # Upload PDF to Wave server and provide download link
-                download_path, = await q.site.upload([pdf_filename])
+                with span('wave_upload_pdf'):
+                    download_path, = await q.site.upload([pdf_filename])
                 q.page['download'] = ui.form_card(
                     box='1 15 12 3',
                     items=[
@@ -442,10 +1416,7 @@ async def serve(q: Q):
                 )
                 
                 # Clean up temporary PDF file
-                try:
-                    os.remove(pdf_filename)
-                except:
-                    pass
+                shutil.rmtree(os.path.dirname(pdf_filename), ignore_errors=True)
             else:
                 q.page['download'] = ui.form_card(
                     box='1 15 12 1',
@@ -463,54 +1434,129 @@ async def serve(q: Q):
                 ]
             )
 
-    if q.args.regenerate_button:
-        if hasattr(q.client, 'file_paths') and q.client.file_paths:
-            # Show processing notification
-            q.page['notification'] = ui.form_card(
-                box='1 7 12 1',
-                items=[
-                    ui.message_bar(type='info', text='Regenerating analysis, please wait...')
-                ]
-            )
-            await q.page.save()
-            
-            try:
-                analysis = analyze_uploaded_documents(q.client.file_paths)
-                
-                # Check if the analysis contains an error message
-                if analysis.startswith("Error:"):
-                    q.page['notification'] = ui.form_card(
-                        box='1 7 12 1',
-                        items=[
-                            ui.message_bar(type='error', text=analysis)
-                        ]
-                    )
-                    await q.page.save()
-                    return
-                    
-                q.client.analysis = analysis
-                
-                # Update the analysis textbox
-                q.page['analysis'].items[2].value = analysis
-                
-                q.page['notification'] = ui.form_card(
-                    box='1 7 12 1',
-                    items=[
-                        ui.message_bar(type='success', text='Analysis regenerated successfully.')
-                    ]
-                )
-            except Exception as e:
-                logger.error(f"Regeneration error: {str(e)}")
-                q.page['notification'] = ui.form_card(
-                    box='1 7 12 1',
-                    items=[
-                        ui.message_bar(type='error', text=f'Failed to regenerate analysis: {str(e)}')
-                    ]
-                )
+    if q.args.regenerate_button and (q.client.gpte_resources or {}).get('expired'):
+        show_notification(q, 'warning', SESSION_EXPIRED)
+    elif q.args.regenerate_button:
+        # A restored session may have lost its files but can still re-ask its chat session
+        if q.client.file_paths or (q.client.gpte_resources or {}).get('chat_session_id'):
+            # Reuse the collection and chat session from the first analysis - no re-upload or re-ingest
+            if submit_job(q, regenerate_analysis, q.client.file_paths or [], q.client.gpte_resources or {}):
+                q.client.job_task = asyncio.ensure_future(finish_regeneration(q))
+
+    if q.args.add_documents_button and (q.client.gpte_resources or {}).get('expired'):
+        show_notification(q, 'warning', SESSION_EXPIRED)
+    elif q.args.add_documents_button:
+        q.page['add_documents'] = ui.form_card(
+            box='1 18 12 4',
+            items=[
+                ui.text_l('Add Documents'),
+                ui.file_upload(
+                    name='document_add',
+                    label='Select Files to Add',
+                    multiple=True,
+                    file_extensions=['pdf', 'jpg', 'jpeg', 'png', 'txt'],
+                    max_size=upload_spool.max_client_bytes / 1024 ** 2
+                ),
+                ui.text_xs('Only the new files are read. The report sections they affect are updated in place.')
+            ]
+        )
+
+    if q.args.document_add and q.client.job and not q.client.job.done:
+        show_notification(q, 'warning', 'An analysis is already in progress for this session.')
+    elif q.args.document_add:
+        try:
+            q.page.drop('add_documents')
+        except:
+            pass
+        results, queued = [], set()
+        try:
+            uploaded_files = q.args.document_add
+            if not isinstance(uploaded_files, list):
+                uploaded_files = [uploaded_files]
+            with span('wave_download') as tags:
+                results = await spool_uploads(q, uploaded_files)
+                results = [(local_path, file_name) for local_path, file_name in results if local_path]
+                tags.update(file_tags([local_path for local_path, _ in results]))
+            digests = await q.run(hash_files, [local_path for local_path, _ in results])
+
+            # Files already in the analysis (or picked twice) would only repeat what the report says
+            seen = set((q.client.gpte_resources or {}).get('digests') or ())
+            added = []
+            for (local_path, file_name), digest in zip(results, digests):
+                if digest not in seen:
+                    seen.add(digest)
+                    added.append((local_path, file_name, digest))
+
+            if not q.client.analysis:
+                show_notification(q, 'warning', 'Analyze some documents before adding more.')
+            elif (q.client.gpte_resources or {}).get('expired'):
+                show_notification(q, 'warning', SESSION_EXPIRED)
+            elif not added:
+                show_notification(q, 'warning', 'These files are already part of the analysis.')
+            else:
+                file_paths, file_names, digests = (list(column) for column in zip(*added))
+                logger.info(f"Adding {len(file_paths)} files: {file_names}")
+                if q.client.gpte_resources is None:
+                    q.client.gpte_resources = {}
+                report = q.args.analysis_text or q.client.draft or q.client.analysis
+                if submit_job(q, add_documents, file_paths, digests, report, q.client.gpte_resources):
+                    q.client.job_task = asyncio.ensure_future(finish_adding_documents(q, file_paths, file_names))
+                    queued = set(file_paths)
+        except SpoolQuotaError as e:
+            show_notification(q, 'error', str(e))
+        except Exception as e:
+            logger.error(f"Error adding files: {str(e)}", exc_info=True)
+            show_notification(q, 'error', f'Error adding files: {str(e)}')
+        finally:
+            # Rejected and duplicate files would otherwise sit in the spool against the quota
+            upload_spool.discard(q.client_id, [local_path for local_path, _ in results if local_path not in queued])
+
+    if q.args.confirm_patient:
+        try:
+            q.page.drop('past_reports')
+        except:
+            pass
+        if q.client.analysis_id:
+            await q.run(persist, analysis_store.set_patient, q.client.analysis_id, q.args.confirm_patient)
+            q.client.patient_id = q.args.confirm_patient
+            show_notification(q, 'success', f'Filed the analysis under patient {q.args.confirm_patient}')
+
+    if q.args.past_reports_button:
+        patient_id = (q.args.patient_id or '').strip()
+        if patient_id:
+            await show_past_reports(q, patient_id)
+        else:
+            show_notification(q, 'warning', 'Enter a patient ID to look up past reports.')
+
+    if q.args.open_past_report and q.client.job and not q.client.job.done:
+        show_notification(q, 'warning', 'An analysis is already in progress for this session.')
+    elif q.args.open_past_report:
+        try:
+            q.page.drop('past_reports')
+        except:
+            pass
+        record = await q.run(persist, copy_past_report, q.client_id, q.args.open_past_report)
+        if record:
+            # The past report replaces the current analysis, like a new upload would
+            release_gpte_resources(q.client_id, wait=False)
+            upload_spool.clear(q.client_id)
+            await clear_preview(q)
+            load_record(q, record)
+            show_notification(q, 'success', f'Opened a copy of the past report for patient {record["patient_id"]}')
+        else:
+            show_notification(q, 'error', 'That report could not be opened.')
+
+    if q.args.new_upload_button and q.client.job and not q.client.job.done:
+        # Clearing now would pull the files and GPTe resources out from under the running job
+        show_notification(q, 'warning', 'An analysis is in progress. Start over once it has finished.')
+    elif q.args.new_upload_button:
+        release_gpte_resources(q.client_id, wait=False)
+        await q.run(persist, analysis_store.clear_current, q.client_id)
+        upload_spool.clear(q.client_id)
 
-    if q.args.new_upload_button:
         # Clear client session data
-        for key in ['file_paths', 'file_names', 'analysis', 'file_content']:
+        for key in ['file_paths', 'file_names', 'analysis', 'draft', 'analysis_id', 'file_content', 'job',
+                    'gpte_resources', 'patient_id']:
             if hasattr(q.client, key):
                 delattr(q.client, key)
         
@@ -527,11 +1573,22 @@ async def serve(q: Q):
             q.page.drop('download')
         except:
             pass
+        try:
+            q.page.drop('add_documents')
+        except:
+            pass
+        try:
+            q.page.drop('past_reports')
+        except:
+            pass
+        await clear_preview(q)
         
         # Reset upload form
-        q.page['upload'].items[1].value = None
+        q.page['upload'].items[2].value = None
 
     await q.page.save()
 
+startup_times['import'] = time.monotonic() - _import_started
+
 if __name__ == '__main__':
     main()
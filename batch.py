@@ -0,0 +1,282 @@
+"""Headless batch mode: analyze every patient's reports under a directory or bucket.
+
+    python batch.py ./reports --output ./out
+    python batch.py s3://lab-reports/2024/ --output ./out --endpoint-url http://localhost:9000
+
+Files are grouped per patient (one sub-directory per patient, or a ``<patient>_``
+filename prefix for files at the top level), run through a bounded
+fetch -> analyze -> render pipeline, and written as ``<patient>.pdf`` alongside a
+``manifest.jsonl``. The manifest doubles as the checkpoint: rerunning the same
+command skips patients already finished with the same input files.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import (analysis_store, analyze_uploaded_documents, create_pdf_report, persist, release_gpte_resources,
+                 track_gpte_resources)
+
+logger = logging.getLogger('med-assist')
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.txt')
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+class PatientGroup:
+    def __init__(self, patient_id):
+        self.patient_id = patient_id
+        self.files = []  # (relative path, size, version) tuples
+
+    @property
+    def fingerprint(self):
+        """Changes whenever a file in the group is added, removed or modified"""
+        listing = '\n'.join(f'{path}|{size}|{version}' for path, size, version in sorted(self.files))
+        return hashlib.sha256(listing.encode()).hexdigest()
+
+
+def patient_for(relative_path):
+    parts = relative_path.replace('\\', '/').split('/')
+    if len(parts) > 1:
+        return parts[0]
+    stem = os.path.splitext(parts[0])[0]
+    return stem.split('_', 1)[0]
+
+
+def group_files(entries):
+    """Group (relative path, size, version) entries by patient"""
+    groups = {}
+    for path, size, version in entries:
+        if not path.lower().endswith(SUPPORTED_EXTENSIONS) or size == 0:
+            continue
+        patient_id = patient_for(path)
+        groups.setdefault(patient_id, PatientGroup(patient_id)).files.append((path, size, version))
+    return [groups[k] for k in sorted(groups)]
+
+
+class LocalSource:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def list(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                full_path = os.path.join(dirpath, name)
+                stat = os.stat(full_path)
+                yield os.path.relpath(full_path, self.root), stat.st_size, int(stat.st_mtime)
+
+    def fetch(self, relative_path, work_dir):
+        # Local files are read in place
+        return os.path.join(self.root, relative_path)
+
+
+class S3Source:
+    """S3-compatible bucket; point ``endpoint_url`` at MinIO or another stand-in for local runs"""
+
+    def __init__(self, url, endpoint_url=None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("boto3 is required for s3:// sources (pip install boto3)")
+        bucket, _, prefix = url[len('s3://'):].partition('/')
+        self.bucket = bucket
+        self.prefix = prefix
+        self._s3 = boto3.client('s3', endpoint_url=endpoint_url)
+
+    def list(self):
+        paginator = self._s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get('Contents', []):
+                yield obj['Key'][len(self.prefix):].lstrip('/'), obj['Size'], obj['ETag'].strip('"')
+
+    def fetch(self, relative_path, work_dir):
+        key = f"{self.prefix.rstrip('/')}/{relative_path}" if self.prefix else relative_path
+        local_path = os.path.join(work_dir, relative_path.replace('/', '_'))
+        self._s3.download_file(self.bucket, key, local_path)
+        return local_path
+
+
+def open_source(source, endpoint_url=None):
+    if source.startswith('s3://'):
+        return S3Source(source, endpoint_url=endpoint_url)
+    return LocalSource(source)
+
+
+class Manifest:
+    """Append-only JSONL record of finished patients, used to resume interrupted runs"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.completed = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn write from an interrupted run
+                    if record.get('status') == 'done':
+                        self.completed[record['patient_id']] = record['fingerprint']
+
+    def is_done(self, group):
+        return self.completed.get(group.patient_id) == group.fingerprint
+
+    def record(self, group, status, pdf=None, error=None, timings=None):
+        record = {
+            'patient_id': group.patient_id,
+            'fingerprint': group.fingerprint,
+            'files': [path for path, _, _ in group.files],
+            'status': status,
+            'pdf': pdf,
+            'error': error,
+            'timings': timings or {},
+            'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            if status == 'done':
+                self.completed[group.patient_id] = group.fingerprint
+
+
+class BatchRunner:
+    """Bounded fetch -> analyze -> render pipeline over patient groups.
+
+    Each stage has its own worker pool, so slow GPTe analyses overlap with fetching
+    the next patients' files and rendering finished reports. Upload, ingest and query
+    all happen inside the analyze stage via analyze_uploaded_documents.
+    """
+
+    def __init__(self, source, output_dir, fetch_workers=4, analyze_workers=4, render_workers=2):
+        self.source = source
+        self.output_dir = output_dir
+        self.manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME))
+        self._fetch_pool = ThreadPoolExecutor(fetch_workers, thread_name_prefix='fetch')
+        self._analyze_pool = ThreadPoolExecutor(analyze_workers, thread_name_prefix='analyze')
+        self._render_pool = ThreadPoolExecutor(render_workers, thread_name_prefix='render')
+        self._slots = threading.Semaphore(fetch_workers + analyze_workers + render_workers)
+        self._outstanding = 0
+        self._idle = threading.Condition()
+        self.counts = {'done': 0, 'failed': 0, 'skipped': 0}
+
+    def run(self):
+        groups = group_files(self.source.list())
+        logger.info(f"Found {len(groups)} patient groups")
+        try:
+            for group in groups:
+                if self.manifest.is_done(group):
+                    self._count('skipped')
+                    continue
+                # Don't read ahead more groups than the pipeline can hold
+                self._slots.acquire()
+                with self._idle:
+                    self._outstanding += 1
+                self._fetch_pool.submit(self._fetch, group)
+            with self._idle:
+                self._idle.wait_for(lambda: self._outstanding == 0)
+        finally:
+            for pool in (self._fetch_pool, self._analyze_pool, self._render_pool):
+                pool.shutdown(wait=True, cancel_futures=True)
+        return self.counts
+
+    def _fetch(self, group):
+        timings = {}
+        try:
+            start = time.monotonic()
+            work_dir = tempfile.mkdtemp(prefix=f'med_batch_{group.patient_id}_')
+            paths = [self.source.fetch(path, work_dir) for path, _, _ in group.files]
+            timings['fetch'] = time.monotonic() - start
+            self._analyze_pool.submit(self._analyze, group, paths, work_dir, timings)
+        except Exception as e:
+            self._fail(group, 'fetch', e, timings)
+
+    def _analyze(self, group, paths, work_dir, timings):
+        try:
+            start = time.monotonic()
+            resources = {}
+            analysis = analyze_uploaded_documents(paths, resources=resources)
+            timings['analyze'] = time.monotonic() - start
+            # Nobody will regenerate a batch report - drop its chat session right away
+            owner = f'batch:{group.patient_id}'
+            track_gpte_resources(owner, resources)
+            release_gpte_resources(owner)
+            if analysis.startswith('Error'):
+                raise RuntimeError(analysis)
+            if resources.get('degraded'):
+                # Lab checks only - leave the patient to be retried by the next run
+                raise RuntimeError('GPTe analysis failed, only the lab checks were available')
+            # Indexed by patient so past reports can be looked up without rerunning the batch
+            persist(analysis_store.save_analysis, owner, analysis, [path for path, _, _ in group.files],
+                    submission_key=resources.get('submission_key'), patient_id=group.patient_id)
+            self._render_pool.submit(self._render, group, analysis, timings)
+        except Exception as e:
+            self._fail(group, 'analyze', e, timings)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _render(self, group, analysis, timings):
+        try:
+            start = time.monotonic()
+            pdf_path = os.path.join(self.output_dir, f'{group.patient_id}.pdf')
+            create_pdf_report(analysis, pdf_path)
+            timings['render'] = time.monotonic() - start
+            self.manifest.record(group, 'done', pdf=os.path.basename(pdf_path), timings=timings)
+            self._count('done')
+            logger.info(f"Finished patient {group.patient_id}")
+            self._release()
+        except Exception as e:
+            self._fail(group, 'render', e, timings)
+
+    def _fail(self, group, stage, error, timings):
+        logger.error(f"Patient {group.patient_id} failed in {stage}: {str(error)}")
+        self.manifest.record(group, 'failed', error=f'{stage}: {str(error)}', timings=timings)
+        self._count('failed')
+        self._release()
+
+    def _count(self, status):
+        # Render and analyze threads finish groups concurrently
+        with self._idle:
+            self.counts[status] += 1
+
+    def _release(self):
+        self._slots.release()
+        with self._idle:
+            self._outstanding -= 1
+            self._idle.notify_all()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Batch-analyze lab reports into PDF summaries')
+    parser.add_argument('source', help='Local directory or s3://bucket/prefix')
+    parser.add_argument('--output', required=True, help='Directory for PDFs and manifest.jsonl')
+    parser.add_argument('--endpoint-url', help='S3-compatible endpoint, e.g. a local MinIO')
+    parser.add_argument('--fetch-workers', type=int, default=4)
+    parser.add_argument('--analyze-workers', type=int, default=4)
+    parser.add_argument('--render-workers', type=int, default=2)
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output, exist_ok=True)
+    runner = BatchRunner(
+        open_source(args.source, endpoint_url=args.endpoint_url),
+        args.output,
+        fetch_workers=args.fetch_workers,
+        analyze_workers=args.analyze_workers,
+        render_workers=args.render_workers,
+    )
+    counts = runner.run()
+    logger.info(f"Batch finished: {counts['done']} done, {counts['failed']} failed, {counts['skipped']} already done")
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""Load test for the Med Assist flow against a local stand-in GPTe backend.
+
+    python -m bench.benchmark --clients 20 --iterations 3 --output bench_results.json
+    python -m bench.benchmark --clients 20 --compare bench_results.json
+
+Each simulated Wave client goes upload -> analyze -> regenerate -> (add documents ->) download using
+the same scheduler, spool, GPTe pool and PDF renderer the app handlers use. The
+run reports p50/p95/p99 latency per stage, end-to-end throughput and peak RSS,
+and writes them as JSON so runs can be compared across versions.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.fake_gpte import FakeGPTeServer, FakeH2OGPTE, make_documents
+
+STAGES = ['upload', 'queue_wait', 'analyze', 'time_to_first_token', 'regenerate', 'add_documents', 'download', 'flow']
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def summarize(samples):
+    return {
+        'count': len(samples),
+        'mean': sum(samples) / len(samples) if samples else None,
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+        'max': max(samples) if samples else None,
+    }
+
+
+def peak_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux and bytes on macOS
+    return usage / 1024 ** 2 if sys.platform == 'darwin' else usage / 1024
+
+
+def git_version():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+def measure_import_time(env):
+    """Seconds to import the app in a fresh interpreter, i.e. a worker's cold start"""
+    code = 'import time; start = time.monotonic(); import app; print(time.monotonic() - start)'
+    try:
+        output = subprocess.check_output([sys.executable, '-c', code], env=env, stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        return float(output.decode().strip().splitlines()[-1])
+    except Exception:
+        return None
+
+
+async def wait_for(job):
+    # Poll like track_job does in the app
+    while not job.done:
+        await asyncio.sleep(0.01)
+    if job.error:
+        raise job.error
+    if isinstance(job.result, str) and job.result.startswith('Error'):
+        raise RuntimeError(job.result)
+    return job.result
+
+
+async def spool_documents(app, client_id, documents):
+    # Wave -> spool, as spool_upload does for each file
+    loop = asyncio.get_running_loop()
+    paths = []
+    for document in documents:
+        path = app.upload_spool.new_path(client_id, os.path.basename(document))
+        await loop.run_in_executor(None, shutil.copyfile, document, path)
+        app.upload_spool.admit(client_id, path)
+        paths.append(path)
+    return paths
+
+
+async def simulate_client(app, client_id, documents, iterations, samples, errors, extra_documents=()):
+    loop = asyncio.get_running_loop()
+    for _ in range(iterations):
+        flow_start = time.monotonic()
+        try:
+            start = time.monotonic()
+            paths = await spool_documents(app, client_id, documents)
+            samples['upload'].append(time.monotonic() - start)
+
+            resources = {}
+            job = app.scheduler.submit(app.analyze_uploaded_documents, paths, resources=resources)
+            await wait_for(job)
+            samples['queue_wait'].append(job.started_at - job.submitted_at)
+            samples['analyze'].append(job.finished_at - job.submitted_at)
+            if 'time_to_first_token' in resources:
+                samples['time_to_first_token'].append(resources['time_to_first_token'])
+            app.track_gpte_resources(client_id, resources)
+            analysis_id = app.save_analysis(client_id, job.result, [os.path.basename(p) for p in paths], paths,
+                                            resources)
+
+            start = time.monotonic()
+            analysis = await wait_for(app.scheduler.submit(app.regenerate_analysis, paths, resources))
+            samples['regenerate'].append(time.monotonic() - start)
+            await loop.run_in_executor(None, app.persist, app.analysis_store.update_analysis, analysis_id, analysis,
+                                       resources)
+
+            if extra_documents:
+                start = time.monotonic()
+                added = await spool_documents(app, client_id, extra_documents)
+                digests = await loop.run_in_executor(None, app.hash_files, added)
+                analysis = await wait_for(app.scheduler.submit(app.add_documents, added, digests, analysis, resources))
+                samples['add_documents'].append(time.monotonic() - start)
+
+            start = time.monotonic()
+            pdf_path = await loop.run_in_executor(None, app.create_pdf_report, analysis)
+            shutil.rmtree(os.path.dirname(pdf_path), ignore_errors=True)
+            samples['download'].append(time.monotonic() - start)
+
+            samples['flow'].append(time.monotonic() - flow_start)
+        except Exception as e:
+            errors.append(f'{client_id}: {str(e)}')
+        finally:
+            await loop.run_in_executor(None, app.release_gpte_resources, client_id)
+            app.upload_spool.clear(client_id)
+
+
+async def run_clients(app, args, work_dir):
+    samples = {stage: [] for stage in STAGES}
+    errors = []
+    clients = []
+    for i in range(args.clients):
+        documents = make_documents(os.path.join(work_dir, f'client_{i}'), args.files, args.file_size,
+                                   unique=not args.repeat_files)
+        extra_documents = make_documents(os.path.join(work_dir, f'client_{i}_added'), args.add_files, args.file_size,
+                                         unique=not args.repeat_files) if args.add_files else ()
+        clients.append(simulate_client(app, f'bench-client-{i}', documents, args.iterations, samples, errors,
+                                       extra_documents))
+    start = time.monotonic()
+    await asyncio.gather(*clients)
+    return samples, errors, time.monotonic() - start
+
+
+def print_report(results, baseline=None):
+    print(f"{'stage':<22}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}" + (f"{'p95 vs base':>14}" if baseline else ''))
+    for stage, stats in results['stages'].items():
+        if not stats['count']:
+            continue
+        line = f"{stage:<22}{stats['count']:>7}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['p99']:>10.3f}"
+        base = (baseline or {}).get('stages', {}).get(stage)
+        if base and base.get('p95'):
+            line += f"{(stats['p95'] / base['p95'] - 1) * 100:>+13.1f}%"
+        print(line)
+    print(f"throughput: {results['throughput']:.2f} flows/s, peak RSS: {results['peak_rss_mb']:.1f} MB, "
+          f"errors: {len(results['errors'])}")
+    startup = results.get('startup', {})
+    print(f"startup: import {_seconds(startup.get('import'))}, warm-up {_seconds(startup.get('warm_up'))}")
+    if baseline:
+        print(f"baseline ({baseline.get('version')}): {baseline['throughput']:.2f} flows/s, "
+              f"peak RSS {baseline['peak_rss_mb']:.1f} MB, import {_seconds(baseline.get('import_time'))}")
+
+
+def _seconds(value):
+    return 'n/a' if value is None else f'{value:.2f}s'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark Med Assist against a local fake GPTe backend')
+    parser.add_argument('--clients', type=int, default=10, help='Concurrent simulated Wave clients')
+    parser.add_argument('--iterations', type=int, default=2, help='Flows per client')
+    parser.add_argument('--files', type=int, default=3, help='Documents per submission')
+    parser.add_argument('--file-size', type=int, default=64, help='Document size in KB')
+    parser.add_argument('--add-files', type=int, default=0,
+                        help='Documents added to each analysis afterwards (exercises Add Documents)')
+    parser.add_argument('--repeat-files', action='store_true', help='Reuse identical documents (exercises the cache)')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent analyses (MED_ASSIST_MAX_CONCURRENT_ANALYSES)')
+    parser.add_argument('--upload-latency', type=float, default=0.02)
+    parser.add_argument('--upload-bandwidth', type=float, default=50.0, help='MB/s')
+    parser.add_argument('--ingest-latency', type=float, default=0.5, help='Seconds per document')
+    parser.add_argument('--ingest-workers', type=int, default=4)
+    parser.add_argument('--query-latency', type=float, default=1.0, help='Seconds to first token')
+    parser.add_argument('--tokens', type=int, default=200)
+    parser.add_argument('--token-interval', type=float, default=0.005)
+    parser.add_argument('--llm-workers', type=int, default=8)
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Share of backend calls that fail with a dropped connection')
+    parser.add_argument('--no-stream', action='store_true', help='Disable token streaming')
+    parser.add_argument('--no-local-extraction', action='store_true',
+                        help='Send text documents through upload and ingest instead of reading them locally')
+    parser.add_argument('--map-reduce-min-documents', type=int,
+                        help='Documents per submission that switch on map-reduce analysis (0 disables it)')
+    parser.add_argument('--reuse-reports', action='store_true',
+                        help='Answer repeat submissions from the analysis store instead of re-analyzing')
+    parser.add_argument('--output', help='Write results JSON here')
+    parser.add_argument('--compare', help='Baseline results JSON to compare against')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='med_bench_')
+    # The app reads these at import time
+    os.environ['MED_ASSIST_MAX_CONCURRENT_ANALYSES'] = str(args.workers)
+    os.environ['MED_ASSIST_MAX_QUEUED_ANALYSES'] = str(max(50, args.clients * 2))
+    os.environ['MED_ASSIST_SPOOL_DIR'] = os.path.join(work_dir, 'spool')
+    os.environ['MED_ASSIST_STREAM_ANALYSIS'] = '0' if args.no_stream else '1'
+    os.environ['MED_ASSIST_LOCAL_EXTRACTION'] = '0' if args.no_local_extraction else '1'
+    os.environ['MED_ASSIST_STORE'] = os.path.join(work_dir, 'store.db')
+    os.environ['MED_ASSIST_REUSE_PAST_REPORTS'] = '1' if args.reuse_reports else '0'
+    if args.map_reduce_min_documents is not None:
+        os.environ['MED_ASSIST_MAP_REDUCE_MIN_DOCUMENTS'] = str(args.map_reduce_min_documents)
+
+    import_time = measure_import_time(dict(os.environ))
+    import app
+    from gpte_client import GPTeClientPool
+
+    logging.getLogger('med-assist').setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+
+    server = FakeGPTeServer(
+        upload_latency=args.upload_latency,
+        upload_bandwidth=args.upload_bandwidth * 1024 ** 2,
+        ingest_latency=args.ingest_latency,
+        ingest_workers=args.ingest_workers,
+        query_latency=args.query_latency,
+        tokens=args.tokens,
+        token_interval=args.token_interval,
+        llm_workers=args.llm_workers,
+        failure_rate=args.failure_rate,
+    )
+    FakeH2OGPTE.server = server
+    app.gpte_pool = GPTeClientPool('http://fake-gpte', 'fake', size=args.workers, client_factory=FakeH2OGPTE,
+                                  guard=app.gpte_guard)
+    app.warm_up()
+
+    try:
+        samples, errors, wall_time = asyncio.run(run_clients(app, args, work_dir))
+    finally:
+        app.scheduler.shutdown(wait=False)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        'version': git_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': vars(args),
+        'wall_time': wall_time,
+        'throughput': len(samples['flow']) / wall_time if wall_time else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+        'import_time': import_time,
+        'startup': {'import': import_time, 'warm_up': app.startup_times.get('warm_up')},
+        'stages': {stage: summarize(values) for stage, values in samples.items()},
+        'backend_calls': server.calls,
+        'errors': errors,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""Local stand-in for the GPTe backend, used by the benchmark.
+
+``FakeGPTeServer`` simulates the server side: per-operation latencies with jitter,
+upload bandwidth, limited ingest/LLM capacity shared by all clients, and
+optionally a share of calls that fail with a dropped connection.
+``FakeH2OGPTE`` exposes the subset of the H2OGPTE SDK that Med Assist calls, so
+it can be handed to GPTeClientPool as its ``client_factory``.
+"""
+import itertools
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from h2ogpte.types import ChatMessage, PartialChatMessage
+
+SAMPLE_REPLY = """## Overview ##
+Your blood count is mostly normal. Your **cholesterol** is a little high and worth discussing with your doctor.
+## Key Findings ##
+**LDL cholesterol** is 162 mg/dL, above the recommended 100 mg/dL.
+## Abnormal Results ##
+**LDL** 162 mg/dL (reference < 100) - raises long-term heart risk.
+## Normal Results ##
+**Hemoglobin** 14.1 g/dL, **White cells** 6.2 x10^9/L, **Glucose** 92 mg/dL.
+## Medical Terms Explained ##
+**LDL**: the "bad" cholesterol that can build up in blood vessels.
+## Recommended Next Steps ##
+Repeat a fasting lipid panel in 3 months and review diet and exercise.
+"""
+
+
+class FakeGPTeServer:
+    """Shared simulated backend state and capacity"""
+
+    def __init__(self, connect_latency=0.05, upload_latency=0.02, upload_bandwidth=50 * 1024 ** 2,
+                 ingest_latency=0.5, ingest_workers=4, query_latency=1.0, tokens=200, token_interval=0.005,
+                 llm_workers=8, jitter=0.1, failure_rate=0.0):
+        self.connect_latency = connect_latency
+        self.upload_latency = upload_latency
+        self.upload_bandwidth = upload_bandwidth
+        self.ingest_latency = ingest_latency
+        self.query_latency = query_latency
+        self.tokens = tokens
+        self.token_interval = token_interval
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._ingest_slots = threading.Semaphore(ingest_workers)
+        self._llm_slots = threading.Semaphore(llm_workers)
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.collections = {}
+        self.uploads = {}
+        self.chat_sessions = {}
+        self.calls = {}
+
+    def new_id(self, kind):
+        return f'{kind}-{next(self._ids)}'
+
+    def delay(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def count(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ConnectionError(f"Fake GPTe dropped the {name} call")
+
+
+class FakeH2OGPTE:
+    """Drop-in for the parts of h2ogpte.H2OGPTE used by the app"""
+
+    server = None  # set by the benchmark before the pool connects
+
+    def __init__(self, address=None, api_key=None, verify=True, server=None):
+        self._server = server or FakeH2OGPTE.server
+        self._server.count('connect')
+        self._server.delay(self._server.connect_latency)
+
+    def get_meta(self):
+        self._server.count('get_meta')
+        return SimpleNamespace(version='fake')
+
+    def create_collection(self, name, description, **kwargs):
+        server = self._server
+        server.count('create_collection')
+        collection_id = server.new_id('collection')
+        now = datetime.now(timezone.utc)
+        server.collections[collection_id] = SimpleNamespace(
+            id=collection_id, name=name, description=description, documents=[], created_at=now, updated_at=now)
+        return collection_id
+
+    def get_collection(self, collection_id):
+        self._server.count('get_collection')
+        if collection_id not in self._server.collections:
+            raise KeyError(f'Collection {collection_id} not found')
+        return self._server.collections[collection_id]
+
+    def list_recent_collections(self, offset, limit, current_user_only=False):
+        collections = sorted(self._server.collections.values(), key=lambda c: c.updated_at, reverse=True)
+        return collections[offset:offset + limit]
+
+    def upload(self, file_name, file):
+        server = self._server
+        server.count('upload')
+        size = 0
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            size += len(chunk)
+        server.delay(server.upload_latency + size / server.upload_bandwidth)
+        upload_id = server.new_id('upload')
+        server.uploads[upload_id] = (file_name, size)
+        return upload_id
+
+    def ingest_uploads(self, collection_id, upload_ids, **kwargs):
+        server = self._server
+        server.count('ingest_uploads')
+        # Ingest capacity is shared by every client, like the real OCR/embedding workers
+        with server._ingest_slots:
+            for upload_id in upload_ids:
+                server.delay(server.ingest_latency)
+                file_name, size = server.uploads.pop(upload_id)
+                server.collections[collection_id].documents.append(SimpleNamespace(
+                    id=server.new_id('document'), name=file_name, size=size, page_count=1, metadata_dict={}))
+        return SimpleNamespace(id=server.new_id('job'), failed=False)
+
+    def list_documents_in_collection(self, collection_id, offset, limit, metadata_filter={}):
+        self._server.count('list_documents_in_collection')
+        return self.get_collection(collection_id).documents[offset:offset + limit]
+
+    def update_document_metadata(self, document_id, document_metadata):
+        self._server.count('update_document_metadata')
+        for collection in list(self._server.collections.values()):
+            for document in collection.documents:
+                if document.id == document_id:
+                    document.metadata_dict = dict(document_metadata)  # Replaced, as by the SDK
+        return document_id
+
+    def answer_question(self, question, text_context_list=None, llm_args=None, **kwargs):
+        server = self._server
+        server.count('answer_question')
+        with server._llm_slots:
+            server.delay(server.query_latency + server.tokens * server.token_interval)
+        return SimpleNamespace(content=SAMPLE_REPLY, error='')
+
+    def create_chat_session(self, collection_id=None):
+        server = self._server
+        server.count('create_chat_session')
+        chat_session_id = server.new_id('chat')
+        server.chat_sessions[chat_session_id] = collection_id
+        return chat_session_id
+
+    def connect(self, chat_session_id, **kwargs):
+        if chat_session_id not in self._server.chat_sessions:
+            raise KeyError(f'Chat session {chat_session_id} not found')
+        return FakeSession(self._server, chat_session_id)
+
+    def delete_collections(self, collection_ids, timeout=None):
+        self._server.count('delete_collections')
+        for collection_id in collection_ids:
+            self._server.collections.pop(collection_id, None)
+        return SimpleNamespace(id=self._server.new_id('job'), failed=False)
+
+    def delete_chat_sessions(self, chat_session_ids, timeout=None):
+        self._server.count('delete_chat_sessions')
+        for chat_session_id in chat_session_ids:
+            self._server.chat_sessions.pop(chat_session_id, None)
+        return SimpleNamespace(id=self._server.new_id('job'), failed=False)
+
+
+class FakeSession:
+    def __init__(self, server, chat_session_id):
+        self._server = server
+        self._chat_session_id = chat_session_id
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def query(self, message, callback=None, **kwargs):
+        server = self._server
+        server.count('query')
+        words = SAMPLE_REPLY.split(' ')
+        # Stretch the canned reply to the configured token count
+        tokens = (words * (server.tokens // len(words) + 1))[:server.tokens] if server.tokens > len(words) else words
+        message_id = server.new_id('message')
+        with server._llm_slots:
+            server.delay(server.query_latency)
+            for i, token in enumerate(tokens):
+                if callback:
+                    callback(PartialChatMessage(id=message_id, content=token + (' ' if i < len(tokens) - 1 else '')))
+                server.delay(server.token_interval)
+        content = ' '.join(tokens)
+        reply = ChatMessage(id=message_id, content=content, votes=0, created_at=datetime.now())
+        if callback:
+            callback(reply)
+        return reply
+
+
+def make_documents(directory, count, size_kb, unique=True):
+    """Write ``count`` synthetic lab reports of about ``size_kb`` KB; returns their paths"""
+    os.makedirs(directory, exist_ok=True)
+    line = "Hemoglobin 14.1 g/dL 13.5-17.5 | LDL 162 mg/dL <100 | Glucose 92 mg/dL 70-99\n"
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f'lab_report_{i}.txt')
+        with open(path, 'w') as f:
+            if unique:
+                f.write(f'Report {os.path.basename(directory)}-{i}-{random.random()}\n')
+            f.write(line * max(1, size_kb * 1024 // len(line)))
+        paths.append(path)
+    return paths
@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger('med-assist')
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(file_path):
+    """SHA-256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def submission_key(digests):
+    """Order-independent key for a set of file digests"""
+    return hashlib.sha256('\n'.join(sorted(set(digests))).encode()).hexdigest()
+
+
+class CacheEntry:
+    def __init__(self, key, collection_id, upload_ids, digests, size_bytes):
+        self.key = key
+        self.collection_id = collection_id
+        self.upload_ids = upload_ids
+        self.digests = digests
+        self.size_bytes = size_bytes
+        self.created_at = time.time()
+        self.last_used = self.created_at
+
+
+class DocumentCache:
+    """Maps the content hash of an uploaded file set to its ingested GPTe collection.
+
+    Entries are evicted least-recently-used first once the entry count or total
+    cached bytes go over their limits, and on access once older than ``ttl``
+    seconds. Evicted collection ids are held until the caller collects them with
+    ``pop_evicted()`` and deletes them on the server.
+    """
+
+    def __init__(self, max_entries=200, max_bytes=2 * 1024 ** 3, ttl=24 * 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._evicted = []
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry.created_at > self.ttl:
+                self._evict(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            entry.last_used = time.time()
+            self.hits += 1
+            return entry
+
+    def put(self, key, collection_id, upload_ids, digests, size_bytes):
+        """Cache a collection; returns its entry, or the live one another job cached for ``key`` meanwhile"""
+        with self._lock:
+            if key in self._entries:
+                existing = self._entries[key]
+                if time.time() - existing.created_at <= self.ttl:
+                    # Evicting it would delete a collection the other job is still using
+                    self._entries.move_to_end(key)
+                    return existing
+                self._evict(key)
+            entry = CacheEntry(key, collection_id, upload_ids, digests, size_bytes)
+            self._entries[key] = entry
+            self._bytes += size_bytes
+            # Never evict the entry we just added, even if it alone is over the byte limit
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._evict(next(iter(self._entries)))
+            return entry
+
+    def invalidate(self, key):
+        """Forget an entry whose collection is known to be gone; it is not queued for deletion"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.size_bytes
+
+    def expire(self):
+        """Evict every entry past its TTL"""
+        now = time.time()
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if now - e.created_at > self.ttl]:
+                self._evict(key)
+
+    def pop_evicted(self):
+        """Collection ids evicted since the last call, for deletion on the server"""
+        with self._lock:
+            evicted, self._evicted = self._evicted, []
+            return evicted
+
+    def collection_ids(self):
+        with self._lock:
+            return {entry.collection_id for entry in self._entries.values()}
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+
+    def _evict(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size_bytes
+        self._evicted.append(entry.collection_id)
+        logger.info(f"Evicted cached collection {entry.collection_id}")
@@ -0,0 +1,86 @@
+import logging
+import os
+
+logger = logging.getLogger('med-assist')
+
+TEXT_EXTENSIONS = {'.txt'}
+PDF_EXTENSIONS = {'.pdf'}
+
+
+class LocalDocument:
+    def __init__(self, file_name, text, pages=1):
+        self.file_name = file_name
+        self.text = text
+        self.pages = pages
+
+
+def read_text_file(file_path):
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+
+def read_pdf_text(file_path, min_chars_per_page, max_pages):
+    """Text layer of a PDF, or None if it is missing, too thin to trust, or pypdf isn't installed"""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return None, 0
+
+    reader = PdfReader(file_path)
+    if reader.is_encrypted or len(reader.pages) > max_pages:
+        return None, len(reader.pages)
+    pages = []
+    for page in reader.pages:
+        text = (page.extract_text() or '').strip()
+        # A scanned page has no (or next to no) text layer - it needs OCR
+        if len(text) < min_chars_per_page:
+            return None, len(reader.pages)
+        pages.append(text)
+    return '\n\n'.join(pages), len(pages)
+
+
+def extract_document(file_path, min_chars_per_page=200, max_pages=50):
+    """Text of a file that doesn't need server-side OCR, or None if it does"""
+    ext = os.path.splitext(file_path)[1].lower()
+    file_name = os.path.basename(file_path)
+    try:
+        if ext in TEXT_EXTENSIONS:
+            text = read_text_file(file_path).strip()
+            return LocalDocument(file_name, text) if text else None
+        if ext in PDF_EXTENSIONS:
+            text, pages = read_pdf_text(file_path, min_chars_per_page, max_pages)
+            return LocalDocument(file_name, text, pages) if text else None
+    except Exception as e:
+        logger.info(f"Local extraction failed for {file_name}, using ingest: {str(e)}")
+    return None
+
+
+def extract_documents(file_paths, max_chars=100000, **kwargs):
+    """Locally extracted text for every file, or None if any of them needs the full ingest path
+
+    ``max_chars`` caps the combined text so it fits in the model's context alongside the prompt.
+    """
+    documents = []
+    total = 0
+    for file_path in file_paths:
+        document = extract_document(file_path, **kwargs)
+        if document is None:
+            return None
+        total += len(document.text)
+        if total > max_chars:
+            logger.info(f"Extracted text exceeds {max_chars} chars, using ingest")
+            return None
+        documents.append(document)
+    return documents
+
+
+def documents_prompt(prompt, documents):
+    """The analysis prompt followed by the extracted text of each document"""
+    parts = [prompt, 'The documents follow.']
+    for document in documents:
+        parts.append(f'--- Document: {document.file_name} ---\n{document.text}')
+    return '\n\n'.join(parts)
@@ -0,0 +1,193 @@
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import requests
+
+from resilience import GPTeUnavailable, GuardedClient
+
+logger = logging.getLogger('med-assist')
+
+UPLOAD_TIMEOUT = 7200.0
+# h2ogpte releases whose upload request upload_file was checked against (tests/test_gpte_client.py)
+STREAMING_UPLOAD_SDK = ('1.7.',)
+
+# Shared keep-alive session for file uploads; the SDK opens a new connection per upload
+_upload_http = requests.Session()
+
+
+class GPTeClientPool:
+    """Process-wide pool of authenticated H2OGPTE clients.
+
+    Each client keeps its own keep-alive HTTP connections, so handing the same
+    client to successive jobs skips the TLS handshake and auth round trip. A client
+    is lent to one job at a time; clients that sat idle are health-checked before
+    reuse and any client whose job raised is dropped and rebuilt on next demand.
+    With a ``guard`` (resilience.GPTeGuard), lent clients and new connections go
+    through its admission control, retries and circuit breaker.
+    """
+
+    def __init__(self, address, api_key, size=4, verify=False, health_check_after=60.0, client_factory=None,
+                 guard=None):
+        self.address = address
+        self.size = size
+        self._api_key = api_key
+        self._verify = verify
+        self._health_check_after = health_check_after
+        self._client_factory = client_factory
+        self.guard = guard
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []  # (client, last_used) pairs, most recently used last
+        self._lock = threading.Lock()
+        self.created = 0
+
+    @contextmanager
+    def client(self, timeout=None):
+        """Borrow a client for the duration of the block"""
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"No GPTe client became available within {timeout}s")
+        client = None
+        try:
+            client = self._checkout()
+            yield self.guard.wrap(client) if self.guard else client
+        except GPTeUnavailable:
+            raise  # Refused before reaching the server - the client is fine
+        except Exception:
+            # The connection may be what failed - don't hand this client out again
+            client = None
+            raise
+        finally:
+            if client is not None:
+                with self._lock:
+                    self._idle.append((client, time.monotonic()))
+            self._slots.release()
+
+    def warm(self, count=1):
+        """Pre-authenticate up to ``count`` idle clients"""
+        for _ in range(max(0, min(count, self.size) - len(self._idle))):
+            client = self._connect()
+            with self._lock:
+                self._idle.append((client, time.monotonic()))
+
+    def close(self):
+        with self._lock:
+            self._idle.clear()
+
+    def _checkout(self):
+        with self._lock:
+            entry = self._idle.pop() if self._idle else None
+        if entry is None:
+            return self._connect()
+
+        client, last_used = entry
+        if time.monotonic() - last_used > self._health_check_after:
+            try:
+                client.get_meta()
+            except Exception as e:
+                logger.info(f"Reconnecting stale GPTe client: {str(e)}")
+                return self._connect()
+        return client
+
+    def _connect(self):
+        start = time.monotonic()
+        factory = self._client_factory
+        if factory is None:
+            # The SDK takes seconds to import, so only load it once a client is needed
+            from h2ogpte import H2OGPTE
+            factory = H2OGPTE
+        # Use unverified connection
+        if self.guard:
+            client = self.guard.call('connect', factory, address=self.address, api_key=self._api_key,
+                                     verify=self._verify, retry=True)
+        else:
+            client = factory(address=self.address, api_key=self._api_key, verify=self._verify)
+        self.created += 1
+        logger.info(f"Connected GPTe client #{self.created} in {time.monotonic() - start:.2f}s")
+        return client
+
+
+class _MultipartFileBody:
+    """multipart/form-data body for the GPTe upload endpoint that reads the file from disk as it is sent"""
+
+    def __init__(self, file_name, file_path):
+        boundary = uuid.uuid4().hex
+        quoted_name = file_name.replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+        mtime = str(int(os.path.getmtime(file_path)) * 1000)
+        head = (f'--{boundary}\r\n'
+                f'Content-Disposition: form-data; name="file"; filename="{quoted_name}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n').encode()
+        tail = (f'\r\n--{boundary}\r\n'
+                f'Content-Disposition: form-data; name="mtime"\r\n\r\n{mtime}\r\n'
+                f'--{boundary}\r\n'
+                f'Content-Disposition: form-data; name="uri"\r\n\r\n\r\n'
+                f'--{boundary}--\r\n').encode()
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+        # requests reads .len for Content-Length and then streams via read()
+        self.len = len(head) + os.path.getsize(file_path) + len(tail)
+        self._parts = [io.BytesIO(head), open(file_path, 'rb'), io.BytesIO(tail)]
+
+    def read(self, size=-1):
+        chunks = []
+        while self._parts and (size < 0 or size > 0):
+            chunk = self._parts[0].read(size)
+            if not chunk:
+                self._parts.pop(0).close()
+                continue
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b''.join(chunks)
+
+    def close(self):
+        for part in self._parts:
+            part.close()
+        self._parts = []
+
+
+def upload_file(client, file_path, file_name=None):
+    """Upload a file from disk to GPTe without loading it into memory; returns the upload id
+
+    ``H2OGPTE.upload`` hands the file to ``requests`` as ``files=``, which builds the whole
+    multipart body in memory before sending, so a 200 MB scan costs 200 MB per upload.
+    For the SDK releases in ``STREAMING_UPLOAD_SDK``, the same PUT /rpc/fs request is sent
+    here with a body read from disk as it goes. That relies on the client's address,
+    auth header and error handling, which are private. Any other client or SDK release
+    goes through ``client.upload``.
+    """
+    file_name = file_name or os.path.basename(file_path)
+    if isinstance(client, GuardedClient):
+        # Guard the whole transfer once, whichever way it goes out
+        return client.guard.call('upload', upload_file, client.client, file_path, file_name, retry=True)
+    if not _streams_uploads(client):
+        with open(file_path, 'rb') as f:
+            return client.upload(file_name, f)
+
+    from h2ogpte.types import Identifier
+    body = _MultipartFileBody(file_name, file_path)
+    try:
+        res = _upload_http.put(
+            client._address + '/rpc/fs',
+            data=body,
+            headers={**client._get_auth_header(), 'Content-Type': body.content_type},
+            verify=client._verify,
+            timeout=UPLOAD_TIMEOUT,
+        )
+    finally:
+        body.close()
+    client._raise_error_if_any(res)
+    # Parsed the way H2OGPTE.upload parses it
+    upload = Identifier(**res.json())
+    if upload.error:
+        raise ValueError(upload.error)
+    return upload.id
+
+
+def _streams_uploads(client):
+    if type(client).__module__.split('.')[0] != 'h2ogpte':
+        return False
+    from h2ogpte import __version__
+    return __version__.startswith(STREAMING_UPLOAD_SDK)
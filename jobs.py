@@ -0,0 +1,134 @@
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('med-assist')
+
+
+class QueueFullError(Exception):
+    """Raised when the scheduler cannot accept more pending jobs."""
+
+
+class AnalysisJob:
+    """A unit of work tracked by the scheduler, with queue position and progress"""
+
+    def __init__(self, scheduler, func, args, kwargs):
+        self.id = str(uuid.uuid4())
+        self.status = 'queued'  # queued -> running -> done | failed
+        self.message = 'Waiting in queue'
+        self.progress = 0.0
+        self.partial = None  # output produced so far, for jobs that stream
+        self.result = None
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._scheduler = scheduler
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def position(self):
+        """1-based position in the FIFO queue, 0 once the job has started"""
+        return self._scheduler.position(self)
+
+    def report(self, message, fraction=None, partial=None):
+        """Progress callback handed to the job function"""
+        self.message = message
+        if fraction is not None:
+            self.progress = max(0.0, min(1.0, fraction))
+        if partial is not None:
+            self.partial = partial
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.result
+
+    def _run(self):
+        self._scheduler._start(self)
+        self.status = 'running'
+        self.started_at = time.monotonic()
+        try:
+            self.result = self._func(*self._args, progress=self.report, **self._kwargs)
+            self.status = 'done'
+            self.progress = 1.0
+        except Exception as e:
+            logger.error(f"Job {self.id} failed: {str(e)}", exc_info=True)
+            self.error = e
+            self.status = 'failed'
+        finally:
+            self.finished_at = time.monotonic()
+            self._scheduler._finish(self)
+            self._done.set()
+
+
+class AnalysisScheduler:
+    """Runs blocking analysis jobs on a bounded thread pool with a FIFO queue.
+
+    Job functions are called as ``func(*args, progress=callback, **kwargs)`` where
+    ``callback(message, fraction, partial=None)`` updates the job's progress and,
+    for streaming jobs, the output produced so far.
+    """
+
+    def __init__(self, max_workers=4, max_queue=50):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis')
+        self._pending = deque()
+        self._running = 0
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, func, *args, **kwargs):
+        with self._lock:
+            if len(self._pending) >= self.max_queue:
+                raise QueueFullError(f"Analysis queue is full ({self.max_queue} jobs waiting)")
+            job = AnalysisJob(self, func, args, kwargs)
+            self._pending.append(job)
+        # ThreadPoolExecutor hands work out in submission order, so it mirrors _pending
+        self._executor.submit(job._run)
+        logger.info(f"Queued job {job.id} (position {job.position})")
+        return job
+
+    def position(self, job):
+        with self._lock:
+            try:
+                return self._pending.index(job) + 1
+            except ValueError:
+                return 0
+
+    def stats(self):
+        with self._lock:
+            return {'running': self._running, 'queued': len(self._pending), 'workers': self.max_workers,
+                    'completed': self.completed, 'failed': self.failed}
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def _start(self, job):
+        with self._lock:
+            try:
+                self._pending.remove(job)
+            except ValueError:
+                pass
+            self._running += 1
+
+    def _finish(self, job):
+        with self._lock:
+            self._running -= 1
+            if job.status == 'done':
+                self.completed += 1
+            else:
+                self.failed += 1
+        logger.info(f"Job {job.id} {job.status} in {job.finished_at - job.started_at:.1f}s "
+                    f"(waited {job.started_at - job.submitted_at:.1f}s)")
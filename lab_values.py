@@ -0,0 +1,301 @@
+"""Local lab-value extraction and reference-range checks.
+
+Rows like ``LDL Cholesterol 162 mg/dL (<100)`` are parsed out of report text into
+a columnar ``LabTable``. Only rows naming a known analyte are kept; their values
+are converted to one unit per analyte, and every row is flagged low/normal/high in
+one vectorized pass - against the range printed on the report when there is one,
+else against ``REFERENCE_RANGES``. The flags go into the prompt as facts and make a
+fallback report when GPTe is unavailable; rows are always shown as printed.
+"""
+import logging
+import math
+import re
+
+logger = logging.getLogger('med-assist')
+
+INF = float('inf')
+
+# canonical name -> (display name, unit, low, high, aliases); adult ranges in conventional units. Where limits
+# differ by sex the range spans both, so only values outside it are certain to be abnormal
+REFERENCE_RANGES = {
+    'hemoglobin': ('Hemoglobin', 'g/dL', 12.0, 17.5, ['hemoglobin', 'haemoglobin', 'hgb', 'hb']),
+    'hematocrit': ('Hematocrit', '%', 36.0, 52.0, ['hematocrit', 'haematocrit', 'hct', 'pcv']),
+    'wbc': ('White blood cells', '10^9/L', 4.0, 11.0,
+            ['wbc', 'white blood cells', 'white blood cell count', 'white cells', 'leukocytes', 'total leucocyte count', 'tlc']),
+    'rbc': ('Red blood cells', '10^12/L', 4.2, 5.9, ['rbc', 'red blood cells', 'red blood cell count', 'erythrocytes']),
+    'platelets': ('Platelets', '10^9/L', 150.0, 450.0, ['platelets', 'platelet count', 'plt']),
+    'glucose': ('Glucose', 'mg/dL', 70.0, 99.0, ['glucose', 'fasting glucose', 'glucose fasting', 'fasting blood glucose', 'fasting blood sugar', 'fbs',
+             'fasting plasma glucose', 'fpg']),
+    'hba1c': ('HbA1c', '%', 4.0, 5.6, ['hba1c', 'a1c', 'hb a1c', 'hemoglobin a1c', 'haemoglobin a1c', 'glycated hemoglobin', 'glycated haemoglobin',
+               'glycosylated hemoglobin']),
+    'cholesterol': ('Total cholesterol', 'mg/dL', 0.0, 200.0, ['total cholesterol', 'cholesterol', 'cholesterol total', 'serum cholesterol']),
+    'ldl': ('LDL cholesterol', 'mg/dL', 0.0, 100.0, ['ldl', 'ldl cholesterol', 'ldl-c', 'ldl c', 'ldl cholesterol calculated', 'ldl calculated']),
+    'hdl': ('HDL cholesterol', 'mg/dL', 40.0, INF, ['hdl', 'hdl cholesterol', 'hdl-c', 'hdl c']),
+    'triglycerides': ('Triglycerides', 'mg/dL', 0.0, 150.0, ['triglycerides', 'triglyceride', 'tg']),
+    'creatinine': ('Creatinine', 'mg/dL', 0.6, 1.3, ['creatinine', 'serum creatinine']),
+    'urea': ('Blood urea nitrogen', 'mg/dL', 7.0, 20.0, ['bun', 'blood urea nitrogen', 'urea nitrogen']),
+    'egfr': ('eGFR', 'mL/min/1.73m2', 60.0, INF, ['egfr', 'estimated gfr']),
+    'sodium': ('Sodium', 'mmol/L', 135.0, 145.0, ['sodium', 'na']),
+    'potassium': ('Potassium', 'mmol/L', 3.5, 5.1, ['potassium', 'k']),
+    'chloride': ('Chloride', 'mmol/L', 98.0, 107.0, ['chloride', 'cl']),
+    'calcium': ('Calcium', 'mg/dL', 8.5, 10.5, ['calcium', 'ca', 'total calcium']),
+    'alt': ('ALT', 'U/L', 7.0, 56.0, ['alt', 'sgpt', 'alanine aminotransferase']),
+    'ast': ('AST', 'U/L', 10.0, 40.0, ['ast', 'sgot', 'aspartate aminotransferase']),
+    'alp': ('Alkaline phosphatase', 'U/L', 44.0, 147.0, ['alp', 'alkaline phosphatase']),
+    'bilirubin': ('Total bilirubin', 'mg/dL', 0.1, 1.2, ['bilirubin', 'total bilirubin', 'bilirubin total']),
+    'albumin': ('Albumin', 'g/dL', 3.5, 5.0, ['albumin', 'serum albumin']),
+    'tsh': ('TSH', 'mIU/L', 0.4, 4.0, ['tsh', 'thyroid stimulating hormone']),
+    'vitamin_d': ('Vitamin D', 'ng/mL', 30.0, 100.0,
+                  ['vitamin d', '25-oh vitamin d', '25(oh) vitamin d', '25-hydroxy vitamin d', '25 hydroxy vitamin d',
+                   'vitamin d 25-oh', 'vitamin d, 25-hydroxy', 'vitamin d 25-hydroxy', 'vitamin d total', '25(oh)d']),
+    'vitamin_b12': ('Vitamin B12', 'pg/mL', 200.0, 900.0, ['vitamin b12', 'b12', 'cobalamin']),
+    'ferritin': ('Ferritin', 'ng/mL', 20.0, 300.0, ['ferritin', 'serum ferritin']),
+    'crp': ('CRP', 'mg/L', 0.0, 5.0, ['crp', 'c-reactive protein', 'c reactive protein']),
+}
+
+# Spellings of the same unit, after lower-casing and dropping spaces
+UNIT_ALIASES = {
+    'mg/dl': 'mg/dL', 'g/dl': 'g/dL', 'g/l': 'g/L', 'mmol/l': 'mmol/L', 'umol/l': 'umol/L', 'mmol/mol': 'mmol/mol',
+    '%': '%', 'u/l': 'U/L', 'iu/l': 'U/L', 'ng/ml': 'ng/mL', 'ug/l': 'ng/mL', 'nmol/l': 'nmol/L',
+    'pg/ml': 'pg/mL', 'pmol/l': 'pmol/L', 'mg/l': 'mg/L', 'miu/l': 'mIU/L', 'uiu/ml': 'mIU/L', 'meq/l': 'mmol/L',
+    '10^9/l': '10^9/L', 'x10^9/l': '10^9/L', '10^3/ul': '10^9/L', 'x10^3/ul': '10^9/L', 'k/ul': '10^9/L',
+    '/nl': '10^9/L', '10^12/l': '10^12/L', 'x10^12/l': '10^12/L', '10^6/ul': '10^12/L', 'x10^6/ul': '10^12/L',
+    'm/ul': '10^12/L', 'ml/min/1.73m2': 'mL/min/1.73m2', 'ml/min': 'mL/min/1.73m2',
+}
+
+# (canonical analyte, unit) -> factor to the analyte's reference unit
+CONVERSIONS = {
+    ('hemoglobin', 'g/L'): 0.1,
+    ('albumin', 'g/L'): 0.1,
+    ('glucose', 'mmol/L'): 18.016,
+    ('cholesterol', 'mmol/L'): 38.67,
+    ('ldl', 'mmol/L'): 38.67,
+    ('hdl', 'mmol/L'): 38.67,
+    ('triglycerides', 'mmol/L'): 88.57,
+    ('urea', 'mmol/L'): 2.801,
+    ('calcium', 'mmol/L'): 4.008,
+    ('creatinine', 'umol/L'): 1 / 88.4,
+    ('bilirubin', 'umol/L'): 1 / 17.1,
+    ('vitamin_d', 'nmol/L'): 0.4006,
+    ('vitamin_b12', 'pmol/L'): 1.355,
+    ('crp', 'mg/dL'): 10.0,
+}
+
+
+
+def _key(name):
+    """Row names and aliases compared with case, punctuation and spacing ironed out"""
+    return ' '.join(re.sub(r"[-–,:()'.]", ' ', name.lower()).split())
+
+
+# Every spelling of each analyte; a row name must be one of these exactly
+_ALIASES = {_key(alias): name for name, (_, _, _, _, aliases) in REFERENCE_RANGES.items() for alias in aliases}
+# Words that make a row a different test from the analyte it names ("Urine Creatinine", "Non-HDL Cholesterol",
+# "Hemoglobin A1c", "Mean Corpuscular Hemoglobin", "LDL/HDL Ratio"), whose reference range would be wrong
+_MODIFIERS = re.compile(r'\b(?:non|ratio|index|urine|urinary|csf|fluid|stool|24 ?h(?:ou)?r|a1c|mean|corpuscular|'
+                        r'mch|mchc|mcv|free|ionized|ionised|direct|indirect|conjugated|unconjugated|random|post|'
+                        r'postprandial|pp)\b')
+
+_NUMBER = r'\d+(?:\.\d+)?'
+# The "25" of "25-OH vitamin D" is part of the name
+_HYDROXY = r'\d+\s*[-–(]?\s*(?:oh\b\)?|hydroxy)'
+_NAME = re.compile(rf"(?:{_HYDROXY}\s*)?[a-z][a-z0-9 ,'()./%^–-]{{0,60}}", re.I)
+# Where a value can start: not glued to a word ("B12", "T3") or another number
+_VALUE_START = re.compile(r'(?<![\w.^/])(?=(?:[<>]=?\s*)?\d)')
+_VALUE = re.compile(rf'''
+    (?P<qualifier>[<>]=?)?\s*(?P<value>{_NUMBER})(?![\d.])(?!\s*[-–(]?\s*(?:oh|hydroxy)\b|[-–]\s*[a-z])\s*
+    (?P<unit>x?\s*10\^\d+/[A-Za-z]+|[A-Za-zµμ%/][A-Za-z0-9µμ%/^.]*)?\s*
+    (?:\(?\s*(?:ref(?:erence)?\.?\s*(?:range|interval)?\s*:?\s*)?
+       (?:(?P<low>{_NUMBER})\s*(?:-|–|to)\s*(?P<high>{_NUMBER})|(?P<bound>[<>]=?)\s*(?P<limit>{_NUMBER}))
+    \s*\)?)?
+''', re.X | re.I)
+# Abnormal flags some systems print where the unit would go
+_FLAGS = {'h', 'l', 'hi', 'lo', 'high', 'low', 'n', 'normal', 'a', 'abn', 'abnormal', 'hh', 'll'}
+_SEPARATORS = re.compile(r'\s*(?:\||\t|;)\s*')
+
+
+def normalize_unit(unit):
+    if not unit:
+        return ''
+    key = unit.lower().replace(' ', '').replace('µ', 'u').replace('μ', 'u').replace('mcg', 'ug').replace('*', '')
+    return UNIT_ALIASES.get(key, unit)
+
+
+def match_analyte(name):
+    """Canonical analyte for a row name, or None unless the name is exactly one of its aliases"""
+    key = _key(name)
+    if key in _ALIASES:
+        return _ALIASES[key]
+    if _MODIFIERS.search(key):
+        return None
+    # "Hemoglobin (Hb)", "ALT (SGPT)"
+    return _ALIASES.get(_key(re.sub(r'\([^)]*\)', ' ', name)))
+
+
+def parse_row(text):
+    """(name, qualifier, value, unit, low, high) for one row, or None
+
+    The value is the first number that isn't part of the name: numbers glued to a
+    word ("Vitamin B12") or followed by "OH" ("25-OH", "25 OH"), stay in the name.
+    """
+    text = text.strip()
+    for start in _VALUE_START.finditer(text):
+        name = text[:start.start()].strip(' :=')
+        if not _NAME.fullmatch(name):
+            continue
+        match = _VALUE.match(text, start.start())
+        if not match:
+            continue
+        unit = match.group('unit') or ''
+        if unit.lower() in _FLAGS:
+            unit = ''
+        low = high = None
+        if match.group('low'):
+            low, high = float(match.group('low')), float(match.group('high'))
+        elif match.group('bound'):
+            limit = float(match.group('limit'))
+            low, high = (None, limit) if match.group('bound').startswith('<') else (limit, None)
+        return name, match.group('qualifier') or '', float(match.group('value')), unit, low, high
+    return None
+
+
+def parse_lines(text):
+    """Yield parsed rows from report text; a line may hold several rows separated by | ; or tabs"""
+    for line in text.splitlines():
+        if not any(c.isdigit() for c in line):
+            continue
+        rows = [row for row in map(parse_row, _SEPARATORS.split(line)) if row]
+        if not rows:
+            # A table row split into cells: "Hemoglobin | 14.1 | g/dL | 13.5-17.5"
+            row = parse_row(_SEPARATORS.sub(' ', line))
+            rows = [row] if row else []
+        yield from rows
+
+
+class LabTable:
+    """Lab rows stored column-wise, with values and ranges in each analyte's reference unit"""
+
+    COLUMNS = ('analyte', 'name', 'source', 'value', 'unit', 'qualifier', 'low', 'high', 'range_source',
+               'printed_value', 'printed_unit', 'printed_low', 'printed_high')
+
+    def __init__(self):
+        self.columns = {column: [] for column in self.COLUMNS}
+        self.flags = []
+        self._seen = set()
+
+    def __len__(self):
+        return len(self.columns['value'])
+
+    def add(self, source, name, qualifier, value, unit, low, high):
+        analyte = match_analyte(name)
+        if analyte is None:
+            return  # "Age 45 (18-60)", a sample ID, or a test we can't vouch for
+        unit = normalize_unit(unit)
+        printed = (value, unit, low, high)
+        range_source = 'document'
+        display, reference_unit, reference_low, reference_high, _ = REFERENCE_RANGES[analyte]
+        factor = 1.0 if unit in ('', reference_unit) else CONVERSIONS.get((analyte, unit))
+        if factor is not None:
+            # Compared on the reference table's scale; a printed range is in the printed unit
+            value *= factor
+            low = low * factor if low is not None else None
+            high = high * factor if high is not None else None
+            unit = reference_unit
+            if low is None and high is None:
+                low, high, range_source = reference_low, reference_high, 'reference'
+        if low is None and high is None:
+            return  # Nothing to compare against
+        key = (analyte, round(value, 4), unit)
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        row = (analyte, display, source, value, unit, qualifier,
+               -INF if low is None else low, INF if high is None else high, range_source) + printed
+        for column, item in zip(self.COLUMNS, row):
+            self.columns[column].append(item)
+
+    def flag(self):
+        """Flag every row 'low', 'high' or 'normal' in one pass"""
+        try:
+            import numpy as np
+        except ImportError:  # Fall back to a plain loop
+            np = None
+        if np is not None:
+            values = np.asarray(self.columns['value'], dtype=float)
+            low = np.asarray(self.columns['low'], dtype=float)
+            high = np.asarray(self.columns['high'], dtype=float)
+            self.flags = np.where(values < low, 'low', np.where(values > high, 'high', 'normal')).tolist()
+        else:
+            self.flags = ['low' if v < lo else 'high' if v > hi else 'normal'
+                          for v, lo, hi in zip(self.columns['value'], self.columns['low'], self.columns['high'])]
+        return self.flags
+
+    def rows(self):
+        for i in range(len(self)):
+            row = {column: self.columns[column][i] for column in self.COLUMNS}
+            row['flag'] = self.flags[i] if i < len(self.flags) else None
+            yield row
+
+    def abnormal(self):
+        return [row for row in self.rows() if row['flag'] in ('low', 'high')]
+
+    def normal(self):
+        return [row for row in self.rows() if row['flag'] == 'normal']
+
+
+def build_lab_table(documents):
+    """Parse, normalize and flag the lab rows in a list of ``extract.LocalDocument``"""
+    table = LabTable()
+    for document in documents:
+        for name, qualifier, value, unit, low, high in parse_lines(document.text):
+            table.add(document.file_name, name, qualifier, value, unit, low, high)
+    table.flag()
+    return table
+
+
+def _range(low, high, unit=''):
+    if low is None or math.isinf(low):
+        return f"< {high:.4g} {unit}".strip()
+    if high is None or math.isinf(high):
+        return f"> {low:.4g} {unit}".strip()
+    return f"{low:.4g}-{high:.4g} {unit}".strip()
+
+
+def describe(row):
+    """A row as printed on the report; a converted value only appears to explain a standard-range check"""
+    value = f"{row['qualifier']}{row['printed_value']:.4g} {row['printed_unit']}".strip()
+    if row['range_source'] == 'document':
+        return f"**{row['name']}** {value} (report reference {_range(row['printed_low'], row['printed_high'])})"
+    reference = f"standard adult range {_range(row['low'], row['high'], row['unit'])}"
+    if row['printed_unit'] not in ('', row['unit']):
+        reference = f"{row['value']:.4g} {row['unit']}; {reference}"
+    return f"**{row['name']}** {value} ({reference})"
+
+
+def factual(row):
+    """Whether a flag holds for any adult: a standard range spans both sexes, so only values outside it do"""
+    return row['range_source'] == 'document' or row['flag'] != 'normal'
+
+
+def lab_facts(table, limit=80):
+    """Prompt section listing the precomputed flags, or '' when there are none"""
+    rows = [row for row in table.abnormal() + table.normal() if factual(row)]
+    if not rows:
+        return ''
+    lines = ['Lab values were checked against reference ranges before this request. Treat these flags as facts '
+             'and use them for the Abnormal Results and Normal Results sections:']
+    for row in rows[:limit]:
+        lines.append(f"- {describe(row)}: {row['flag'].upper()} [{row['source']}]")
+    return '\n'.join(lines)
+
+
+def lab_sections(table):
+    """Abnormal/normal results as report markup, shown while the model works or if it fails"""
+    abnormal = table.abnormal()
+    normal = table.normal()
+    lines = ['## Abnormal Results ##']
+    lines += [f"{describe(row)} - {row['flag']}" for row in abnormal] or ['No values outside their reference range.']
+    lines.append('## Normal Results ##')
+    lines += [describe(row) if factual(row) else f"{describe(row)} - within the combined adult range; limits differ by sex"
+              for row in normal] or ['No values within range were found.']
+    return '\n'.join(lines)
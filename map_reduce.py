@@ -0,0 +1,106 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import span
+
+logger = logging.getLogger('med-assist')
+
+EXTRACTION_PROMPT = """Extract the clinically relevant content of the medical document "{name}" as compact notes for a later summary.
+
+            List every test or measurement with its value, unit, reference range and whether it is flagged as abnormal, plus any dates, diagnoses, medications and recommendations the document states.
+            Use one short line per item. Do not explain or interpret anything and do not add information that is not in the document.
+            """
+
+# Notes are merged without retrieval - the collection has already been read by the map step
+MERGE_QUERY_ARGS = {'rag_config': {'rag_type': 'llm_only'}}
+
+# Tags each collection document with its own id so a query can be filtered to it
+METADATA_KEY = 'med_assist_document'
+
+DELTA_PROMPT = """New documents have been added to a patient's medical report. Update the report so it also covers them.
+
+            Return only the sections whose content changes because of the new documents. Start each with its heading exactly as written in the current report (## Heading ##) and follow it with the complete new text of that section.
+            Keep the current wording wherever it is still accurate - the report may have been edited by the doctor. Use the same formatting as the report and do not repeat sections that stay the same.
+            If the new documents change nothing, reply with nothing.
+            """
+
+
+class DocumentPart:
+    """One document to extract notes from: local text, or a document in a collection"""
+
+    def __init__(self, name, pages=1, text=None, document_id=None, metadata=None):
+        self.name = name
+        self.pages = pages
+        self.text = text
+        self.document_id = document_id
+        self.metadata = metadata or {}  # The collection document's user metadata
+
+
+def should_map_reduce(parts, min_documents, min_pages):
+    """Whether a submission is big enough to analyze per document first; a threshold of 0 disables it"""
+    return bool((min_documents and len(parts) >= min_documents)
+                or (min_pages and sum(part.pages for part in parts) >= min_pages))
+
+
+def collection_parts(client, collection_id, page_size=100):
+    parts = []
+    while True:
+        page = client.list_documents_in_collection(collection_id, len(parts), page_size)
+        parts.extend(DocumentPart(d.name, d.page_count or 1, document_id=d.id, metadata=d.metadata_dict)
+                     for d in page)
+        if len(page) < page_size:
+            return parts
+
+
+def extract_notes(client, part, collection_id=None, llm_args=None):
+    """Notes for one document: locally extracted text goes in the prompt, collection
+    documents are queried in their own chat session filtered to that document"""
+    prompt = EXTRACTION_PROMPT.format(name=part.name)
+    if part.text is not None:
+        return client.answer_question(prompt, text_context_list=[part.text], llm_args=llm_args).content
+
+    if part.metadata.get(METADATA_KEY) != part.document_id:
+        # The SDK replaces a document's whole metadata, and cached collections are shared - keep what's there
+        client.update_document_metadata(part.document_id, {**part.metadata, METADATA_KEY: part.document_id})
+    chat_session_id = client.create_chat_session(collection_id)
+    try:
+        with client.connect(chat_session_id) as session:
+            return session.query(prompt, metadata_filter={METADATA_KEY: part.document_id},
+                                 llm_args=llm_args, include_chat_history=False).content
+    finally:
+        try:
+            client.delete_chat_sessions([chat_session_id])
+        except Exception as e:
+            logger.error(f"Failed to delete chat session {chat_session_id}: {str(e)}")
+
+
+def map_documents(client, parts, progress, collection_id=None, parallelism=4, llm_args=None):
+    """Extract notes from every document concurrently; returns [[name, notes], ...] in input order"""
+    finished = []
+
+    def extract(part):
+        with span('map_query', pages=part.pages):
+            notes = extract_notes(client, part, collection_id, llm_args)
+        finished.append(part.name)
+        progress(f'Read {len(finished)} of {len(parts)} documents', 0.6 + 0.2 * len(finished) / len(parts))
+        return [part.name, notes]
+
+    progress(f'Reading {len(parts)} documents', 0.6)
+    with ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(parts))), thread_name_prefix='map') as pool:
+        return list(pool.map(extract, parts))
+
+
+def merge_prompt(prompt, extractions):
+    """The analysis prompt over per-document notes instead of the documents themselves"""
+    parts = [prompt, 'Each document has already been condensed into the notes below. Base the report only on these notes.']
+    return '\n\n'.join(parts + format_notes(extractions))
+
+
+def delta_prompt(report, extractions):
+    """Ask for the sections of ``report`` that change given notes from newly added documents"""
+    parts = [DELTA_PROMPT, f'--- Current report ---\n{report}']
+    return '\n\n'.join(parts + format_notes(extractions, 'Notes from new document'))
+
+
+def format_notes(extractions, label='Notes from'):
+    return [f'--- {label}: {name} ---\n{notes}' for name, notes in extractions]
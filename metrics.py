@@ -0,0 +1,205 @@
+"""Per-stage timing spans and a Prometheus text-format scrape endpoint.
+
+    with span('ingest', **file_tags(paths)):
+        client.ingest_uploads(...)
+
+Every span feeds ``med_assist_stage_duration_seconds`` (labelled by stage and the
+file types involved) and, if it raises, ``med_assist_stage_errors_total``. It also
+writes one structured log line with the file count and total bytes.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('med-assist')
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (1e4, 1e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50)
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                yield f'{self.name}{_label_text(key)} {value}'
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):  # Larger values only show up in +Inf
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    yield f'{self.name}_bucket{_label_text(key + (("le", bound),))} {cumulative}'
+                yield f'{self.name}_bucket{_label_text(key + (("le", "+Inf"),))} {series[-1]}'
+                yield f'{self.name}_sum{_label_text(key)} {series[-2]}'
+                yield f'{self.name}_count{_label_text(key)} {series[-1]}'
+
+
+class Gauge:
+    """Value read at scrape time from ``func``, which returns a number or a {labels: number} dict"""
+
+    def __init__(self, name, help_text, func, kind='gauge'):
+        self.name = name
+        self.help = help_text
+        self.kind = kind  # 'counter' for running totals kept elsewhere
+        self._func = func
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.kind}'
+        try:
+            value = self._func()
+        except Exception as e:
+            logger.error(f"Gauge {self.name} failed: {str(e)}")
+            return
+        if isinstance(value, dict):
+            for labels, v in sorted(value.items()):
+                yield f'{self.name}{_label_text(tuple(sorted(labels)))} {v}'
+        else:
+            yield f'{self.name} {value}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help_text, func, kind='gauge'):
+        return self.register(Gauge(name, help_text, func, kind))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+STAGE_DURATION = registry.register(Histogram(
+    'med_assist_stage_duration_seconds', 'Time spent in each stage of an analysis'))
+STAGE_ERRORS = registry.register(Counter(
+    'med_assist_stage_errors_total', 'Stages that raised, by stage'))
+SUBMISSION_FILES = registry.register(Histogram(
+    'med_assist_submission_files', 'Files per submission', buckets=COUNT_BUCKETS))
+SUBMISSION_BYTES = registry.register(Histogram(
+    'med_assist_submission_bytes', 'Total bytes per submission', buckets=SIZE_BUCKETS))
+TIME_TO_FIRST_TOKEN = registry.register(Histogram(
+    'med_assist_time_to_first_token_seconds', 'Time from query to first streamed token'))
+
+
+def file_tags(file_paths):
+    """Span tags describing a set of files: count, total bytes and distinct extensions"""
+    sizes = []
+    types = set()
+    for path in file_paths:
+        try:
+            sizes.append(os.path.getsize(path))
+        except OSError:
+            continue
+        types.add(os.path.splitext(path)[1].lstrip('.').lower() or 'none')
+    return {'files': len(sizes), 'bytes': sum(sizes), 'file_types': '+'.join(sorted(types))}
+
+
+def observe_submission(file_paths):
+    tags = file_tags(file_paths)
+    SUBMISSION_FILES.observe(tags['files'])
+    SUBMISSION_BYTES.observe(tags['bytes'])
+    return tags
+
+
+@contextmanager
+def span(stage, **tags):
+    """Time a stage, recording it in the stage histogram and a structured log line
+
+    Yields the tags dict so tags only known once the stage is done can be added.
+    """
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield tags
+    except Exception:
+        status = 'error'
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_DURATION.observe(duration, stage=stage, file_types=tags.get('file_types', ''))
+        fields = ' '.join(f'{k}={v}' for k, v in tags.items() if v not in (None, ''))
+        logger.info(f"span stage={stage} status={status} duration={duration:.3f}s {fields}".rstrip())
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes would drown out the app's own logs
+
+
+def start_metrics_server(port, host='0.0.0.0'):
+    """Serve /metrics on a background thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,129 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from doc_cache import file_digest
+
+logger = logging.getLogger('med-assist')
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+
+class PreparedFile:
+    def __init__(self, source, path, digest, phash=None):
+        self.source = source  # Original upload
+        self.path = path  # What actually gets uploaded; may be ``source`` itself
+        self.digest = digest
+        self.phash = phash
+
+
+def dhash(image, size=16):
+    """``size``**2-bit difference hash of an image: robust to rescaling and recompression, not to cropping"""
+    from PIL import Image
+
+    small = image.convert('L').resize((size + 1, size), Image.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def prepare_image(source, target, max_edge=2400, jpeg_quality=80):
+    """Downsample, grayscale and recompress an image for OCR; returns (path, phash)
+
+    The original is kept when the result wouldn't be smaller. Without Pillow the
+    image goes up untouched and has no perceptual hash.
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return source, None
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)  # Phone photos are often stored sideways
+        image = image.convert('L')
+        if max(image.size) > max_edge:
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        phash = dhash(image)
+        if os.path.splitext(source)[1].lower() == '.png':
+            image.save(target, 'PNG', optimize=True)
+        else:
+            image.save(target, 'JPEG', quality=jpeg_quality, optimize=True)
+
+    if os.path.getsize(target) >= os.path.getsize(source):
+        os.remove(target)
+        return source, phash
+    return target, phash
+
+
+def same_page(path_a, path_b, tile=4, max_tile_diff=32):
+    """Whether two images show the same page pixel for pixel, give or take compression noise
+
+    A hash match alone isn't enough: two reports printed from the same lab template
+    hash alike even when their values differ. Comparing small tiles catches a single
+    changed number, at the cost of not recognising rescaled copies or retakes.
+    """
+    from PIL import Image, ImageChops
+
+    with Image.open(path_a) as a, Image.open(path_b) as b:
+        if a.size != b.size:
+            return False
+        diff = ImageChops.difference(a.convert('L'), b.convert('L'))
+        tiles = diff.resize((max(1, a.width // tile), max(1, a.height // tile)), Image.BOX)
+        return tiles.getextrema()[1] <= max_tile_diff
+
+
+def prepare_uploads(file_paths, work_dir, digests=None, max_edge=2400, jpeg_quality=80, max_distance=16,
+                    parallelism=4):
+    """Shrink images and drop duplicate pages before upload; returns the paths to upload
+
+    Exact duplicates (same bytes) are dropped for every file type. Images are also
+    dropped when their perceptual hash is within ``max_distance`` bits of an earlier
+    one and ``same_page`` confirms it, which catches re-saved or re-sent copies of
+    the same photo. Processed copies are written under ``work_dir`` with the
+    original file names. ``digests`` are the files' SHA-256s if the caller already
+    has them.
+    """
+    def prepare(indexed):
+        i, source = indexed
+        digest = digests[i] if digests else file_digest(source)
+        if os.path.splitext(source)[1].lower() not in IMAGE_EXTENSIONS:
+            return PreparedFile(source, source, digest)
+        target_dir = os.path.join(work_dir, str(i))  # Keeps same-named uploads apart
+        os.makedirs(target_dir, exist_ok=True)
+        try:
+            path, phash = prepare_image(source, os.path.join(target_dir, os.path.basename(source)),
+                                        max_edge, jpeg_quality)
+        except Exception as e:
+            logger.info(f"Could not preprocess {os.path.basename(source)}, uploading as is: {str(e)}")
+            path, phash = source, None
+        return PreparedFile(source, path, digest, phash)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(file_paths))),
+                            thread_name_prefix='preprocess') as pool:
+        prepared = list(pool.map(prepare, enumerate(file_paths)))
+
+    kept = []
+    for item in prepared:
+        duplicate = next((k for k in kept if k.digest == item.digest), None)
+        if duplicate is None and item.phash is not None:
+            duplicate = next((k for k in kept if k.phash is not None
+                              and bin(k.phash ^ item.phash).count('1') <= max_distance
+                              and _same_page(k.path, item.path)), None)
+        if duplicate is not None:
+            logger.info(f"Dropping {os.path.basename(item.source)}: duplicate of {os.path.basename(duplicate.source)}")
+            continue
+        kept.append(item)
+    return [item.path for item in kept]
+
+
+def _same_page(path_a, path_b):
+    try:
+        return same_page(path_a, path_b)
+    except Exception as e:
+        logger.info(f"Could not compare {os.path.basename(path_a)} and {os.path.basename(path_b)}: {str(e)}")
+        return False
@@ -0,0 +1,162 @@
+import copy
+import hashlib
+import io
+import re
+import threading
+from collections import OrderedDict
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, HRFlowable
+
+from report_sections import split_sections
+
+PREAMBLE = "According to the provided documents, here is a structured explanation of the medical findings:"
+DISCLAIMER = ("This report is AI-generated and reviewed by a medical professional. "
+              "Some details may be inaccurate or require clinical validation.")
+
+# **bold** spans; an unclosed ** runs to the end of the line
+_BOLD = re.compile(r'\*\*(.*?)(?:\*\*|$)')
+
+
+class ReportRenderer:
+    """Renders report markup (## Heading ## lines and **bold** spans) to PDF.
+
+    Styles are built once per renderer and shared by every render. Parsed flowables
+    are cached per ``## Heading ##`` section, keyed by the hash of its text, so
+    re-rendering an edited report only parses the sections that changed.
+    """
+
+    def __init__(self, cache_size=512):
+        self.cache_size = cache_size
+        self._sections = OrderedDict()  # SHA-256 of a section's text -> its flowables
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        styles = getSampleStyleSheet()
+
+        self.heading_style = ParagraphStyle(
+            'Heading1',
+            parent=styles['Heading1'],
+            fontSize=18,
+            leading=16,
+            spaceAfter=12,
+            textColor=colors.black,
+            alignment=1  # center align
+        )
+        self.heading2_style = ParagraphStyle(
+            'Heading2',
+            parent=styles['Heading2'],
+            fontSize=12,
+            leading=14,
+            spaceAfter=8,
+            textColor=colors.darkblue,
+            alignment=1
+        )
+        self.heading3_style = ParagraphStyle(
+            'Heading1',
+            parent=styles['Heading3'],
+            fontSize=12,
+            leading=16,
+            spaceAfter=4,
+            textColor=colors.darkblue,
+            alignment=0  # left align
+        )
+        # Caption style (smaller and gray text)
+        self.caption_style = ParagraphStyle(
+            'Caption',
+            parent=styles['BodyText'],
+            fontSize=8,
+            leading=10,
+            spaceAfter=10,
+            textColor=colors.grey,
+            alignment=1  # center align
+        )
+        self.normal_style = ParagraphStyle(
+            'NormalText',
+            parent=styles['BodyText'],
+            fontSize=10,
+            leading=12,
+            spaceAfter=2,
+            textColor=colors.black
+        )
+
+    def header(self):
+        return [
+            Paragraph("H2o Medical Center\n", self.heading_style),
+            Paragraph("Lab Report Summary\n", self.heading2_style),
+            Paragraph(DISCLAIMER, self.caption_style),
+            HRFlowable(width="100%", thickness=1, color=colors.grey, spaceBefore=6, spaceAfter=6),
+        ]
+
+    def body(self, input_text):
+        """Flowables for the report text, reusing those of sections rendered before"""
+        story = []
+        for _, text in split_sections(input_text.replace(PREAMBLE, "")):
+            # Layout sets attributes on each flowable, so every build gets its own copies
+            story.extend(copy.copy(flowable) for flowable in self._section(text))
+        return story
+
+    def _section(self, text):
+        key = hashlib.sha256(text.encode()).digest()
+        with self._lock:
+            flowables = self._sections.get(key)
+            if flowables is not None:
+                self._sections.move_to_end(key)
+                self.hits += 1
+                return flowables
+            self.misses += 1
+        flowables = self._parse(text)
+        with self._lock:
+            self._sections[key] = flowables
+            while len(self._sections) > self.cache_size:
+                self._sections.popitem(last=False)
+        return flowables
+
+    def _parse(self, text):
+        """Flowables for one section, one pass over its lines"""
+        story = []
+        for line in text.split('\n'):
+            line = line.strip()
+            if not line:
+                continue  # skip empty lines
+
+            if line.startswith('##') and line.endswith('##'):
+                story.append(Paragraph(escape(line.strip('#').strip()), self.heading3_style))
+            else:
+                story.append(Paragraph(_BOLD.sub(r'<b>\1</b>', escape(line)), self.normal_style))
+
+            # Add small spacer after each element
+            story.append(Spacer(1, 6))
+        return story
+
+    def render(self, input_text):
+        """Render the report to PDF bytes, entirely in memory"""
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=letter)
+        doc.build(self.header() + self.body(input_text))
+        return buffer.getvalue()
+
+
+def escape(text):
+    """Escape characters ReportLab's paragraph markup would treat as tags, e.g. in 'LDL < 100'"""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer():
+    """Process-wide renderer, created on first use"""
+    global _renderer
+    if _renderer is None:
+        with _renderer_lock:
+            if _renderer is None:
+                _renderer = ReportRenderer()
+    return _renderer
+
+
+def render_pdf_report(input_text):
+    return get_renderer().render(input_text)
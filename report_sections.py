@@ -0,0 +1,62 @@
+import re
+
+_HEADING = re.compile(r'^\s*##\s*(.*?)\s*##\s*$')
+
+
+def heading_key(title):
+    """Headings compare case- and whitespace-insensitively, so 'Key findings' replaces '## Key Findings ##'"""
+    return ' '.join(title.lower().split()) if title is not None else None
+
+
+def split_sections(text):
+    """Split report markup into [(title, chunk), ...] at ``## Heading ##`` lines.
+
+    Each chunk is the heading line plus everything up to the next heading, exactly as
+    written, so joining the chunks gives back the original text. Anything before the
+    first heading comes first with a title of None.
+    """
+    sections = []
+    title, lines = None, []
+    for line in text.splitlines(keepends=True):
+        match = _HEADING.match(line)
+        if match:
+            if lines:
+                sections.append((title, ''.join(lines)))
+            title, lines = match.group(1), []
+        lines.append(line)
+    if lines:
+        sections.append((title, ''.join(lines)))
+    return sections
+
+
+def merge_sections(report, update):
+    """The report with the body of each section in ``update`` swapped in; sections it doesn't
+    mention keep their exact text, and replaced ones keep the report's own heading line.
+
+    Sections the report doesn't have yet are appended. Text in ``update`` before its
+    first heading, and sections with an empty body, are ignored.
+    """
+    updates = {}
+    for title, chunk in split_sections(update):
+        heading, _, body = chunk.partition('\n')
+        if title is not None and body.strip():
+            updates[heading_key(title)] = (heading, body if body.endswith('\n') else body + '\n')
+    if not updates:
+        return report
+
+    merged = []
+    for title, chunk in split_sections(report):
+        key = heading_key(title)
+        if key in updates:
+            chunk = chunk.partition('\n')[0] + '\n' + updates.pop(key)[1]
+        merged.append(chunk)
+    merged.extend(f'{heading}\n{body}' for heading, body in updates.values())
+    # The report's last section may not end in a newline; keep every heading on its own line
+    return ''.join(chunk if chunk.endswith('\n') or i == len(merged) - 1 else chunk + '\n'
+                   for i, chunk in enumerate(merged))
+
+
+def changed_sections(before, after):
+    """Titles of the sections whose text differs between two versions of a report"""
+    old = {heading_key(title): chunk.rstrip() for title, chunk in split_sections(before)}
+    return [title for title, chunk in split_sections(after) if old.get(heading_key(title)) != chunk.rstrip()]
@@ -0,0 +1,278 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+logger = logging.getLogger('med-assist')
+
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+# Matched by name anywhere in the exception's MRO so the SDK and its transports needn't be imported here
+TRANSIENT_ERRORS = {
+    'ConnectionError', 'TimeoutError', 'Timeout', 'ReadTimeout', 'ConnectTimeout', 'PoolTimeout', 'ConnectError',
+    'RemoteProtocolError', 'ConnectionClosed', 'InternalServerError',
+}
+
+GPTE_RETRIES = metrics.registry.register(metrics.Counter(
+    'med_assist_gpte_retries_total', 'GPTe calls retried after a transient failure, by stage'))
+GPTE_REJECTED = metrics.registry.register(metrics.Counter(
+    'med_assist_gpte_rejected_total', 'GPTe calls refused by admission control or the circuit breaker, by reason'))
+
+
+class GPTeUnavailable(Exception):
+    """GPTe can't take the call right now; try again after ``retry_after`` seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class GPTeBusy(GPTeUnavailable):
+    """Refused by this process's own admission control; says nothing about GPTe's health"""
+
+
+def is_transient(error):
+    """Whether an error is worth retrying: timeouts, dropped connections, 429 and 5xx"""
+    if isinstance(error, GPTeUnavailable):
+        return False
+    status = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is not None:
+        return status in TRANSIENT_STATUS
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+
+class TokenBucket:
+    """``rate`` operations per second on average, with bursts of up to ``burst``"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class StageLimit:
+    def __init__(self, max_in_flight, rate, burst=None):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._bucket = TokenBucket(rate, burst or max_in_flight)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def admit(self, stage, timeout):
+        if not self._slots.acquire(timeout=timeout):
+            GPTE_REJECTED.inc(reason='in_flight', stage=stage)
+            raise GPTeBusy(f"Too many GPTe {stage} calls in flight", retry_after=1.0)
+        try:
+            if not self._bucket.acquire(timeout):
+                GPTE_REJECTED.inc(reason='rate', stage=stage)
+                raise GPTeBusy(f"GPTe {stage} rate limit reached", retry_after=1.0)
+            with self._lock:
+                self.in_flight += 1
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+        finally:
+            self._slots.release()
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive transient failures and fails fast for
+    ``reset_timeout`` seconds; then lets one trial call through (half-open) to test the water."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        with self._lock:
+            if self.state != 'open':
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def before_call(self):
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    GPTE_REJECTED.inc(reason='circuit_open', stage='any')
+                    raise GPTeUnavailable("GPTe is unavailable (circuit open)",
+                                          self._opened_at + self.reset_timeout - time.monotonic())
+                self.state = 'half_open'
+                self._trial_running = False
+            if self.state == 'half_open':
+                if self._trial_running:
+                    raise GPTeUnavailable("GPTe is recovering (trial call in progress)", 1.0)
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info("GPTe circuit closed")
+            self.state = 'closed'
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self.state == 'half_open' or self._failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logger.error(f"GPTe circuit opened after {self._failures} failures")
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+    def record_other(self):
+        """The call finished with an error that says nothing about GPTe's health"""
+        with self._lock:
+            self._trial_running = False
+
+
+class GPTeGuard:
+    """Admission control, retries and a circuit breaker around GPTe calls.
+
+    Each call belongs to a stage whose in-flight count and rate are capped. Calls
+    marked ``retry`` (the idempotent ones) are retried on transient errors with
+    full-jitter exponential backoff. Transient failures feed one circuit breaker
+    for the whole backend, so once it opens every caller fails fast with
+    ``GPTeUnavailable`` instead of piling onto a struggling server.
+    """
+
+    def __init__(self, limits, breaker=None, attempts=3, base_delay=0.5, max_delay=8.0, admission_timeout=30.0):
+        self.limits = limits  # stage -> StageLimit
+        self.breaker = breaker or CircuitBreaker()
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.admission_timeout = admission_timeout
+
+    def call(self, stage, func, *args, retry=False, **kwargs):
+        attempts = self.attempts if retry else 1
+        for attempt in range(attempts):
+            self.breaker.before_call()
+            try:
+                with self._admit(stage):
+                    result = func(*args, **kwargs)
+            except GPTeUnavailable:
+                self.breaker.record_other()
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    self.breaker.record_other()
+                    raise
+                self.breaker.record_failure()
+                if attempt == attempts - 1:
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                GPTE_RETRIES.inc(stage=stage)
+                logger.info(f"GPTe {stage} call failed ({str(e)}), retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def wrap(self, client):
+        return GuardedClient(client, self)
+
+    def in_flight(self):
+        return {stage: limit.in_flight for stage, limit in self.limits.items()}
+
+    def _admit(self, stage):
+        limit = self.limits.get(stage)
+        return limit.admit(stage, self.admission_timeout) if limit else _no_limit()
+
+
+@contextmanager
+def _no_limit():
+    yield
+
+
+# SDK method -> (stage, safe to retry); only LLM calls count against 'query'
+CLIENT_POLICY = {
+    'get_meta': ('collection', True),
+    'create_collection': ('collection', False),
+    'get_collection': ('collection', True),
+    'list_recent_collections': ('collection', True),
+    'list_documents_in_collection': ('collection', True),
+    'update_document_metadata': ('collection', True),
+    'delete_collections': ('collection', True),
+    'delete_chat_sessions': ('collection', True),
+    'upload': ('upload', True),
+    'ingest_uploads': ('ingest', False),
+    'create_chat_session': ('session', False),
+    'answer_question': ('query', True),
+}
+
+
+class GuardedClient:
+    """H2OGPTE client whose calls go through a GPTeGuard; anything else passes straight through"""
+
+    def __init__(self, client, guard):
+        self.client = client
+        self.guard = guard
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if name not in CLIENT_POLICY:
+            return attr
+        stage, retry = CLIENT_POLICY[name]
+
+        def guarded(*args, **kwargs):
+            return self.guard.call(stage, attr, *args, retry=retry, **kwargs)
+        return guarded
+
+    def connect(self, chat_session_id, **kwargs):
+        return GuardedSession(self.client.connect(chat_session_id, **kwargs), self.guard)
+
+
+class GuardedSession:
+    def __init__(self, session, guard):
+        self.session = session
+        self.guard = guard
+
+    def __enter__(self):
+        self.guard.call('session', self.session.__enter__)
+        return self
+
+    def __exit__(self, *exc):
+        return self.session.__exit__(*exc)
+
+    def query(self, message, **kwargs):
+        # Not retried: streamed output may already have reached the user
+        return self.guard.call('query', self.session.query, message, **kwargs)
+
+
+def parse_limits(spec):
+    """StageLimits from ``stage=max_in_flight:rate,...``, e.g. ``upload=16:20,ingest=4:2``"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        stage, _, values = item.partition('=')
+        max_in_flight, _, rate = values.partition(':')
+        limits[stage.strip()] = StageLimit(int(max_in_flight), float(rate or max_in_flight))
+    return limits
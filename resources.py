@@ -0,0 +1,145 @@
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger('med-assist')
+
+COLLECTION_PREFIX = 'med_analysis_'
+
+
+class OwnedResources:
+    def __init__(self):
+        self.collection_ids = set()
+        self.chat_session_ids = set()
+        self.last_seen = time.monotonic()
+
+
+class ResourceRegistry:
+    """Tracks which GPTe collections and chat sessions each client or job created"""
+
+    def __init__(self):
+        self._owners = {}
+        self._lock = threading.Lock()
+
+    def touch(self, owner):
+        with self._lock:
+            self._owners.setdefault(owner, OwnedResources()).last_seen = time.monotonic()
+
+    def track(self, owner, collection_id=None, chat_session_id=None):
+        with self._lock:
+            owned = self._owners.setdefault(owner, OwnedResources())
+            owned.last_seen = time.monotonic()
+            if collection_id:
+                owned.collection_ids.add(collection_id)
+            if chat_session_id:
+                owned.chat_session_ids.add(chat_session_id)
+
+    def release(self, owner):
+        """Stop tracking an owner and return what it held, or None"""
+        with self._lock:
+            return self._owners.pop(owner, None)
+
+    def idle_owners(self, max_idle):
+        now = time.monotonic()
+        with self._lock:
+            return [owner for owner, owned in self._owners.items() if now - owned.last_seen > max_idle]
+
+    def collection_ids(self):
+        with self._lock:
+            return set().union(*(owned.collection_ids for owned in self._owners.values()))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'owners': len(self._owners),
+                'collections': sum(len(o.collection_ids) for o in self._owners.values()),
+                'chat_sessions': sum(len(o.chat_session_ids) for o in self._owners.values()),
+            }
+
+
+def delete_resources(client, owned, keep_collections=()):
+    """Delete an owner's chat sessions and any of its collections not in ``keep_collections``"""
+    if owned.chat_session_ids:
+        client.delete_chat_sessions(list(owned.chat_session_ids))
+    collection_ids = [c for c in owned.collection_ids if c not in keep_collections]
+    if collection_ids:
+        client.delete_collections(collection_ids)
+    logger.info(f"Deleted {len(owned.chat_session_ids)} chat sessions and {len(collection_ids)} collections")
+
+
+class CollectionReaper(threading.Thread):
+    """Background thread that cleans up GPTe resources nobody is using any more.
+
+    Every ``interval`` seconds it releases clients idle for longer than
+    ``session_timeout``, expires the document cache, and deletes
+    ``med_analysis_*`` collections older than ``max_age`` that no live client or
+    cache entry refers to. ``on_release(owner)`` is called for every idle client so
+    other per-session state can be dropped with it. Deletes go out in batches with
+    a pause in between so a large backlog doesn't hammer the shared GPTe instance.
+    """
+
+    def __init__(self, pool, registry, cache, interval=600.0, max_age=7 * 24 * 3600, session_timeout=3600.0,
+                 batch_size=20, batch_pause=1.0, max_per_run=200, on_release=None):
+        super().__init__(name='collection-reaper', daemon=True)
+        self.pool = pool
+        self.registry = registry
+        self.cache = cache
+        self.interval = interval
+        self.max_age = max_age
+        self.session_timeout = session_timeout
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.max_per_run = max_per_run
+        self.on_release = on_release
+        self.deleted = 0
+        self._stop = threading.Event()
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"Collection reaper failed: {str(e)}")
+
+    def stop(self):
+        self._stop.set()
+
+    def reap(self):
+        with self.pool.client() as client:
+            for owner in self.registry.idle_owners(self.session_timeout):
+                owned = self.registry.release(owner)
+                if owned:
+                    delete_resources(client, owned, self.cache.collection_ids())
+                if self.on_release:
+                    self.on_release(owner)
+
+            self.cache.expire()
+            orphans = self.cache.pop_evicted() + self._find_orphans(client)
+            for i in range(0, len(orphans), self.batch_size):
+                if self._stop.is_set():
+                    break
+                batch = orphans[i:i + self.batch_size]
+                client.delete_collections(batch)
+                self.deleted += len(batch)
+                logger.info(f"Reaped {len(batch)} collections")
+                self._stop.wait(self.batch_pause)
+
+    def _find_orphans(self, client):
+        live = self.registry.collection_ids() | self.cache.collection_ids()
+        cutoff = datetime.now(timezone.utc).timestamp() - self.max_age
+        orphans = []
+        offset = 0
+        while len(orphans) < self.max_per_run:
+            page = client.list_recent_collections(offset, 100, current_user_only=True)
+            if not page:
+                break
+            for collection in page:
+                updated_at = collection.updated_at
+                if updated_at.tzinfo is None:
+                    updated_at = updated_at.replace(tzinfo=timezone.utc)
+                if (collection.name.startswith(COLLECTION_PREFIX) and collection.id not in live
+                        and updated_at.timestamp() < cutoff):
+                    orphans.append(collection.id)
+            offset += len(page)
+        return orphans[:self.max_per_run]
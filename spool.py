@@ -0,0 +1,119 @@
+import logging
+import os
+import shutil
+import threading
+import uuid
+
+logger = logging.getLogger('med-assist')
+
+
+class SpoolQuotaError(Exception):
+    """Raised when an upload would take a client or the node over its spool quota."""
+
+
+class UploadSpool:
+    """Per-client directories for uploaded files, with byte and file-count quotas.
+
+    Files live under ``<root>/<pid>/<client_id>/`` so several app processes can share
+    a root; ``sweep()`` removes whatever dead processes (or an earlier process with
+    our pid) left behind.
+    """
+
+    def __init__(self, root, max_client_bytes=200 * 1024 ** 2, max_client_files=50, max_total_bytes=5 * 1024 ** 3):
+        self.root = root
+        self.max_client_bytes = max_client_bytes
+        self.max_client_files = max_client_files
+        self.max_total_bytes = max_total_bytes
+        self._process_dir = os.path.join(root, str(os.getpid()))
+        self._usage = {}  # client_id -> {path: size}
+        self._lock = threading.Lock()
+
+    def sweep(self):
+        """Delete spool directories left over by processes that are gone"""
+        os.makedirs(self.root, exist_ok=True)
+        removed = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.isdigit() and int(name) != os.getpid() and _process_alive(int(name)):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+        if removed:
+            logger.info(f"Swept {removed} stale spool directories from {self.root}")
+
+    def new_path(self, client_id, file_name):
+        """A fresh path in the client's area for a file about to be written"""
+        with self._lock:
+            if len(self._usage.get(client_id, {})) >= self.max_client_files:
+                raise SpoolQuotaError(f"Too many files: at most {self.max_client_files} per session")
+        area = os.path.join(self._process_dir, _safe_name(client_id))
+        os.makedirs(area, exist_ok=True)
+        return os.path.join(area, f"{uuid.uuid4().hex[:8]}_{_safe_name(file_name)}")
+
+    def admit(self, client_id, path):
+        """Count a written file against the quotas; it is deleted if it doesn't fit"""
+        size = os.path.getsize(path)
+        with self._lock:
+            files = self._usage.setdefault(client_id, {})
+            client_bytes = sum(files.values()) + size
+            total_bytes = self._total_bytes() + size
+            if len(files) < self.max_client_files and client_bytes <= self.max_client_bytes \
+                    and total_bytes <= self.max_total_bytes:
+                files[path] = size
+                return
+        _remove(path)
+        if total_bytes > self.max_total_bytes:
+            raise SpoolQuotaError("The server is out of upload space. Please try again later.")
+        raise SpoolQuotaError(
+            f"Upload too large: at most {self.max_client_bytes // 1024 ** 2} MB "
+            f"and {self.max_client_files} files per session")
+
+    def discard(self, client_id, paths):
+        """Delete some of a client's files, e.g. ones an upload turned out not to need"""
+        with self._lock:
+            files = self._usage.get(client_id, {})
+            for path in paths:
+                files.pop(path, None)
+        for path in paths:
+            _remove(path)
+
+    def clear(self, client_id):
+        """Delete all of a client's spooled files"""
+        with self._lock:
+            files = self._usage.pop(client_id, {})
+        shutil.rmtree(os.path.join(self._process_dir, _safe_name(client_id)), ignore_errors=True)
+        if files:
+            logger.info(f"Cleared {len(files)} spooled files for {client_id}")
+
+    def usage(self):
+        with self._lock:
+            return {
+                'bytes': self._total_bytes(),
+                'files': sum(len(files) for files in self._usage.values()),
+                'clients': len(self._usage),
+            }
+
+    def _total_bytes(self):
+        return sum(sum(files.values()) for files in self._usage.values())
+
+
+def _safe_name(name):
+    name = os.path.basename(str(name).replace('\\', '/'))
+    return name if name not in ('', '.', '..') else 'file'
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
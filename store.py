@@ -0,0 +1,229 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    patient_id TEXT,
+    submission_key TEXT,
+    file_names TEXT NOT NULL,
+    file_paths TEXT NOT NULL,
+    analysis TEXT NOT NULL,
+    draft TEXT,
+    resources TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analyses_submission_key ON analyses (submission_key, updated_at);
+CREATE INDEX IF NOT EXISTS analyses_owner_patient_id ON analyses (owner, patient_id, updated_at);
+CREATE TABLE IF NOT EXISTS sessions (
+    owner TEXT PRIMARY KEY,
+    analysis_id TEXT NOT NULL REFERENCES analyses (id) ON DELETE CASCADE,
+    updated_at REAL NOT NULL
+);
+"""
+
+_JSON_COLUMNS = ('file_names', 'file_paths', 'resources')
+
+
+class AnalysisStore:
+    """Where finished analyses, the doctor's edits and each session's current analysis live.
+
+    Records are dicts with the ``analyses`` columns (JSON columns decoded). Any
+    worker process pointed at the same store can pick up a session another one
+    started. Subclass this to back it with something other than SQLite.
+    """
+
+    def save_analysis(self, owner, analysis, file_names, file_paths=(), resources=None, submission_key=None,
+                      patient_id=None):
+        """Store a new analysis and make it the owner's current one; returns its id"""
+        raise NotImplementedError
+
+    def update_analysis(self, analysis_id, analysis=None, resources=None):
+        """Replace the generated text (dropping any draft) and/or the GPTe resources of an analysis"""
+        raise NotImplementedError
+
+    def add_files(self, analysis_id, file_names, file_paths=(), submission_key=None):
+        """Record files added to an existing analysis; ``submission_key`` is that of the whole file set now"""
+        raise NotImplementedError
+
+    def save_draft(self, analysis_id, text):
+        raise NotImplementedError
+
+    def get(self, analysis_id):
+        raise NotImplementedError
+
+    def current(self, owner):
+        """The analysis an owner is working on, or None"""
+        raise NotImplementedError
+
+    def set_current(self, owner, analysis_id):
+        raise NotImplementedError
+
+    def clear_current(self, owner):
+        raise NotImplementedError
+
+    def find_by_submission(self, submission_key):
+        """Latest analysis of exactly this set of files, or None"""
+        raise NotImplementedError
+
+    def set_patient(self, analysis_id, patient_id):
+        raise NotImplementedError
+
+    def find_by_patient(self, owner, patient_id, limit=20):
+        """The owner's analyses filed under a patient, newest first; other owners' are never listed"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteStore(AnalysisStore):
+    """SQLite in WAL mode, one connection per thread, safe to share between worker processes on one host"""
+
+    def __init__(self, path, busy_timeout=10.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')  # Durable across app crashes; WAL keeps it consistent
+            db.execute('PRAGMA foreign_keys=ON')
+            self._local.db = db
+        return db
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def save_analysis(self, owner, analysis, file_names, file_paths=(), resources=None, submission_key=None,
+                      patient_id=None):
+        analysis_id = uuid.uuid4().hex
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                'INSERT INTO analyses (id, owner, patient_id, submission_key, file_names, file_paths, analysis, '
+                'resources, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (analysis_id, owner, patient_id, submission_key, json.dumps(list(file_names)),
+                 json.dumps(list(file_paths)), analysis, json.dumps(resources or {}), now, now))
+            self._set_current(db, owner, analysis_id, now)
+        return analysis_id
+
+    def update_analysis(self, analysis_id, analysis=None, resources=None):
+        with self._transaction() as db:
+            if analysis is not None:
+                db.execute('UPDATE analyses SET analysis = ?, draft = NULL, updated_at = ? WHERE id = ?',
+                           (analysis, time.time(), analysis_id))
+            if resources is not None:
+                db.execute('UPDATE analyses SET resources = ?, updated_at = ? WHERE id = ?',
+                           (json.dumps(resources), time.time(), analysis_id))
+
+    def add_files(self, analysis_id, file_names, file_paths=(), submission_key=None):
+        with self._transaction() as db:
+            row = db.execute('SELECT file_names, file_paths FROM analyses WHERE id = ?', (analysis_id,)).fetchone()
+            if row is None:
+                return
+            db.execute('UPDATE analyses SET file_names = ?, file_paths = ?, submission_key = ?, updated_at = ? '
+                       'WHERE id = ?',
+                       (json.dumps(json.loads(row['file_names']) + list(file_names)),
+                        json.dumps(json.loads(row['file_paths']) + list(file_paths)),
+                        submission_key, time.time(), analysis_id))
+
+    def save_draft(self, analysis_id, text):
+        with self._transaction() as db:
+            db.execute('UPDATE analyses SET draft = ?, updated_at = ? WHERE id = ?', (text, time.time(), analysis_id))
+
+    def get(self, analysis_id):
+        row = self._connection().execute('SELECT * FROM analyses WHERE id = ?', (analysis_id,)).fetchone()
+        return _record(row)
+
+    def current(self, owner):
+        row = self._connection().execute(
+            'SELECT a.* FROM sessions s JOIN analyses a ON a.id = s.analysis_id WHERE s.owner = ?', (owner,)).fetchone()
+        return _record(row)
+
+    def set_current(self, owner, analysis_id):
+        with self._transaction() as db:
+            self._set_current(db, owner, analysis_id, time.time())
+
+    def clear_current(self, owner):
+        with self._transaction() as db:
+            db.execute('DELETE FROM sessions WHERE owner = ?', (owner,))
+
+    def find_by_submission(self, submission_key):
+        row = self._connection().execute(
+            'SELECT * FROM analyses WHERE submission_key = ? ORDER BY updated_at DESC LIMIT 1',
+            (submission_key,)).fetchone()
+        return _record(row)
+
+    def set_patient(self, analysis_id, patient_id):
+        with self._transaction() as db:
+            db.execute('UPDATE analyses SET patient_id = ?, updated_at = ? WHERE id = ?',
+                       (patient_id, time.time(), analysis_id))
+
+    def find_by_patient(self, owner, patient_id, limit=20):
+        rows = self._connection().execute(
+            'SELECT * FROM analyses WHERE owner = ? AND patient_id = ? ORDER BY updated_at DESC LIMIT ?',
+            (owner, patient_id, limit))
+        return [_record(row) for row in rows]
+
+    def close(self):
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    @staticmethod
+    def _set_current(db, owner, analysis_id, now):
+        db.execute('INSERT INTO sessions (owner, analysis_id, updated_at) VALUES (?, ?, ?) '
+                   'ON CONFLICT (owner) DO UPDATE SET analysis_id = excluded.analysis_id, updated_at = excluded.updated_at',
+                   (owner, analysis_id, now))
+
+
+class _Transaction:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+def _record(row):
+    if row is None:
+        return None
+    record = dict(row)
+    for column in _JSON_COLUMNS:
+        record[column] = json.loads(record[column])
+    return record
+
+
+STORE_BACKENDS = {'sqlite': SQLiteStore}
+
+
+def open_store(url):
+    """Open a store from a URL like ``sqlite:////var/lib/med_assist/store.db``; a bare path means SQLite"""
+    scheme, sep, location = url.partition('://')
+    if not sep:
+        scheme, location = 'sqlite', url
+    elif scheme == 'sqlite' and location.startswith('/'):
+        location = location[1:]  # sqlite:///relative.db or sqlite:////absolute/path.db
+    if scheme not in STORE_BACKENDS:
+        raise ValueError(f"Unsupported analysis store '{scheme}' (available: {', '.join(STORE_BACKENDS)})")
+    return STORE_BACKENDS[scheme](location)
@@ -0,0 +1,118 @@
+import os
+import tempfile
+
+import pytest
+
+# app opens its analysis store on import; keep it out of the home directory
+os.environ.setdefault('MED_ASSIST_STORE', os.path.join(tempfile.mkdtemp(prefix='med_assist_test_'), 'store.db'))
+
+import batch  # noqa: E402
+from batch import BatchRunner, LocalSource, Manifest, PatientGroup, group_files, patient_for  # noqa: E402
+
+
+def group(patient_id, *files):
+    group = PatientGroup(patient_id)
+    group.files.extend(files)
+    return group
+
+
+@pytest.mark.parametrize('path, patient_id', [
+    ('p001/labs.pdf', 'p001'),
+    ('p001\\scans\\ct.png', 'p001'),
+    ('p002_labs_2024.pdf', 'p002'),
+    ('p003.txt', 'p003'),
+])
+def test_patient_for(path, patient_id):
+    assert patient_for(path) == patient_id
+
+
+def test_group_files_skips_unsupported_and_empty_files():
+    groups = group_files([
+        ('p2/labs.pdf', 10, 1),
+        ('p1_labs.PDF', 10, 1),
+        ('p1/notes.docx', 10, 1),
+        ('p1/empty.txt', 0, 1),
+        ('p1/scan.jpg', 20, 1),
+    ])
+    assert [(g.patient_id, [path for path, _, _ in g.files]) for g in groups] == [
+        ('p1', ['p1_labs.PDF', 'p1/scan.jpg']),
+        ('p2', ['p2/labs.pdf']),
+    ]
+
+
+def test_fingerprint_follows_the_files():
+    a = group('p1', ('p1/labs.pdf', 10, 1), ('p1/scan.jpg', 20, 1))
+    assert a.fingerprint == group('p1', ('p1/scan.jpg', 20, 1), ('p1/labs.pdf', 10, 1)).fingerprint
+    assert a.fingerprint != group('p1', ('p1/labs.pdf', 10, 2), ('p1/scan.jpg', 20, 1)).fingerprint
+    assert a.fingerprint != group('p1', ('p1/labs.pdf', 10, 1)).fingerprint
+
+
+def test_manifest_resumes_finished_patients(tmp_path):
+    path = str(tmp_path / 'manifest.jsonl')
+    done = group('p1', ('p1/labs.pdf', 10, 1))
+    failed = group('p2', ('p2/labs.pdf', 10, 1))
+    manifest = Manifest(path)
+    manifest.record(done, 'done', pdf='p1.pdf', timings={'analyze': 1.5})
+    manifest.record(failed, 'failed', error='analyze: GPTe unavailable')
+    assert manifest.is_done(done) and not manifest.is_done(failed)
+
+    # An interrupted run can leave half a line behind
+    with open(path, 'a') as f:
+        f.write('{"patient_id": "p3", "status": "do')
+
+    resumed = Manifest(path)
+    assert resumed.is_done(done)
+    assert not resumed.is_done(failed)
+    assert not resumed.is_done(group('p3', ('p3/labs.pdf', 10, 1)))
+    # A patient whose files changed since is analyzed again
+    assert not resumed.is_done(group('p1', ('p1/labs.pdf', 12, 2)))
+
+
+class FakeApp:
+    """Stands in for the app functions the batch runner calls"""
+
+    def __init__(self, monkeypatch):
+        self.analyzed = []
+        self.failing = set()
+        monkeypatch.setattr(batch, 'analyze_uploaded_documents', self.analyze)
+        monkeypatch.setattr(batch, 'create_pdf_report', self.render)
+        monkeypatch.setattr(batch, 'persist', lambda func, *args, **kwargs: None)
+        monkeypatch.setattr(batch, 'track_gpte_resources', lambda owner, resources: None)
+        monkeypatch.setattr(batch, 'release_gpte_resources', lambda owner: None)
+
+    def analyze(self, paths, resources=None):
+        patient_id = os.path.basename(os.path.dirname(paths[0]))
+        self.analyzed.append(patient_id)
+        if patient_id in self.failing:
+            return 'Error analyzing documents: GPTe unavailable'
+        return f'## Summary ##\nReport for {patient_id}'
+
+    def render(self, analysis, pdf_path):
+        with open(pdf_path, 'w') as f:
+            f.write(analysis)
+
+
+def test_interrupted_batch_resumes_where_it_stopped(tmp_path, monkeypatch):
+    source_dir, output_dir = tmp_path / 'in', tmp_path / 'out'
+    for patient_id in ('p1', 'p2', 'p3'):
+        (source_dir / patient_id).mkdir(parents=True)
+        (source_dir / patient_id / 'labs.txt').write_text(f'Labs for {patient_id}')
+    output_dir.mkdir()
+    app = FakeApp(monkeypatch)
+    app.failing.add('p2')
+
+    def run():
+        app.analyzed.clear()
+        return BatchRunner(LocalSource(str(source_dir)), str(output_dir), 2, 2, 1).run()
+
+    assert run() == {'done': 2, 'failed': 1, 'skipped': 0}
+    assert sorted(app.analyzed) == ['p1', 'p2', 'p3']
+    assert sorted(os.listdir(output_dir)) == ['manifest.jsonl', 'p1.pdf', 'p3.pdf']
+
+    app.failing.clear()
+    assert run() == {'done': 1, 'failed': 0, 'skipped': 2}
+    assert app.analyzed == ['p2']
+
+    (source_dir / 'p3' / 'more.txt').write_text('New results')
+    assert run() == {'done': 1, 'failed': 0, 'skipped': 2}
+    assert app.analyzed == ['p3']
@@ -0,0 +1,109 @@
+import pytest
+
+import doc_cache
+from doc_cache import DocumentCache, file_digest, submission_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(doc_cache, 'time', clock)
+    return clock
+
+
+def test_file_digest(tmp_path, monkeypatch):
+    monkeypatch.setattr(doc_cache, 'CHUNK_SIZE', 7)  # Read in several chunks
+    path = tmp_path / 'scan.pdf'
+    path.write_bytes(b'hello world')
+    assert file_digest(str(path)) == 'b94d27b9934d3e08a52e52d7da7dabfac484efe37a5380ee9088f7ace2efcde9'
+
+
+def test_submission_key_ignores_order_and_duplicates():
+    assert submission_key(['a', 'b']) == submission_key(['b', 'a', 'a'])
+    assert submission_key(['a', 'b']) != submission_key(['a'])
+
+
+def test_get_tracks_hits_and_misses(clock):
+    cache = DocumentCache()
+    assert cache.get('k1') is None
+    cache.put('k1', 'c1', ['u1'], ['d1'], 10)
+    entry = cache.get('k1')
+    assert (entry.collection_id, entry.upload_ids, entry.digests) == ('c1', ['u1'], ['d1'])
+    assert cache.stats() == {'entries': 1, 'bytes': 10, 'hits': 1, 'misses': 1}
+
+
+def test_evicts_least_recently_used_over_the_entry_limit(clock):
+    cache = DocumentCache(max_entries=2)
+    cache.put('k1', 'c1', [], [], 1)
+    cache.put('k2', 'c2', [], [], 1)
+    cache.get('k1')
+    cache.put('k3', 'c3', [], [], 1)
+    assert cache.collection_ids() == {'c1', 'c3'}
+    assert cache.pop_evicted() == ['c2']
+    assert cache.pop_evicted() == []
+
+
+def test_evicts_over_the_byte_limit(clock):
+    cache = DocumentCache(max_bytes=100)
+    cache.put('k1', 'c1', [], [], 60)
+    cache.put('k2', 'c2', [], [], 30)
+    cache.put('k3', 'c3', [], [], 50)
+    assert cache.collection_ids() == {'c2', 'c3'}
+    assert cache.pop_evicted() == ['c1']
+    assert cache.stats()['bytes'] == 80
+
+    # An entry over the limit on its own is still kept
+    cache.put('k4', 'c4', [], [], 500)
+    assert cache.collection_ids() == {'c4'}
+
+
+def test_expires_after_the_ttl(clock):
+    cache = DocumentCache(ttl=60)
+    cache.put('k1', 'c1', [], [], 10)
+    cache.put('k2', 'c2', [], [], 10)
+    clock.now += 30
+    cache.put('k3', 'c3', [], [], 10)
+    clock.now += 31
+    assert cache.get('k1') is None  # Expired on access
+    assert cache.pop_evicted() == ['c1']
+
+    cache.expire()
+    assert cache.collection_ids() == {'c3'}
+    assert cache.pop_evicted() == ['c2']
+    assert cache.stats()['bytes'] == 10
+
+
+def test_put_keeps_the_collection_another_job_cached(clock):
+    cache = DocumentCache(ttl=60)
+    first = cache.put('k1', 'c1', ['u1'], ['d1'], 10)
+    assert cache.put('k1', 'c2', ['u2'], ['d1'], 10) is first
+    assert cache.collection_ids() == {'c1'}
+    assert cache.pop_evicted() == []
+    assert cache.stats()['bytes'] == 10
+
+
+def test_put_replaces_an_expired_entry(clock):
+    cache = DocumentCache(ttl=60)
+    cache.put('k1', 'c1', [], [], 10)
+    clock.now += 61
+    assert cache.put('k1', 'c2', [], [], 20).collection_id == 'c2'
+    assert cache.pop_evicted() == ['c1']
+    assert cache.stats()['bytes'] == 20
+
+
+def test_invalidate_does_not_queue_a_delete(clock):
+    cache = DocumentCache()
+    cache.put('k1', 'c1', [], [], 10)
+    cache.invalidate('k1')
+    cache.invalidate('k1')
+    assert cache.get('k1') is None
+    assert cache.pop_evicted() == []
+    assert cache.stats()['bytes'] == 0
@@ -0,0 +1,91 @@
+import json
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from h2ogpte import H2OGPTE
+
+import gpte_client
+from gpte_client import upload_file
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    """Stands in for PUT /rpc/fs, recording each multipart upload it receives"""
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        message = BytesParser(policy=HTTP).parsebytes(
+            f'Content-Type: {self.headers["Content-Type"]}\r\n\r\n'.encode() + body)
+        form = {part.get_param('name', header='content-disposition'): part for part in message.iter_parts()}
+        self.server.uploads.append({
+            'path': self.path,
+            'auth': self.headers['Authorization'],
+            'file_name': form['file'].get_filename(),
+            'content': form['file'].get_payload(decode=True),
+            'mtime': form['mtime'].get_payload(decode=True),
+            'uri': form['uri'].get_payload(decode=True),
+        })
+        status, reply = self.server.reply
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(reply).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), UploadHandler)
+    server.uploads = []
+    server.reply = (200, {'id': 'upload-1'})
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server, monkeypatch):
+    monkeypatch.setattr(H2OGPTE, '_check_version', lambda self, strict: None)
+    return H2OGPTE(address=f'http://127.0.0.1:{server.server_port}', api_key='key')
+
+
+@pytest.fixture
+def scan(tmp_path):
+    path = tmp_path / 'scan.pdf'
+    path.write_bytes(b'%PDF-1.4\r\n' + bytes(range(256)) * 64)
+    return path
+
+
+def test_streamed_upload_matches_sdk_upload(server, client, scan):
+    with open(scan, 'rb') as f:
+        sdk_id = client.upload('Blood "work".pdf', f)
+    streamed_id = upload_file(client, str(scan), 'Blood "work".pdf')
+
+    assert streamed_id == sdk_id == 'upload-1'
+    sdk, streamed = server.uploads
+    assert streamed['content'] == scan.read_bytes()
+    assert streamed == sdk
+
+
+def test_upload_error_in_response(server, client, scan):
+    server.reply = (200, {'id': '', 'error': 'quota exceeded'})
+    with pytest.raises(ValueError, match='quota exceeded'):
+        upload_file(client, str(scan))
+
+
+def test_upload_http_error(server, client, scan):
+    server.reply = (401, {'error': 'bad key'})
+    with pytest.raises(Exception, match='bad key'):
+        upload_file(client, str(scan))
+
+
+def test_unchecked_sdk_release_uses_sdk_upload(server, client, scan, monkeypatch):
+    monkeypatch.setattr(gpte_client, 'STREAMING_UPLOAD_SDK', ('0.',))
+    monkeypatch.setattr(gpte_client, '_upload_http', None)  # Fails if the streaming path is taken
+    assert upload_file(client, str(scan)) == 'upload-1'
+    assert server.uploads[0]['file_name'] == 'scan.pdf'
@@ -0,0 +1,173 @@
+import pytest
+
+from extract import LocalDocument
+from lab_values import build_lab_table, describe, lab_facts, lab_sections, match_analyte, parse_row
+
+
+def table_for(text):
+    return build_lab_table([LocalDocument('labs.txt', text)])
+
+
+def only_row(text):
+    rows = list(table_for(text).rows())
+    assert len(rows) == 1, rows
+    return rows[0]
+
+
+@pytest.mark.parametrize('name, analyte', [
+    ('Hemoglobin', 'hemoglobin'),
+    ('HGB', 'hemoglobin'),
+    ('Hemoglobin (Hb)', 'hemoglobin'),
+    ('Hemoglobin A1c', 'hba1c'),
+    ('HbA1c', 'hba1c'),
+    ('LDL Cholesterol', 'ldl'),
+    ('LDL-C', 'ldl'),
+    ('Glucose, Fasting', 'glucose'),
+    ('25-OH Vitamin D', 'vitamin_d'),
+    ('Vitamin D, 25-Hydroxy', 'vitamin_d'),
+    ('ALT (SGPT)', 'alt'),
+    ('K', 'potassium'),
+])
+def test_match_analyte_known_names(name, analyte):
+    assert match_analyte(name) == analyte
+
+
+@pytest.mark.parametrize('name', [
+    'Non-HDL Cholesterol',
+    'LDL/HDL Ratio',
+    'Cholesterol/HDL Ratio',
+    'Urine Creatinine',
+    'Creatinine (Urine)',
+    'Mean Corpuscular Hemoglobin',
+    'MCH',
+    'Free T4',
+    'Calcium, Ionized',
+    'Bilirubin, Direct',
+    'Glucose (Random)',
+    'Hemoglobin Electrophoresis',
+    'Potassium Chloride Supplement',
+])
+def test_match_analyte_rejects_other_tests(name):
+    assert match_analyte(name) is None
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('Hemoglobin 14.1 g/dL 13.5-17.5', ('Hemoglobin', '', 14.1, 'g/dL', 13.5, 17.5)),
+    ('LDL Cholesterol 162 mg/dL (<100)', ('LDL Cholesterol', '', 162.0, 'mg/dL', None, 100.0)),
+    ('HDL Cholesterol: 38 mg/dL (>40)', ('HDL Cholesterol', '', 38.0, 'mg/dL', 40.0, None)),
+    ('Sodium: 140mmol/L', ('Sodium', '', 140.0, 'mmol/L', None, None)),
+    ('CRP <0.5 mg/L', ('CRP', '<', 0.5, 'mg/L', None, None)),
+    ('Hemoglobin 18.0 H 13.5-17.5', ('Hemoglobin', '', 18.0, '', 13.5, 17.5)),
+    ('WBC 6.2 x10^9/L 4.0-11.0', ('WBC', '', 6.2, 'x10^9/L', 4.0, 11.0)),
+    ('Vitamin B12 350 pg/mL 200-900', ('Vitamin B12', '', 350.0, 'pg/mL', 200.0, 900.0)),
+    ('Vitamin D 25-OH 18 ng/mL 30-100', ('Vitamin D 25-OH', '', 18.0, 'ng/mL', 30.0, 100.0)),
+    ('25-OH Vitamin D 18 ng/mL', ('25-OH Vitamin D', '', 18.0, 'ng/mL', None, None)),
+    ('25(OH) Vitamin D 18 ng/mL', ('25(OH) Vitamin D', '', 18.0, 'ng/mL', None, None)),
+    ('Free T3 3.1 pg/mL 2.0-4.4', ('Free T3', '', 3.1, 'pg/mL', 2.0, 4.4)),
+])
+def test_parse_row(text, expected):
+    assert parse_row(text) == expected
+
+
+@pytest.mark.parametrize('text', ['Page 2 of 3', 'Collected: 12/03/2024 08:15', '1234 Main Street'])
+def test_parse_row_ignores_non_results(text):
+    row = parse_row(text)
+    assert row is None or match_analyte(row[0]) is None
+
+
+def test_a1c_is_not_hemoglobin():
+    row = only_row('Hemoglobin A1c 6.5 % 4.0-5.6')
+    assert (row['analyte'], row['name'], row['flag']) == ('hba1c', 'HbA1c', 'high')
+
+
+@pytest.mark.parametrize('text', [
+    'Non-HDL Cholesterol 190 mg/dL',
+    'LDL/HDL Ratio 3.2',
+    'Urine Creatinine 120 mg/dL',
+    'Mean Corpuscular Hemoglobin 29 pg',
+    'Ionized Calcium 1.2 mmol/L',
+])
+def test_qualified_tests_get_no_standard_range(text):
+    assert len(table_for(text)) == 0
+
+
+@pytest.mark.parametrize('text', [
+    'Urine Creatinine 120 mg/dL 20-320',
+    'Age 45 (18-60)',
+    'Sample ID 4471 (1000-9999)',
+    'MCH 29 pg 27-33',
+])
+def test_unknown_names_are_dropped_even_with_a_printed_range(text):
+    assert len(table_for(text)) == 0
+
+
+@pytest.mark.parametrize('text', ['Vitamin D 25-OH 18 ng/mL', '25-OH Vitamin D 18', 'Vitamin D 25 OH 18 ng/mL'])
+def test_vitamin_d_value_is_not_the_25_of_25_oh(text):
+    row = only_row(text)
+    assert (row['analyte'], row['value'], row['flag']) == ('vitamin_d', 18.0, 'low')
+
+
+def test_units_are_converted_before_flagging():
+    row = only_row('Glucose, Fasting 5.9 mmol/L')
+    assert row['unit'] == 'mg/dL'
+    assert row['value'] == pytest.approx(106.3, abs=0.1)
+    assert row['flag'] == 'high'
+
+
+def test_unknown_unit_gets_no_standard_range():
+    assert len(table_for('Hemoglobin 9.1 mmol/L')) == 0
+
+
+def test_lis_report():
+    report = '\n'.join([
+        'COMPLETE BLOOD COUNT',
+        'Test | Result | Unit | Reference',
+        'Hemoglobin | 11.2 | g/dL | 13.5-17.5',
+        'Hematocrit | 41 | % | 40-52',
+        'MCH | 29 | pg | 27-33',
+        'Mean Corpuscular Hemoglobin Concentration | 33 | g/dL | 32-36',
+        'Platelet Count | 250 | 10^3/uL | 150-400',
+        'LIPID PANEL',
+        'Cholesterol, Total 212 mg/dL <200',
+        'HDL Cholesterol 38 mg/dL >40',
+        'Non-HDL Cholesterol 174 mg/dL <130',
+        'Chol/HDL Ratio 5.6',
+        'Hemoglobin A1c 5.4 % 4.0-5.6',
+    ])
+    rows = {row['name']: row for row in table_for(report).rows()}
+    assert rows['Hemoglobin']['flag'] == 'low'
+    assert rows['Hematocrit']['flag'] == 'normal'
+    assert rows['Platelets']['flag'] == 'normal'
+    assert rows['Total cholesterol']['flag'] == 'high'
+    assert rows['HDL cholesterol']['flag'] == 'low'
+    assert rows['HbA1c']['flag'] == 'normal'
+    assert set(rows) == {'Hemoglobin', 'Hematocrit', 'Platelets', 'Total cholesterol', 'HDL cholesterol', 'HbA1c'}
+    assert len([row for row in rows.values() if row['analyte'] == 'hemoglobin']) == 1
+
+
+def test_rows_are_described_as_printed():
+    row = only_row('Creatinine 97 umol/L 62-106')
+    assert row['value'] == pytest.approx(1.097, abs=0.001)  # Compared in mg/dL
+    assert describe(row) == '**Creatinine** 97 umol/L (report reference 62-106)'
+
+
+def test_converted_value_is_shown_beside_the_printed_one():
+    row = only_row('Creatinine 150 umol/L')
+    assert describe(row) == '**Creatinine** 150 umol/L (1.697 mg/dL; standard adult range 0.6-1.3 mg/dL)'
+    assert row['flag'] == 'high'
+
+
+def test_normal_against_the_standard_table_is_not_a_fact():
+    table = table_for('Hemoglobin 13.0 g/dL\nHemoglobin 11.0 g/dL\nSodium 140 mmol/L 135-145')
+    facts = lab_facts(table)
+    assert '11 g/dL' in facts and 'LOW' in facts
+    assert '13 g/dL' not in facts
+    assert '**Sodium** 140 mmol/L (report reference 135-145): NORMAL' in facts
+    assert 'limits differ by sex' in lab_sections(table)
+    assert lab_facts(table_for('Hemoglobin 13.0 g/dL')) == ''
+
+
+def test_lab_facts_lists_flags():
+    facts = lab_facts(table_for('LDL Cholesterol 162 mg/dL (<100)'))
+    assert '**LDL cholesterol** 162 mg/dL (report reference < 100): HIGH [labs.txt]' in facts
+    assert lab_facts(table_for('nothing to see here')) == ''
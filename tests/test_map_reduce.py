@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+from map_reduce import METADATA_KEY, DocumentPart, collection_parts, extract_notes
+
+
+class Session:
+    def __init__(self, client):
+        self.client = client
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def query(self, message, metadata_filter=None, **kwargs):
+        self.client.filters.append(metadata_filter)
+        return SimpleNamespace(content='notes')
+
+
+class Client:
+    """Just enough of the SDK for one collection document, with its overwrite semantics"""
+
+    def __init__(self, metadata):
+        self.document = SimpleNamespace(id='doc-1', name='labs.pdf', page_count=2, metadata_dict=metadata)
+        self.updates = []
+        self.filters = []
+
+    def list_documents_in_collection(self, collection_id, offset, limit):
+        return [self.document][offset:offset + limit]
+
+    def update_document_metadata(self, document_id, document_metadata):
+        self.updates.append(document_metadata)
+        self.document.metadata_dict = dict(document_metadata)
+
+    def create_chat_session(self, collection_id):
+        return 'session-1'
+
+    def connect(self, chat_session_id):
+        return Session(self)
+
+    def delete_chat_sessions(self, chat_session_ids):
+        pass
+
+
+def test_extract_notes_keeps_existing_metadata():
+    client = Client({'source': 'lis', 'patient': 'p1'})
+    part, = collection_parts(client, 'collection-1')
+    assert extract_notes(client, part, 'collection-1') == 'notes'
+    assert client.document.metadata_dict == {'source': 'lis', 'patient': 'p1', METADATA_KEY: 'doc-1'}
+    assert client.filters == [{METADATA_KEY: 'doc-1'}]
+
+
+def test_extract_notes_skips_the_write_when_already_tagged():
+    client = Client({'source': 'lis', METADATA_KEY: 'doc-1'})
+    part, = collection_parts(client, 'collection-1')
+    extract_notes(client, part, 'collection-1')
+    assert client.updates == []
+
+
+def test_local_text_needs_no_collection():
+    client = SimpleNamespace(answer_question=lambda prompt, text_context_list, llm_args: SimpleNamespace(
+        content=text_context_list[0].upper()))
+    assert extract_notes(client, DocumentPart('a.txt', text='hb 14')) == 'HB 14'
@@ -0,0 +1,42 @@
+import pytest
+from reportlab import rl_config
+
+from report_pdf import ReportRenderer
+
+REPORT = """## Summary ##
+Your **blood count** is within the range printed on the report.
+
+## Lipids ##
+**LDL Cholesterol** 162 mg/dL (report reference < 100) - above the reference range.
+""" + "A long line that wraps over several lines of the page and, repeated, over pages. " * 400 + """
+
+## Next Steps ##
+Discuss the **LDL** result & diet with your doctor.
+"""
+
+
+@pytest.fixture(autouse=True)
+def invariant(monkeypatch):
+    # No creation date or random document id, so equal layouts give equal bytes
+    monkeypatch.setattr(rl_config, 'invariant', 1)
+
+
+def test_cached_render_matches_fresh_render():
+    renderer = ReportRenderer()
+    first = renderer.render(REPORT)
+    again = renderer.render(REPORT)
+    assert renderer.hits == renderer.misses == 3
+    assert again == first == ReportRenderer().render(REPORT)
+
+
+def test_edited_section_matches_fresh_render():
+    renderer = ReportRenderer()
+    renderer.render(REPORT)
+    edited = REPORT.replace('within the range', 'within the range, as last year,')
+    assert renderer.render(edited) == ReportRenderer().render(edited)
+    assert renderer.misses == 4
+
+
+def test_unclosed_bold_and_markup_characters():
+    pdf = ReportRenderer().render("**Glucose 5.4 mmol/L\nLDL < 100 & HDL > 40")
+    assert pdf.startswith(b'%PDF')
@@ -0,0 +1,67 @@
+import pytest
+
+from report_sections import changed_sections, heading_key, merge_sections, split_sections
+
+REPORT = """Preamble line.
+## Key Findings ##
+Hemoglobin is normal.
+
+## Lipids ##
+LDL is high.
+
+## Next Steps ##
+See your doctor."""
+
+
+def test_split_sections_round_trips():
+    sections = split_sections(REPORT)
+    assert [title for title, _ in sections] == [None, 'Key Findings', 'Lipids', 'Next Steps']
+    assert ''.join(chunk for _, chunk in sections) == REPORT
+    assert split_sections('') == []
+
+
+@pytest.mark.parametrize('title, key', [
+    ('Key Findings', 'key findings'),
+    ('  key   FINDINGS ', 'key findings'),
+    (None, None),
+])
+def test_heading_key(title, key):
+    assert heading_key(title) == key
+
+
+def test_merge_replaces_only_the_sections_in_the_update():
+    merged = merge_sections(REPORT, "## lipids ##\nLDL is high; HDL is low.\n")
+    # The blank line before the next heading was part of the replaced body
+    assert merged == REPORT.replace('LDL is high.\n\n', 'LDL is high; HDL is low.\n')
+    assert changed_sections(REPORT, merged) == ['Lipids']
+
+
+def test_merge_keeps_the_reports_heading_line():
+    merged = merge_sections(REPORT, "##  KEY FINDINGS  ##\nHemoglobin is low.")
+    assert '## Key Findings ##\nHemoglobin is low.\n## Lipids ##' in merged
+    assert 'KEY FINDINGS' not in merged
+
+
+def test_merge_appends_new_sections_on_their_own_line():
+    merged = merge_sections(REPORT, "## Thyroid ##\nTSH is normal.\n")
+    assert merged == REPORT + "\n## Thyroid ##\nTSH is normal.\n"
+    assert changed_sections(REPORT, merged) == ['Thyroid']
+
+
+@pytest.mark.parametrize('update', [
+    '',
+    'Text before any heading is ignored.',
+    '## Lipids ##\n   \n',
+])
+def test_merge_ignores_empty_updates(update):
+    assert merge_sections(REPORT, update) == REPORT
+
+
+def test_merge_into_an_empty_report():
+    assert merge_sections('', "## Lipids ##\nLDL is high.") == "## Lipids ##\nLDL is high.\n"
+
+
+def test_changed_sections_ignores_trailing_whitespace():
+    assert changed_sections(REPORT, REPORT + '\n\n') == []
+    edited = REPORT.replace('Preamble line.', 'New preamble.').replace('See your doctor.', 'Book a follow-up.')
+    assert changed_sections(REPORT, edited) == [None, 'Next Steps']
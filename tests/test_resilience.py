@@ -0,0 +1,265 @@
+import threading
+
+import pytest
+
+import resilience
+from resilience import (CircuitBreaker, GPTeBusy, GPTeGuard, GPTeUnavailable, StageLimit, TokenBucket, is_transient,
+                        parse_limits)
+
+
+class Clock:
+    """Stands in for the time module; sleeping moves the clock instead of waiting"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience, 'time', clock)
+    return clock
+
+
+class Timeout(Exception):
+    pass
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f'HTTP {status_code}')
+        self.status_code = status_code
+
+
+class Flaky:
+    """Fails with each of ``errors`` in turn, then succeeds"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+@pytest.mark.parametrize('error, transient', [
+    (Timeout(), True),
+    (ConnectionError(), True),
+    (HTTPError(429), True),
+    (HTTPError(503), True),
+    (HTTPError(400), False),
+    (HTTPError(404), False),
+    (ValueError('bad collection'), False),
+    (GPTeUnavailable('circuit open', 5.0), False),
+    (GPTeBusy('rate limit', 1.0), False),
+])
+def test_is_transient(error, transient):
+    assert is_transient(error) is transient
+
+
+def test_token_bucket_allows_a_burst_then_the_rate(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.acquire(timeout=0) for _ in range(4)] == [True, True, True, False]
+    clock.now += 1.0
+    assert [bucket.acquire(timeout=0) for _ in range(3)] == [True, True, False]
+    clock.now += 60.0
+    assert [bucket.acquire(timeout=0) for _ in range(4)] == [True, True, True, False]
+
+
+def test_token_bucket_waits_within_the_timeout(clock):
+    bucket = TokenBucket(rate=4, burst=1)
+    assert bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0.1)
+    assert clock.slept == []
+    assert bucket.acquire(timeout=1.0)
+    assert clock.slept == [0.25]
+
+
+def test_stage_limit_caps_calls_in_flight(clock):
+    limit = StageLimit(max_in_flight=1, rate=100, burst=5)
+    with limit.admit('ingest', timeout=0):
+        assert limit.in_flight == 1
+        with pytest.raises(GPTeBusy, match='Too many GPTe ingest calls'):
+            with limit.admit('ingest', timeout=0):
+                pass
+    assert limit.in_flight == 0
+    with limit.admit('ingest', timeout=0):
+        pass
+
+
+def test_stage_limit_rate(clock):
+    limit = StageLimit(max_in_flight=5, rate=1, burst=1)
+    with limit.admit('upload', timeout=0):
+        pass
+    with pytest.raises(GPTeBusy, match='rate limit'):
+        with limit.admit('upload', timeout=0):
+            pass
+    assert limit.in_flight == 0
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30.0)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    breaker.before_call()
+    breaker.record_success()  # A success in between starts the count again
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+    clock.now += 10.0
+    assert breaker.retry_after() == 20.0
+    with pytest.raises(GPTeUnavailable) as raised:
+        breaker.before_call()
+    assert raised.value.retry_after == 20.0
+
+
+def test_breaker_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+    breaker.before_call()
+    breaker.record_failure()
+    clock.now += 30.0
+
+    breaker.before_call()
+    assert breaker.state == 'half_open'
+    with pytest.raises(GPTeUnavailable, match='trial call in progress'):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    breaker.before_call()
+
+
+def test_breaker_reopens_when_the_trial_fails(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30.0)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 30.0
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.retry_after() == 30.0
+
+
+def test_breaker_trial_ending_in_another_error_frees_the_trial(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+    breaker.record_failure()
+    clock.now += 30.0
+    breaker.before_call()
+    breaker.record_other()
+    assert breaker.state == 'half_open'
+    breaker.before_call()
+
+
+def test_guard_retries_transient_errors(clock):
+    guard = GPTeGuard({}, attempts=3, base_delay=0.5)
+    func = Flaky(Timeout(), HTTPError(503))
+    assert guard.call('collection', func, retry=True) == 'ok'
+    assert func.calls == 3
+    assert len(clock.slept) == 2
+    assert guard.breaker.state == 'closed'
+
+
+def test_guard_gives_up_after_its_attempts(clock):
+    guard = GPTeGuard({}, attempts=3)
+    func = Flaky(*[Timeout()] * 5)
+    with pytest.raises(Timeout):
+        guard.call('collection', func, retry=True)
+    assert func.calls == 3
+
+
+@pytest.mark.parametrize('retry, error, calls', [
+    (False, Timeout(), 1),  # Not idempotent
+    (True, ValueError('bad collection'), 1),  # Not transient
+])
+def test_guard_does_not_retry(clock, retry, error, calls):
+    guard = GPTeGuard({}, attempts=3)
+    func = Flaky(error)
+    with pytest.raises(type(error)):
+        guard.call('ingest', func, retry=retry)
+    assert func.calls == calls
+    assert clock.slept == []
+
+
+def test_guard_fails_fast_once_the_breaker_opens(clock):
+    guard = GPTeGuard({}, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30.0), attempts=5)
+    func = Flaky(*[Timeout()] * 5)
+    with pytest.raises(GPTeUnavailable):
+        guard.call('query', func, retry=True)
+    assert func.calls == 2
+    with pytest.raises(GPTeUnavailable):
+        guard.call('query', func, retry=True)
+    assert func.calls == 2
+
+
+def test_guard_busy_is_not_a_failure(clock):
+    guard = GPTeGuard({'ingest': StageLimit(max_in_flight=1, rate=100)},
+                      breaker=CircuitBreaker(failure_threshold=1), admission_timeout=0)
+    admitted, release = threading.Event(), threading.Event()
+
+    def hold():
+        admitted.set()
+        release.wait(5)
+
+    holder = threading.Thread(target=guard.call, args=('ingest', hold))
+    holder.start()
+    admitted.wait(5)
+    try:
+        assert guard.in_flight() == {'ingest': 1}
+        with pytest.raises(GPTeBusy):
+            guard.call('ingest', lambda: 'ok', retry=True)
+        assert guard.breaker.state == 'closed'
+    finally:
+        release.set()
+        holder.join()
+    assert guard.in_flight() == {'ingest': 0}
+
+
+class Client:
+    def __init__(self):
+        self.calls = []
+
+    def create_chat_session(self, collection_id):
+        self.calls.append('create_chat_session')
+        raise Timeout()
+
+    def get_meta(self):
+        self.calls.append('get_meta')
+        if self.calls.count('get_meta') < 2:
+            raise Timeout()
+        return {'version': '1.7.5'}
+
+    def session_id(self):
+        return 'not guarded'
+
+
+def test_guarded_client_follows_the_client_policy(clock):
+    client = Client()
+    guarded = GPTeGuard({}, attempts=3).wrap(client)
+    assert guarded.get_meta() == {'version': '1.7.5'}
+    with pytest.raises(Timeout):
+        guarded.create_chat_session(None)
+    assert client.calls == ['get_meta', 'get_meta', 'create_chat_session']
+    assert guarded.session_id() == 'not guarded'
+
+
+def test_parse_limits():
+    limits = parse_limits(' upload=16:20, ingest=4 ,')
+    assert sorted(limits) == ['ingest', 'upload']
+    assert (limits['upload'].max_in_flight, limits['upload']._bucket.rate) == (16, 20.0)
+    assert (limits['ingest'].max_in_flight, limits['ingest']._bucket.rate) == (4, 4.0)
@@ -0,0 +1,111 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from spool import SpoolQuotaError, UploadSpool
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return UploadSpool(str(tmp_path / 'spool'), max_client_bytes=100, max_client_files=3, max_total_bytes=250)
+
+
+def spooled(spool, client_id, size, name='scan.pdf'):
+    """Write a file of ``size`` bytes the way an upload handler does, and admit it"""
+    path = spool.new_path(client_id, name)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    spool.admit(client_id, path)
+    return path
+
+
+def test_files_are_counted_per_client(spool):
+    first = spooled(spool, 'alice', 40)
+    spooled(spool, 'alice', 60)
+    spooled(spool, 'bob', 10)
+    assert spool.usage() == {'bytes': 110, 'files': 3, 'clients': 2}
+    assert os.path.dirname(first) == os.path.join(spool.root, str(os.getpid()), 'alice')
+
+
+def test_client_byte_quota(spool):
+    spooled(spool, 'alice', 60)
+    with pytest.raises(SpoolQuotaError, match='Upload too large: at most 0 MB and 3 files'):
+        spooled(spool, 'alice', 41)
+    # The rejected file is gone and not counted; a smaller one still fits
+    assert len(os.listdir(os.path.join(spool.root, str(os.getpid()), 'alice'))) == 1
+    assert spool.usage()['bytes'] == 60
+    spooled(spool, 'alice', 40)
+
+
+def test_client_file_quota(spool):
+    for _ in range(3):
+        spooled(spool, 'alice', 1)
+    with pytest.raises(SpoolQuotaError, match='Too many files'):
+        spool.new_path('alice', 'scan.pdf')
+    spooled(spool, 'bob', 1)
+
+
+def test_client_file_quota_checked_again_on_admit(spool):
+    # Uploads running side by side all get a path before any of them is admitted
+    paths = [spool.new_path('alice', f'scan{i}.pdf') for i in range(4)]
+    for path in paths:
+        with open(path, 'wb') as f:
+            f.write(b'x')
+    for path in paths[:3]:
+        spool.admit('alice', path)
+    with pytest.raises(SpoolQuotaError):
+        spool.admit('alice', paths[3])
+    assert not os.path.exists(paths[3])
+    assert spool.usage()['files'] == 3
+
+
+def test_node_quota(spool):
+    spooled(spool, 'alice', 100)
+    spooled(spool, 'bob', 100)
+    with pytest.raises(SpoolQuotaError, match='out of upload space'):
+        spooled(spool, 'carol', 51)
+    assert (spool.usage()['bytes'], spool.usage()['files']) == (200, 2)
+
+
+def test_discard_frees_quota(spool):
+    kept = spooled(spool, 'alice', 60)
+    dropped = spooled(spool, 'alice', 40)
+    spool.discard('alice', [dropped, '/not/spooled'])
+    assert not os.path.exists(dropped) and os.path.exists(kept)
+    assert spool.usage()['bytes'] == 60
+    spooled(spool, 'alice', 40)
+
+
+def test_clear_removes_the_clients_files(spool):
+    path = spooled(spool, 'alice', 60)
+    other = spooled(spool, 'bob', 60)
+    spool.clear('alice')
+    assert not os.path.exists(os.path.dirname(path))
+    assert os.path.exists(other)
+    assert spool.usage() == {'bytes': 60, 'files': 1, 'clients': 1}
+    spool.clear('nobody')
+
+
+@pytest.mark.parametrize('client_id, file_name, expected', [
+    ('alice', '../../etc/passwd', 'passwd'),
+    ('alice', 'C:\\Users\\me\\scan.pdf', 'scan.pdf'),
+    ('alice', '..', 'file'),
+    ('../bob', 'scan.pdf', 'scan.pdf'),
+])
+def test_paths_stay_in_the_clients_area(spool, client_id, file_name, expected):
+    path = spool.new_path(client_id, file_name)
+    assert os.path.dirname(os.path.dirname(path)) == os.path.join(spool.root, str(os.getpid()))
+    assert os.path.basename(path).split('_', 1)[1] == expected
+
+
+def test_sweep_keeps_only_live_processes(spool):
+    dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+    dead.wait()
+    live = os.getppid()
+    for name in (str(dead.pid), str(live), str(os.getpid()), 'stray'):
+        os.makedirs(os.path.join(spool.root, name, 'alice'))
+
+    spool.sweep()
+    assert os.listdir(spool.root) == [str(live)]
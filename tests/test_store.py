@@ -0,0 +1,135 @@
+import itertools
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import store
+from store import SQLiteStore, open_store
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # A clock that always moves, so "newest first" never depends on timer resolution
+    monkeypatch.setattr(store, 'time', SimpleNamespace(time=itertools.count(1000).__next__))
+    db = SQLiteStore(str(tmp_path / 'store.db'))
+    yield db
+    db.close()
+
+
+def test_save_makes_the_analysis_current(db):
+    first = db.save_analysis('alice', 'Report 1', ['a.pdf'], ['/spool/a.pdf'], {'chat_session_id': 's1'}, 'key-a')
+    record = db.current('alice')
+    assert record['id'] == first
+    assert record['file_names'] == ['a.pdf']
+    assert record['file_paths'] == ['/spool/a.pdf']
+    assert record['resources'] == {'chat_session_id': 's1'}
+    assert record['draft'] is None
+
+    second = db.save_analysis('alice', 'Report 2', ['b.pdf'])
+    assert db.current('alice')['id'] == second
+    assert db.current('bob') is None
+
+
+def test_update_analysis_drops_the_draft(db):
+    analysis_id = db.save_analysis('alice', 'Report', ['a.pdf'])
+    db.save_draft(analysis_id, 'Edited report')
+    assert db.get(analysis_id)['draft'] == 'Edited report'
+
+    db.update_analysis(analysis_id, resources={'expired': True})
+    assert db.get(analysis_id)['draft'] == 'Edited report'
+    db.update_analysis(analysis_id, analysis='Regenerated report')
+    record = db.get(analysis_id)
+    assert (record['analysis'], record['draft'], record['resources']) == ('Regenerated report', None, {'expired': True})
+
+
+def test_add_files_appends_and_rekeys(db):
+    analysis_id = db.save_analysis('alice', 'Report', ['a.pdf'], ['/spool/a.pdf'], submission_key='key-a')
+    db.add_files(analysis_id, ['b.pdf'], ['/spool/b.pdf'], submission_key='key-ab')
+    record = db.get(analysis_id)
+    assert record['file_names'] == ['a.pdf', 'b.pdf']
+    assert record['file_paths'] == ['/spool/a.pdf', '/spool/b.pdf']
+    assert db.find_by_submission('key-a') is None
+    assert db.find_by_submission('key-ab')['id'] == analysis_id
+
+    db.add_files('missing', ['c.pdf'])  # Nothing to add to
+
+
+def test_find_by_submission_returns_the_latest(db):
+    db.save_analysis('alice', 'Old', ['a.pdf'], submission_key='key-a')
+    newest = db.save_analysis('bob', 'New', ['a.pdf'], submission_key='key-a', patient_id='p1')
+    assert db.find_by_submission('key-a')['id'] == newest
+    assert db.find_by_submission('key-b') is None
+
+
+def test_find_by_patient_is_scoped_to_the_owner(db):
+    older = db.save_analysis('alice', 'Report 1', ['a.pdf'], patient_id='p1')
+    newer = db.save_analysis('alice', 'Report 2', ['b.pdf'], patient_id='p1')
+    db.save_analysis('alice', 'Report 3', ['c.pdf'], patient_id='p2')
+    db.save_analysis('bob', 'Report 4', ['d.pdf'], patient_id='p1')
+
+    assert [r['id'] for r in db.find_by_patient('alice', 'p1')] == [newer, older]
+    assert [r['id'] for r in db.find_by_patient('alice', 'p1', limit=1)] == [newer]
+    assert [r['analysis'] for r in db.find_by_patient('bob', 'p1')] == ['Report 4']
+    assert db.find_by_patient('carol', 'p1') == []
+
+
+def test_set_patient_files_an_analysis(db):
+    analysis_id = db.save_analysis('alice', 'Report', ['a.pdf'])
+    assert db.find_by_patient('alice', 'p1') == []
+    db.set_patient(analysis_id, 'p1')
+    assert [r['id'] for r in db.find_by_patient('alice', 'p1')] == [analysis_id]
+
+
+def test_set_and_clear_current(db):
+    first = db.save_analysis('alice', 'Report 1', ['a.pdf'])
+    db.save_analysis('alice', 'Report 2', ['b.pdf'])
+    db.set_current('alice', first)
+    assert db.current('alice')['id'] == first
+    db.clear_current('alice')
+    assert db.current('alice') is None
+    assert db.get(first)['analysis'] == 'Report 1'
+
+
+def test_failed_transaction_rolls_back(db):
+    analysis_id = db.save_analysis('alice', 'Report', ['a.pdf'])
+    with pytest.raises(RuntimeError):
+        with db._transaction() as connection:
+            connection.execute('UPDATE analyses SET analysis = ? WHERE id = ?', ('Lost', analysis_id))
+            raise RuntimeError('interrupted')
+    assert db.get(analysis_id)['analysis'] == 'Report'
+
+
+def test_shared_between_threads_and_stores(db):
+    ids = []
+    threads = [threading.Thread(target=lambda i=i: ids.append(db.save_analysis(f'owner{i}', 'Report', ['a.pdf'])))
+               for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Another worker process opens the same file
+    other = SQLiteStore(db.path)
+    try:
+        assert sorted(other.current(f'owner{i}')['id'] for i in range(8)) == sorted(ids)
+    finally:
+        other.close()
+
+
+@pytest.mark.parametrize('url, path', [
+    ('{tmp}/bare.db', '{tmp}/bare.db'),
+    ('sqlite:///{tmp}/absolute.db', '{tmp}/absolute.db'),
+])
+def test_open_store(tmp_path, url, path):
+    db = open_store(url.format(tmp=tmp_path))
+    try:
+        assert isinstance(db, SQLiteStore)
+        assert db.path == path.format(tmp=tmp_path)
+    finally:
+        db.close()
+
+
+def test_open_store_unknown_backend():
+    with pytest.raises(ValueError, match="Unsupported analysis store 'redis'"):
+        open_store('redis://localhost/0')